@@ -0,0 +1,428 @@
+"""
+天気予報処理のベンチマーク
+
+samples/*.json と、地域数・日数を増やした合成データを使って、
+データ抽出（get_weather_data / get_rain_data / get_temperature_data）、
+Discord用メッセージの作成、観測データHTMLの解析の速度とメモリ使用量を測定する。
+
+結果はJSONで保存でき、保存済みの基準値から閾値を超えて遅く（または大きく）なった場合は
+終了コード1で終了する。
+
+--import-timeを指定すると、python -X importtimeで weather_forecast.py --help の起動時の
+モジュール読み込み時間を測定し、上限を超えた場合や重いモジュールを読み込んだ場合に
+終了コード1で終了する。
+"""
+
+import argparse
+import contextlib
+import copy
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import forecast_json
+import weather_forecast
+from forecast_index import ParsedForecast
+from observation_parser import parse_observation_stream
+
+# サンプルデータの場所
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+# 基準値の保存先（測定した環境ごとの値のため、リポジトリには含めない）
+DEFAULT_BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "benchmark_baseline.json")
+
+# 基準値からの悪化を許容する割合（0.2 = 20%）
+DEFAULT_THRESHOLD = 0.2
+
+# 1つのケースを測定する時間の目安（秒）
+DEFAULT_MIN_TIME = 0.5
+
+# 起動時のモジュール読み込み時間の上限（ミリ秒、Python自体の起動で読み込まれる分は除く）
+DEFAULT_IMPORT_BUDGET_MS = 30.0
+
+# 使用方法の表示では読み込まないモジュール（使用する処理の中でのみ読み込む）
+LAZY_MODULES = (
+    "requests", "urllib3", "charset_normalizer", "chardet", "dotenv",
+    "json", "sqlite3", "concurrent.futures", "pyarrow",
+)
+
+# 起動時間を測定するコマンド
+IMPORT_TIME_COMMAND = (os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather_forecast.py"), "--help")
+
+def make_synthetic_forecast(base_forecast, n_areas, n_days):
+    """
+    サンプルの天気予報データから、地域数・日数を増やした合成データを作成する。
+
+    短期予報の各timeSeriesの地域をn_areas件に複製し、timeDefinesをn_days日分に延長する。
+
+    Args:
+        base_forecast (list): 元にする天気予報データ
+        n_areas (int): 地域数
+        n_days (int): 日数
+
+    Returns:
+        list: 合成した天気予報データ
+    """
+    forecast = copy.deepcopy(base_forecast)
+    for time_series in forecast[0]["timeSeries"]:
+        time_defines = [datetime.fromisoformat(t) for t in time_series["timeDefines"]]
+        first_day = time_defines[0].date()
+        # 1日分のtimeDefinesの時刻パターンを日数分繰り返す
+        day_pattern = [t - timedelta(days=(t.date() - first_day).days) for t in time_defines
+                       if (t.date() - first_day).days <= 1]
+        day_pattern = sorted(set(day_pattern))
+        new_defines = [t + timedelta(days=day) for day in range(n_days) for t in day_pattern]
+        time_series["timeDefines"] = [t.isoformat() for t in new_defines]
+
+        base_areas = time_series["areas"]
+        new_areas = []
+        for i in range(n_areas):
+            area = copy.deepcopy(base_areas[i % len(base_areas)])
+            area["area"] = {"name": f"{area['area']['name']}{i}", "code": f"{900000 + i}"}
+            for field, values in list(area.items()):
+                if field == "area":
+                    continue
+                area[field] = [values[j % len(values)] for j in range(len(new_defines))]
+            new_areas.append(area)
+        time_series["areas"] = new_areas
+    return forecast
+
+def make_synthetic_observation_html(n_stations, target_index=None):
+    """
+    観測データHTMLと同じ形式の行を持つ合成HTMLを作成する。
+
+    Args:
+        n_stations (int): 地点数
+        target_index (int): "彦根"を置く位置（省略時は中央、先頭に近いほど地点を指定した解析は早く終わる）
+
+    Returns:
+        bytes: HTML
+    """
+    if target_index is None:
+        target_index = n_stations // 2
+    lines = ["<html><head><title>日ごとの値</title></head><body>", "<table>",
+             "<tr><th>都道府県</th><th>地点</th><th>気温</th></tr>"]
+    for i in range(n_stations):
+        # 地点名・都道府県名は数字を含まない（数字を含むセルは観測値として扱われる）
+        name = "彦根" if i == target_index else f"地点{chr(0x4E00 + i)}"
+        lines.append(
+            f'<tr class="mtx"><td class="nwtx">県{chr(0x4E00 + i % 47)}</td><td class="nwtx"><a href="#">{name}</a></td>'
+            f'<td class="data_0t">10{i % 10}.5]</td><td class="data_0t">12:{i % 60:02d}]</td>'
+            f'<td class="data_0t">3{i % 10}.1]</td><td class="data_0t">14:{i % 60:02d}]</td>'
+            f'<td class="data_0t">2{i % 10}.4]</td><td class="data_0t">04:{i % 60:02d}]</td></tr>'
+        )
+    lines.extend(["</table>", "</body></html>"])
+    return "\n".join(lines).encode("utf-8")
+
+def _chunks(data, chunk_size=16 * 1024):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def _target_date(forecast):
+    """
+    天気予報データの発表日の翌日（通常の実行での「明日」）を取得する。
+    """
+    report_datetime = datetime.fromisoformat(forecast[0]["reportDatetime"])
+    return report_datetime + timedelta(days=1)
+
+def _extraction_cases(name, forecast):
+    """
+    1つの天気予報データに対する抽出・フォーマットの測定ケースを作成する。
+    """
+    target_date = _target_date(forecast)
+    area_index = min(weather_forecast.TARGET_AREA_INDEX, len(forecast[0]["timeSeries"][0]["areas"]) - 1)
+    weather_series, rain_series, temperature_series = forecast[0]["timeSeries"][:3]
+
+    def format_message():
+        return weather_forecast.format_discord_message(
+            "北部", "彦根地方気象台", "2025年7月1日 17時発表", True, 34.0, 25.3,
+            "曇り時々晴れ", ["10", "20", "30", "20"], 31.0, 24.0, "-3.0℃", "-1.3℃", "201")
+
+    return {
+        f"{name}/get_weather_data": lambda: weather_forecast.get_weather_data(weather_series, target_date, area_index),
+        f"{name}/get_rain_data": lambda: weather_forecast.get_rain_data(rain_series, area_index, target_date),
+        f"{name}/get_temperature_data": lambda: weather_forecast.get_temperature_data(temperature_series, area_index, target_date),
+        f"{name}/extract_forecast_summary": lambda: weather_forecast.extract_forecast_summary(
+            ParsedForecast(forecast), target_date, area_index),
+        f"{name}/format_discord_message": format_message,
+    }
+
+def _decoding_cases(name, raw):
+    """
+    天気予報jsonの解析の測定ケースを作成する（標準のjson・高速なライブラリ）。
+    """
+    cases = {f"{name}/decode_json": lambda: json.loads(raw)}
+    if forecast_json.backend_name() != "json":
+        cases[f"{name}/decode_{forecast_json.backend_name()}"] = lambda: forecast_json.loads(raw)
+    return cases
+
+def build_cases(samples_dir=SAMPLES_DIR, synthetic_areas=1000, synthetic_days=7, synthetic_stations=1000):
+    """
+    すべての測定ケースを作成する。
+
+    Args:
+        samples_dir (str): サンプルデータの場所
+        synthetic_areas (int): 合成データの地域数
+        synthetic_days (int): 合成データの日数
+        synthetic_stations (int): 合成HTMLの地点数
+
+    Returns:
+        dict: ケース名 → 引数なしで呼び出す関数
+    """
+    cases = {}
+    sample_paths = sorted(glob.glob(os.path.join(samples_dir, "*.json")))
+    samples = {}
+    for path in sample_paths:
+        with open(path, "rb") as f:
+            raw = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        samples[name] = json.loads(raw)
+        cases.update(_decoding_cases(name, raw))
+    for name, forecast in samples.items():
+        cases.update(_extraction_cases(name, forecast))
+
+    if samples:
+        base_forecast = next(iter(samples.values()))
+        synthetic = make_synthetic_forecast(base_forecast, synthetic_areas, synthetic_days)
+        synthetic_name = f"synthetic{synthetic_areas}x{synthetic_days}"
+        cases.update(_decoding_cases(synthetic_name, json.dumps(synthetic, ensure_ascii=False).encode("utf-8")))
+        cases.update(_extraction_cases(synthetic_name, synthetic))
+
+    html = make_synthetic_observation_html(synthetic_stations)
+    cases[f"observation{synthetic_stations}/all_stations"] = lambda: parse_observation_stream(_chunks(html))
+    # 地点を指定した解析は、対象地点が中央にある場合と最後にある場合（途中で終われない）を測定する
+    cases[f"observation{synthetic_stations}/one_station_mid"] = (
+        lambda: parse_observation_stream(_chunks(html), stations=["彦根"]))
+    last_html = make_synthetic_observation_html(synthetic_stations, synthetic_stations - 1)
+    cases[f"observation{synthetic_stations}/one_station_last"] = (
+        lambda: parse_observation_stream(_chunks(last_html), stations=["彦根"]))
+    return cases
+
+def measure(func, min_time=DEFAULT_MIN_TIME, min_iterations=5):
+    """
+    関数を繰り返し実行して速度とメモリ使用量を測定する。
+
+    Args:
+        func (callable): 測定する関数
+        min_time (float): 測定時間の目安（秒）
+        min_iterations (int): 最低実行回数
+
+    Returns:
+        dict: ops_per_sec, p50_us, p99_us, peak_memory_bytes, iterations
+    """
+    # 1回目（インポートやキャッシュの作成を含む）は測定から除く
+    func()
+
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_iterations or time.perf_counter() - started < min_time:
+        start = time.perf_counter_ns()
+        func()
+        durations.append(time.perf_counter_ns() - start)
+    total_seconds = sum(durations) / 1e9
+
+    # メモリの測定は速度に影響するため、別に1回だけ実行する
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "ops_per_sec": len(durations) / total_seconds if total_seconds else float("inf"),
+        "p50_us": durations[len(durations) // 2] / 1e3,
+        "p99_us": durations[min(len(durations) - 1, int(len(durations) * 0.99))] / 1e3,
+        "peak_memory_bytes": peak_memory,
+        "iterations": len(durations),
+    }
+
+def run_benchmarks(cases, min_time=DEFAULT_MIN_TIME, pattern=None):
+    """
+    すべてのケースを測定する（抽出関数の進捗表示は出力しない）。
+
+    Args:
+        cases (dict): ケース名 → 関数
+        min_time (float): 1ケースあたりの測定時間の目安（秒）
+        pattern (str): ケース名にこの文字列を含むものだけを測定する
+
+    Returns:
+        dict: ケース名 → 測定結果
+    """
+    results = {}
+    for name, func in cases.items():
+        if pattern and pattern not in name:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = measure(func, min_time=min_time)
+    return results
+
+def compare_with_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    測定結果を基準値と比較し、悪化したケースを取得する。
+
+    ops/secが基準値の(1 - threshold)倍を下回った場合と、
+    最大メモリ使用量が基準値の(1 + threshold)倍を上回った場合を悪化とみなす。
+
+    Args:
+        results (dict): 測定結果
+        baseline (dict): 基準値
+        threshold (float): 許容する悪化の割合
+
+    Returns:
+        list: 悪化の内容を表す文字列のリスト
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: ops/sec {base['ops_per_sec']:.0f} → {result['ops_per_sec']:.0f}")
+        if result["peak_memory_bytes"] > base["peak_memory_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{name}: 最大メモリ {base['peak_memory_bytes']} → {result['peak_memory_bytes']} bytes")
+    return regressions
+
+def _imported_modules(args):
+    """
+    python -X importtime でコマンドを実行し、読み込まれたモジュールと読み込み時間を取得する。
+
+    Returns:
+        dict: モジュール名 → 読み込み時間（マイクロ秒、そのモジュール自体の分）
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules[fields[2].strip()] = int(fields[0])
+    return modules
+
+def measure_import_time(args=IMPORT_TIME_COMMAND, repeat=5):
+    """
+    コマンドの起動時のモジュール読み込み時間を測定する。
+
+    Python自体の起動で読み込まれるモジュールを除き、repeat回のうち最短の結果を返す。
+
+    Returns:
+        tuple: (合計時間（ミリ秒）, モジュール名 → 読み込み時間（マイクロ秒）)
+    """
+    startup_modules = set(_imported_modules(["-c", "pass"]))
+    best = None
+    for _ in range(repeat):
+        modules = {name: us for name, us in _imported_modules(args).items() if name not in startup_modules}
+        total_ms = sum(modules.values()) / 1e3
+        if best is None or total_ms < best[0]:
+            best = (total_ms, modules)
+    return best
+
+def check_import_time(budget_ms=DEFAULT_IMPORT_BUDGET_MS, args=IMPORT_TIME_COMMAND):
+    """
+    起動時のモジュール読み込み時間が上限以内で、重いモジュールを読み込んでいないか確認する。
+
+    Returns:
+        int: 終了コード（問題なければ0、あれば1）
+    """
+    total_ms, modules = measure_import_time(args)
+    print(f"⏱️  起動時のモジュール読み込み: {total_ms:.1f}ms（上限{budget_ms:.1f}ms）")
+    for name, us in sorted(modules.items(), key=lambda item: -item[1])[:10]:
+        print(f"   {name:<40} {us / 1e3:>8.2f}ms")
+
+    failures = []
+    loaded = sorted(name for name in modules
+                    if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES))
+    if loaded:
+        failures.append(f"使用方法の表示で読み込まれたモジュール: {', '.join(loaded)}")
+    if total_ms > budget_ms:
+        failures.append(f"読み込み時間が上限を超えました: {total_ms:.1f}ms > {budget_ms:.1f}ms")
+
+    if failures:
+        print("\n❌ 起動時間の確認に失敗しました:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("\n✅ 起動時間は上限以内です")
+    return 0
+
+def show_results(results, baseline=None):
+    """
+    測定結果を一覧表示する。
+    """
+    print(f"{'ケース':<48} {'ops/sec':>12} {'p50(µs)':>10} {'p99(µs)':>10} {'最大メモリ':>12} {'基準比':>8}")
+    for name, result in results.items():
+        ratio = ""
+        if baseline and name in baseline and baseline[name]["ops_per_sec"]:
+            ratio = f"{result['ops_per_sec'] / baseline[name]['ops_per_sec']:.2f}x"
+        print(f"{name:<48} {result['ops_per_sec']:>12.1f} {result['p50_us']:>10.1f} "
+              f"{result['p99_us']:>10.1f} {result['peak_memory_bytes']:>12} {ratio:>8}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="天気予報処理のベンチマーク")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="基準値のJSONファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="測定結果を基準値として保存する")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="基準値からの悪化を許容する割合（0.2 = 20%%）")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="1ケースあたりの測定時間（秒）")
+    parser.add_argument("--filter", help="ケース名にこの文字列を含むものだけを測定する")
+    parser.add_argument("--output", help="測定結果をJSONで保存するファイル")
+    parser.add_argument("--import-time", action="store_true",
+                        help="weather_forecast.py --help の起動時のモジュール読み込み時間を確認する")
+    parser.add_argument("--import-budget", type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help="起動時のモジュール読み込み時間の上限（ミリ秒）")
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        return check_import_time(args.import_budget)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(build_cases(), min_time=args.min_time, pattern=args.filter)
+    show_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        directory = os.path.dirname(args.baseline)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基準値を保存しました: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print("\n⚠️  基準値がないため比較していません（--save-baselineで保存できます）")
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ 基準値から{args.threshold:.0%}を超えて悪化しました:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+    print(f"\n✅ 基準値からの悪化はありません（閾値{args.threshold:.0%}）")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,410 @@
+"""
+Discord Webhookへの通知をまとめて送信する仕組み
+
+通知はWebhookごとのキューに入れ、Webhookごとのスレッドが送信する（複数のWebhookへは並行して送信）。
+短い間に届いた通知は埋め込み（1リクエストにつき最大10件）にまとめて1回で送信する。
+Discordのレート制限（X-RateLimit-*ヘッダー・429応答のRetry-After）はWebhookごとに管理し、
+制限に達した場合は解除まで待ってから送信する。
+"""
+
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from itertools import groupby
+
+import requests
+
+import instrumentation
+from http_session import get_session, no_retries
+
+# Discordの制限（1リクエストの埋め込み数・埋め込みの合計文字数・本文の文字数）
+DISCORD_EMBEDS_PER_REQUEST = 10
+DISCORD_EMBED_TOTAL_CHARS = 6000
+DISCORD_EMBED_TITLE_CHARS = 256
+DISCORD_EMBED_DESCRIPTION_CHARS = 4096
+DISCORD_CONTENT_CHARS = 2000
+
+# ボットの表示名（予報区ごとの表示名はoffice_usernameで作成し、予報区がわからない場合にこれを使う）
+DISCORD_USERNAME = "天気予報"
+
+# 通知をまとめるために待つ時間（秒）
+NOTIFY_COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', '0.5'))
+
+# 通知の送信完了を待つ時間の上限（秒、過ぎた場合は待たずに戻る。
+# 送信はデーモンスレッドで行うため、1回だけの実行では未送信の通知は終了とともに破棄される）
+NOTIFY_WAIT_SECONDS = float(os.getenv('NOTIFY_WAIT_SECONDS', '30'))
+
+# 1リクエストあたりの送信試行回数と、通信エラー・5xx応答時の待機時間の係数（秒）
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '5'))
+NOTIFY_BACKOFF_FACTOR = float(os.getenv('NOTIFY_BACKOFF_FACTOR', '0.5'))
+
+# Discord用のリンク表記 [文字](<URL>)（埋め込みでは<>を付けない）
+_SUPPRESSED_LINK_PATTERN = re.compile(r'\]\(<([^>]+)>\)')
+
+_STOP = object()
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+class RateLimitBucket:
+    """
+    1つのWebhookのレート制限の状態。
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait_time(self, now=None):
+        """
+        次のリクエストを送信できるまでの時間（秒）を返す。
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self.reset_at <= now:
+                return 0.0
+            if self.remaining is None or self.remaining > 0:
+                return 0.0
+            return self.reset_at - now
+
+    def update(self, headers, now=None):
+        """
+        応答のX-RateLimit-Remaining / X-RateLimit-Reset-Afterヘッダーで状態を更新する。
+        """
+        if now is None:
+            now = time.monotonic()
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        with self._lock:
+            try:
+                if remaining is not None:
+                    self.remaining = int(remaining)
+                if reset_after is not None:
+                    self.reset_at = now + float(reset_after)
+            except ValueError:
+                pass
+
+    def block_for(self, seconds, now=None):
+        """
+        429応答を受けたときなどに、指定時間は送信しないようにする。
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, now + seconds)
+
+class Delivery:
+    """
+    1件の通知の送信結果（すべてのWebhookへの送信が終わるまでwaitで待てる）。
+    """
+
+    def __init__(self, webhook_count):
+        self._remaining = webhook_count
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if webhook_count == 0:
+            self._done.set()
+
+    def _finish(self, success):
+        with self._lock:
+            if not success:
+                self._failures += 1
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._done.set()
+
+    @property
+    def done(self):
+        """
+        すべてのWebhookへの送信が終わったか（成功・失敗を問わない）。
+        """
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        送信の完了を待つ。
+
+        Returns:
+            bool: すべてのWebhookへの送信に成功した場合True（時間切れの場合False）
+        """
+        if not self._done.wait(timeout):
+            return False
+        return self._failures == 0
+
+def _retry_after_seconds(response):
+    """
+    429応答から待機時間（秒）を求める（Retry-Afterヘッダー、なければ本文のretry_after）。
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    try:
+        return float(response.json().get("retry_after", 1.0))
+    except (ValueError, AttributeError):
+        return 1.0
+
+def message_to_embed(message):
+    """
+    format_discord_messageで作成したメッセージを埋め込みに変換する。
+    先頭の見出し（## ...）をタイトル、残りを本文とする。
+
+    Args:
+        message (str): メッセージ
+
+    Returns:
+        dict: 埋め込み
+    """
+    lines = message.strip().split("\n")
+    embed = {}
+    if lines and lines[0].startswith("#"):
+        embed["title"] = lines.pop(0).lstrip("#").strip()[:DISCORD_EMBED_TITLE_CHARS]
+    description = _SUPPRESSED_LINK_PATTERN.sub(r'](\1)', "\n".join(lines).strip())
+    embed["description"] = description[:DISCORD_EMBED_DESCRIPTION_CHARS]
+    return embed
+
+def _embed_length(embed):
+    return len(embed.get("title", "")) + len(embed.get("description", ""))
+
+def office_username(office_name):
+    """
+    府県予報区の表示名からボットの表示名（例: "滋賀県の天気予報"）を作成する。
+
+    Args:
+        office_name (str): 府県予報区の表示名（Noneの場合はDISCORD_USERNAME）
+
+    Returns:
+        str: ボットの表示名
+    """
+    if not office_name:
+        return DISCORD_USERNAME
+    return f"{office_name}の天気予報"
+
+def build_payloads(messages, username=None):
+    """
+    メッセージをDiscord Webhookに送信するデータにまとめる。
+
+    1件だけの場合はこれまでどおり本文（content）として送信し、
+    複数の場合は埋め込みにして1リクエストあたり最大10件にまとめる。
+
+    Args:
+        messages (list): メッセージのリスト
+        username (str): ボットの表示名（省略時はDISCORD_USERNAME）
+
+    Returns:
+        list: (送信するデータ, まとめたメッセージ数) のリスト
+    """
+    if username is None:
+        username = DISCORD_USERNAME
+    if len(messages) == 1 and len(messages[0]) <= DISCORD_CONTENT_CHARS:
+        return [({"content": messages[0], "username": username}, 1)]
+
+    payloads = []
+    embeds = []
+    total_chars = 0
+    for message in messages:
+        embed = message_to_embed(message)
+        length = _embed_length(embed)
+        if embeds and (len(embeds) >= DISCORD_EMBEDS_PER_REQUEST
+                       or total_chars + length > DISCORD_EMBED_TOTAL_CHARS):
+            payloads.append(({"username": username, "embeds": embeds}, len(embeds)))
+            embeds = []
+            total_chars = 0
+        embeds.append(embed)
+        total_chars += length
+    if embeds:
+        payloads.append(({"username": username, "embeds": embeds}, len(embeds)))
+    return payloads
+
+class DiscordNotifier:
+    """
+    複数のDiscord Webhookへ、通知をまとめて並行に送信する。
+    """
+
+    def __init__(self, webhook_urls, username=None, session=None, coalesce_seconds=None):
+        """
+        Args:
+            webhook_urls (list): 送信先のWebhook URLのリスト
+            username (str): ボットの表示名（省略時はDISCORD_USERNAME）
+            session (requests.Session): 送信に使うセッション（省略時は共有セッションを使う）
+            coalesce_seconds (float): 通知をまとめるために待つ時間（省略時はNOTIFY_COALESCE_SECONDS）
+        """
+        self.webhook_urls = list(dict.fromkeys(webhook_urls))
+        self.username = username or DISCORD_USERNAME
+        self.session = session
+        self.coalesce_seconds = NOTIFY_COALESCE_SECONDS if coalesce_seconds is None else coalesce_seconds
+        self.buckets = {url: RateLimitBucket() for url in self.webhook_urls}
+        self._queues = {url: queue.Queue() for url in self.webhook_urls}
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for url in self.webhook_urls:
+                thread = threading.Thread(target=self._worker, args=(url,), daemon=True,
+                                          name="discord-notifier")
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self, message, webhook_urls=None, coalesce=True, username=None):
+        """
+        通知をキューに入れる（送信はバックグラウンドで行う）。
+
+        Args:
+            message (str): メッセージ
+            webhook_urls (list): 送信先（省略時はすべてのWebhook）
+            coalesce (bool): 続けて届く通知をcoalesce_secondsだけ待ってまとめるか
+                             （Falseの場合は、その時点でキューにある通知だけをまとめてすぐ送信する）
+            username (str): ボットの表示名（省略時はself.username、表示名の異なる通知は別のリクエストで送信する）
+
+        Returns:
+            Delivery: 送信結果
+        """
+        urls = self.webhook_urls if webhook_urls is None else [url for url in webhook_urls if url in self._queues]
+        delivery = Delivery(len(urls))
+        if urls:
+            self._start()
+        for url in urls:
+            self._queues[url].put((message, delivery, coalesce, username or self.username))
+        return delivery
+
+    def notify_many(self, messages, webhook_urls=None, usernames=None):
+        """
+        複数の通知をキューに入れる。
+
+        最後の通知を入れた時点でまとめ終わるため、通知を待つ時間は加わらない。
+
+        Args:
+            usernames (list): 通知ごとのボットの表示名（省略時はself.username）
+
+        Returns:
+            list: 通知ごとのDelivery
+        """
+        messages = list(messages)
+        usernames = list(usernames) if usernames is not None else [None] * len(messages)
+        return [self.notify(message, webhook_urls, coalesce=i < len(messages) - 1, username=username)
+                for i, (message, username) in enumerate(zip(messages, usernames))]
+
+    def close(self, timeout=None):
+        """
+        キューに残っている通知を送信し終えてからスレッドを終了する。
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for url in self.webhook_urls:
+            if threads:
+                self._queues[url].put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _collect(self, url, first):
+        """
+        最初の通知からcoalesce_seconds以内に届いた通知を、1リクエスト分までまとめて取り出す。
+
+        まとめない通知（coalesce=False）を取り出した後は待たず、キューにある通知だけを取り出す。
+        """
+        items = [first]
+        deadline = time.monotonic() + self.coalesce_seconds
+        while len(items) < DISCORD_EMBEDS_PER_REQUEST:
+            remaining = deadline - time.monotonic() if items[-1][2] else 0
+            try:
+                item = self._queues[url].get(timeout=max(remaining, 0)) if remaining > 0 \
+                    else self._queues[url].get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 終了の合図は、まとめた通知を送信した後に処理する
+                self._queues[url].put(_STOP)
+                break
+            items.append(item)
+        return items
+
+    def _worker(self, url):
+        while True:
+            first = self._queues[url].get()
+            if first is _STOP:
+                return
+            items = self._collect(url, first)
+            # 表示名ごとにリクエストを分ける（続けて同じ表示名の通知をまとめる）
+            for username, group in groupby(items, key=lambda item: item[3]):
+                group = list(group)
+                offset = 0
+                for payload, count in build_payloads([message for message, _, _, _ in group], username):
+                    success = self._send(url, payload)
+                    for _, delivery, _, _ in group[offset:offset + count]:
+                        delivery._finish(success)
+                    offset += count
+
+    def _send(self, url, payload):
+        """
+        1リクエストを送信する（レート制限・一時的なエラーの場合は待って再送する）。
+
+        Returns:
+            bool: 送信に成功した場合True
+        """
+        bucket = self.buckets[url]
+        session = self.session or get_session()
+        for attempt in range(NOTIFY_MAX_ATTEMPTS):
+            wait = bucket.wait_time()
+            if wait > 0:
+                time.sleep(wait)
+                instrumentation.observe("notify_rate_limit_wait", wait)
+            try:
+                # 429応答はRateLimitBucketで扱うため、共有セッションの再試行は使わない
+                with instrumentation.timer("notify_request"), no_retries():
+                    response = session.post(url, json=payload, timeout=10)
+            except requests.exceptions.RequestException as e:
+                print(f"❌ Discord通知送信エラー: {e}", file=sys.stderr)
+                instrumentation.increment("notify_retries", reason="network")
+                time.sleep(NOTIFY_BACKOFF_FACTOR * (2 ** attempt))
+                continue
+
+            bucket.update(response.headers)
+            if response.status_code == 429:
+                retry_after = _retry_after_seconds(response)
+                print(f"⏳ Discordのレート制限に達しました。{retry_after:.1f}秒後に再送します。")
+                instrumentation.increment("notify_retries", reason="rate_limit")
+                bucket.block_for(retry_after)
+                continue
+            if 200 <= response.status_code < 300:
+                return True
+            if response.status_code >= 500:
+                instrumentation.increment("notify_retries", reason="server_error")
+                time.sleep(NOTIFY_BACKOFF_FACTOR * (2 ** attempt))
+                continue
+
+            print(f"❌ Discord通知送信失敗: ステータスコード {response.status_code}", file=sys.stderr)
+            print(f"レスポンス: {response.text}", file=sys.stderr)
+            return False
+
+        print(f"❌ Discord通知送信失敗: {NOTIFY_MAX_ATTEMPTS}回試行しても送信できませんでした", file=sys.stderr)
+        return False
+
+def get_notifier(webhook_urls, username=None):
+    """
+    プロセス内で共有する通知の送信先を取得する（初回呼び出し時に作成）。
+
+    Args:
+        webhook_urls (list): 送信先のWebhook URLのリスト（初回のみ使用）
+        username (str): ボットの表示名（初回のみ使用）
+
+    Returns:
+        DiscordNotifier: 共有の送信先
+    """
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = DiscordNotifier(webhook_urls, username)
+    return _notifier
@@ -0,0 +1,500 @@
+"""
+天気予報の履歴アーカイブ（SQLite）
+
+取得した天気予報データ（全地域・全timeSeries・平年値）を発表時刻ごとに追記保存する。
+値は (府県予報区, 発表時刻, 区分, 項目) ごとに1行とし、ForecastMatrixの行列（地域 × 時刻）の
+arrayのバイト列をzlibで圧縮して格納する。地域・期間を指定した検索は、地域を含む府県予報区の
+対象時刻が重なる行列だけを読み、必要な行を取り出す。
+観測データHTMLから取得した地点ごとの観測値も (地点名, 日付) ごとに保存する。
+"""
+
+import math
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timezone, timedelta
+
+from forecast_columns import extract_forecast_columns, reliability_label
+from forecast_index import ParsedForecast
+from observation_parser import StationObservation
+
+# 日本標準時
+JST = timezone(timedelta(hours=9))
+
+# アーカイブを保存するかどうか（FORECAST_ARCHIVE=0で無効化）
+FORECAST_ARCHIVE_ENABLED = os.getenv('FORECAST_ARCHIVE', '1') != '0'
+
+# アーカイブの保存先
+FORECAST_ARCHIVE_PATH = os.getenv(
+    'FORECAST_ARCHIVE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive", "forecast.sqlite3"),
+)
+
+# 行列を圧縮するzlibの圧縮レベル
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', '9'))
+
+# 予報の区分
+BLOCK_SHORT_TERM = 0
+BLOCK_WEEKLY = 1
+
+# 検索結果の1行
+ArchivedValue = namedtuple(
+    "ArchivedValue",
+    ["office_code", "report_datetime", "block", "area_code", "target_time", "field", "value", "text"],
+)
+
+# 平年値の1行
+ArchivedAverage = namedtuple(
+    "ArchivedAverage",
+    ["office_code", "report_datetime", "kind", "area_code", "min", "max"],
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    office_code TEXT NOT NULL,
+    report_datetime INTEGER NOT NULL,
+    weekly_report_datetime INTEGER,
+    publishing_office TEXT,
+    archived_at INTEGER NOT NULL,
+    PRIMARY KEY (office_code, report_datetime)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS forecast_matrices (
+    office_code TEXT NOT NULL,
+    report_datetime INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    first_time INTEGER NOT NULL,
+    last_time INTEGER NOT NULL,
+    typecode TEXT NOT NULL,
+    area_codes BLOB NOT NULL,
+    target_times BLOB NOT NULL,
+    matrix_values BLOB NOT NULL,
+    PRIMARY KEY (office_code, report_datetime, block, field)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS forecast_matrices_by_time
+    ON forecast_matrices (office_code, last_time);
+
+CREATE TABLE IF NOT EXISTS area_offices (
+    area_code TEXT NOT NULL,
+    office_code TEXT NOT NULL,
+    PRIMARY KEY (area_code, office_code)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS areas (
+    area_code TEXT NOT NULL PRIMARY KEY,
+    area_name TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS observations (
+    station_name TEXT NOT NULL,
+    observed_date TEXT NOT NULL,
+    max_temp REAL,
+    max_time TEXT,
+    min_temp REAL,
+    min_time TEXT,
+    recorded_at INTEGER NOT NULL,
+    PRIMARY KEY (station_name, observed_date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS observations_by_date
+    ON observations (observed_date);
+
+CREATE TABLE IF NOT EXISTS observation_collections (
+    observed_date TEXT NOT NULL PRIMARY KEY,
+    collected_at INTEGER NOT NULL,
+    station_count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS averages (
+    office_code TEXT NOT NULL,
+    report_datetime INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    area_code TEXT NOT NULL,
+    min REAL,
+    max REAL,
+    PRIMARY KEY (area_code, kind, office_code, report_datetime)
+) WITHOUT ROWID;
+"""
+
+def _to_epoch(value):
+    """
+    datetime/ISO形式の文字列をエポック秒（整数）に変換する。
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=JST)
+    return int(value.timestamp())
+
+def _from_epoch(epoch):
+    return datetime.fromtimestamp(epoch, JST)
+
+def _to_db_value(value, typecode):
+    """
+    行列の値を検索結果の (value, text) に変換する（欠損値はNone）。
+    """
+    if typecode == 'b':
+        return None, reliability_label(value)
+    if typecode == 'h':
+        return (float(value) if value >= 0 else None), None
+    return (None if math.isnan(value) else value), None
+
+def _pack_array(values):
+    """
+    arrayをリトルエンディアンのバイト列にしてzlibで圧縮する。
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return zlib.compress(values.tobytes(), ARCHIVE_COMPRESSION_LEVEL)
+
+def _unpack_array(typecode, blob):
+    values = array(typecode)
+    values.frombytes(zlib.decompress(blob))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _pack_codes(codes):
+    return zlib.compress("\n".join(codes).encode("utf-8"), ARCHIVE_COMPRESSION_LEVEL)
+
+def _unpack_codes(blob):
+    return zlib.decompress(blob).decode("utf-8").split("\n")
+
+def _matrix_row(office_code, report_epoch, block, field, area_codes, epochs, typecode, values):
+    """
+    1つの行列をforecast_matricesの1行に変換する。
+    """
+    return (office_code, report_epoch, block, field,
+            min(epochs, default=0), max(epochs, default=0), typecode,
+            _pack_codes(area_codes), _pack_array(array('q', epochs)), _pack_array(values))
+
+class ForecastArchive:
+    """
+    天気予報の履歴を保存・検索するSQLiteのアーカイブ。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or FORECAST_ARCHIVE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def has_snapshot(self, office_code, report_datetime):
+        """
+        指定した発表時刻のデータが保存済みかを確認する。
+
+        Args:
+            office_code (str): 府県予報区コード
+            report_datetime (datetime | str): 発表時刻
+
+        Returns:
+            bool: 保存済みならTrue
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM snapshots WHERE office_code = ? AND report_datetime = ?",
+                (office_code, _to_epoch(report_datetime)),
+            ).fetchone()
+        return row is not None
+
+    def append(self, forecast_data, office_code):
+        """
+        天気予報データを追記保存する（同じ発表時刻のデータは保存しない）。
+
+        Args:
+            forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+            office_code (str): 府県予報区コード
+
+        Returns:
+            bool: 新しく保存した場合True、保存済みだった場合False
+        """
+        if not isinstance(forecast_data, ParsedForecast):
+            forecast_data = ParsedForecast(forecast_data)
+
+        report_epoch = _to_epoch(forecast_data.report_datetime)
+        weekly_report_epoch = None
+        if len(forecast_data.raw) > 1:
+            weekly_report_epoch = _to_epoch(forecast_data.raw[1]["reportDatetime"])
+
+        columns = extract_forecast_columns(forecast_data)
+
+        matrix_rows = []
+        for block, matrices in ((BLOCK_SHORT_TERM, columns["short_term"]), (BLOCK_WEEKLY, columns["weekly"])):
+            for field, matrix in matrices.items():
+                matrix_rows.append(_matrix_row(
+                    office_code, report_epoch, block, field, matrix.area_codes,
+                    [int(epoch) for epoch in matrix.epochs], matrix.typecode, matrix.values))
+
+        area_rows = {}
+        for matrices in (columns["short_term"], columns["weekly"]):
+            for matrix in matrices.values():
+                area_rows.update(zip(matrix.area_codes, matrix.area_names))
+
+        average_rows = []
+        for kind in ("temp", "precip"):
+            averages = columns[f"{kind}_average"]
+            if averages is None:
+                continue
+            for area_code, min_value, max_value in zip(averages["area_codes"], averages["min"], averages["max"]):
+                average_rows.append((office_code, report_epoch, kind, area_code,
+                                     None if math.isnan(min_value) else min_value,
+                                     None if math.isnan(max_value) else max_value))
+
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                (office_code, report_epoch, weekly_report_epoch,
+                 forecast_data.publishing_office, int(datetime.now(JST).timestamp())),
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO forecast_matrices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", matrix_rows)
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO area_offices VALUES (?, ?)",
+                [(area_code, office_code) for area_code in area_rows])
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO averages VALUES (?, ?, ?, ?, ?, ?)", average_rows)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO areas VALUES (?, ?)", area_rows.items())
+        return True
+
+    def append_observations(self, observed_date, observations, complete=False, recorded_at=None):
+        """
+        観測値を保存する（同じ地点・同じ日の値は新しい値で置き換える）。
+
+        Args:
+            observed_date (date): 観測日
+            observations (dict): 地点名 → StationObservation
+            complete (bool): 全地点の観測値か（Trueの場合は取得済みの日として記録する）
+            recorded_at (datetime): 取得時刻（省略時は現在時刻）
+
+        Returns:
+            int: 保存した地点数
+        """
+        recorded_at = _to_epoch(recorded_at or datetime.now(JST))
+        rows = [
+            (station_name, observed_date.isoformat(), observation.max_temp, observation.max_time,
+             observation.min_temp, observation.min_time, recorded_at)
+            for station_name, observation in observations.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            if complete:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO observation_collections VALUES (?, ?, ?)",
+                    (observed_date.isoformat(), recorded_at, len(rows)))
+        return len(rows)
+
+    def observation_collected_at(self, observed_date):
+        """
+        指定日の全地点の観測値を最後に取得した時刻を取得する。
+
+        Args:
+            observed_date (date): 観測日
+
+        Returns:
+            datetime: 取得時刻（取得していない場合はNone）
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT collected_at FROM observation_collections WHERE observed_date = ?",
+                (observed_date.isoformat(),),
+            ).fetchone()
+        return _from_epoch(row[0]) if row else None
+
+    def get_observations(self, observed_date, station_names=None):
+        """
+        指定日の保存済みの観測値をまとめて取得する。
+
+        Args:
+            observed_date (date): 観測日
+            station_names (iterable): 取得する地点名（省略時は全地点）
+
+        Returns:
+            dict: 地点名 → StationObservation
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT station_name, max_temp, max_time, min_temp, min_time FROM observations"
+                " WHERE observed_date = ?",
+                (observed_date.isoformat(),),
+            ).fetchall()
+        wanted = set(station_names) if station_names is not None else None
+        return {row[0]: StationObservation(*row[1:]) for row in rows if wanted is None or row[0] in wanted}
+
+    def get_observation(self, station_name, observed_date):
+        """
+        保存済みの観測値を取得する。
+
+        Args:
+            station_name (str): 地点名
+            observed_date (date): 観測日
+
+        Returns:
+            StationObservation: 観測値（保存されていない場合はNone）
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT max_temp, max_time, min_temp, min_time FROM observations"
+                " WHERE station_name = ? AND observed_date = ?",
+                (station_name, observed_date.isoformat()),
+            ).fetchone()
+        if row is None:
+            return None
+        return StationObservation(*row)
+
+    def area_name(self, area_code):
+        """
+        地域コードから地域名（観測地点名）を取得する。
+
+        Args:
+            area_code (str): 地域コード
+
+        Returns:
+            str: 地域名（不明な場合はNone）
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT area_name FROM areas WHERE area_code = ?", (area_code,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, area_code, start, end, fields=None, office_code=None):
+        """
+        地域・期間を指定して保存済みの予報値を取得する。
+
+        Args:
+            area_code (str): 地域コード（"250020"、観測地点の"60131"など）
+            start (datetime | str): 対象時刻の開始（この時刻を含む）
+            end (datetime | str): 対象時刻の終了（この時刻を含まない）
+            fields (iterable): 取得する項目名（省略時は全項目）
+            office_code (str): 府県予報区コードで絞り込む場合に指定
+
+        Returns:
+            list: ArchivedValueのリスト（対象時刻・項目・発表時刻の順）
+        """
+        start_epoch, end_epoch = _to_epoch(start), _to_epoch(end)
+        sql = ("SELECT office_code, report_datetime, block, field, typecode, area_codes, target_times, matrix_values"
+               " FROM forecast_matrices WHERE office_code = ? AND last_time >= ? AND first_time < ?")
+        params = [start_epoch, end_epoch]
+        if fields:
+            fields = list(fields)
+            sql += f" AND field IN ({', '.join('?' * len(fields))})"
+            params.extend(fields)
+
+        with self._lock:
+            offices = [row[0] for row in self._connection.execute(
+                "SELECT office_code FROM area_offices WHERE area_code = ?", (area_code,))]
+            if office_code is not None:
+                offices = [office for office in offices if office == office_code]
+            rows = []
+            for office in offices:
+                rows.extend(self._connection.execute(sql, [office] + params))
+
+        values = []
+        for office, report, block, field, typecode, area_blob, times_blob, values_blob in rows:
+            try:
+                area_index = _unpack_codes(area_blob).index(area_code)
+            except ValueError:
+                continue
+            target_times = _unpack_array('q', times_blob)
+            matrix_values = _unpack_array(typecode, values_blob)
+            n_times = len(target_times)
+            row = matrix_values[area_index * n_times:(area_index + 1) * n_times]
+            for target, matrix_value in zip(target_times, row):
+                if start_epoch <= target < end_epoch:
+                    value, text = _to_db_value(matrix_value, typecode)
+                    values.append((target, field, report, block, office, value, text))
+
+        values.sort(key=lambda item: item[:5])
+        return [
+            ArchivedValue(office, _from_epoch(report), block, area_code, _from_epoch(target), field, value, text)
+            for target, field, report, block, office, value, text in values
+        ]
+
+    def query_averages(self, area_code, start, end, kind=None):
+        """
+        地域・発表期間を指定して保存済みの平年値を取得する。
+
+        Args:
+            area_code (str): 観測地点のコード
+            start (datetime | str): 発表時刻の開始（この時刻を含む）
+            end (datetime | str): 発表時刻の終了（この時刻を含まない）
+            kind (str): "temp" または "precip"（省略時は両方）
+
+        Returns:
+            list: ArchivedAverageのリスト（発表時刻の順）
+        """
+        sql = ("SELECT office_code, report_datetime, kind, area_code, min, max FROM averages"
+               " WHERE area_code = ? AND report_datetime >= ? AND report_datetime < ?")
+        params = [area_code, _to_epoch(start), _to_epoch(end)]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY report_datetime, kind"
+
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [
+            ArchivedAverage(office, _from_epoch(report), row_kind, area, min_value, max_value)
+            for office, report, row_kind, area, min_value, max_value in rows
+        ]
+
+    def snapshots(self, office_code=None):
+        """
+        保存済みの発表の一覧を取得する。
+
+        Args:
+            office_code (str): 府県予報区コードで絞り込む場合に指定
+
+        Returns:
+            list: (府県予報区コード, 発表時刻) のリスト（発表時刻の順）
+        """
+        sql = "SELECT office_code, report_datetime FROM snapshots"
+        params = []
+        if office_code is not None:
+            sql += " WHERE office_code = ?"
+            params.append(office_code)
+        sql += " ORDER BY report_datetime, office_code"
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [(office, _from_epoch(report)) for office, report in rows]
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_forecast_archive():
+    """
+    プロセス内で共有するアーカイブを取得する（初回呼び出し時に作成）。
+
+    Returns:
+        ForecastArchive: 共有アーカイブ
+    """
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = ForecastArchive()
+    return _archive
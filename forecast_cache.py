@@ -0,0 +1,287 @@
+"""
+天気予報jsonのディスクキャッシュ（ETag/Last-Modifiedによる条件付きGET）
+
+気象庁の天気予報は5時・11時・17時（日本時間）に発表されるため、
+次回の発表時刻まではキャッシュを返し、通信も解析も行わない。
+発表時刻を過ぎた後は条件付きGETで更新を確認し、304応答なら保存済みの
+データをそのまま使う。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from forecast_json import loads_forecast
+from http_session import get_session
+
+# 日本標準時
+JST = timezone(timedelta(hours=9))
+
+# 気象庁の天気予報の定時発表時刻（日本時間）
+PUBLISH_HOURS = (5, 11, 17)
+
+# キャッシュを使用するかどうか（FORECAST_CACHE=0で無効化）
+FORECAST_CACHE_ENABLED = os.getenv('FORECAST_CACHE', '1') != '0'
+
+# キャッシュの保存先
+FORECAST_CACHE_DIR = os.getenv(
+    'FORECAST_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "forecast"),
+)
+
+# キャッシュ全体の容量上限（超えた場合は最も長く使われていないものから削除）
+FORECAST_CACHE_MAX_BYTES = int(os.getenv('FORECAST_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# 発表時刻を過ぎても更新が反映されていない場合の再確認間隔（秒）
+FORECAST_CACHE_RETRY_SECONDS = int(os.getenv('FORECAST_CACHE_RETRY_SECONDS', '60'))
+
+def latest_publish_time(now):
+    """
+    指定時刻以前で最も新しい定時発表時刻を取得する。
+
+    Args:
+        now (datetime): 基準時刻（タイムゾーン付き）
+
+    Returns:
+        datetime: 直近の発表時刻（日本時間）
+    """
+    now = now.astimezone(JST)
+    for hour in reversed(PUBLISH_HOURS):
+        publish_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if publish_time <= now:
+            return publish_time
+    yesterday = now - timedelta(days=1)
+    return yesterday.replace(hour=PUBLISH_HOURS[-1], minute=0, second=0, microsecond=0)
+
+def next_publish_time(now):
+    """
+    指定時刻より後の最初の定時発表時刻を取得する。
+
+    Args:
+        now (datetime): 基準時刻（タイムゾーン付き）
+
+    Returns:
+        datetime: 次回の発表時刻（日本時間）
+    """
+    now = now.astimezone(JST)
+    for hour in PUBLISH_HOURS:
+        publish_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if publish_time > now:
+            return publish_time
+    tomorrow = now + timedelta(days=1)
+    return tomorrow.replace(hour=PUBLISH_HOURS[0], minute=0, second=0, microsecond=0)
+
+def compute_expiry(report_datetime_str, now):
+    """
+    キャッシュの有効期限を発表時刻から計算する。
+
+    直近の定時発表分が取得済みなら次回の発表時刻まで有効とし、
+    まだ反映されていなければ短い間隔で再確認する。
+
+    Args:
+        report_datetime_str (str): キャッシュしたデータのreportDatetime
+        now (datetime): 現在時刻（タイムゾーン付き）
+
+    Returns:
+        datetime: 有効期限
+    """
+    report_datetime = datetime.fromisoformat(report_datetime_str)
+    if report_datetime >= latest_publish_time(now):
+        return next_publish_time(now)
+    return now + timedelta(seconds=FORECAST_CACHE_RETRY_SECONDS)
+
+class ForecastCache:
+    """
+    天気予報jsonを予報区ごとにディスクへ保存するキャッシュ。
+
+    本文（<key>.json）と、ETag・Last-Modified・reportDatetime・有効期限を
+    記録したメタデータ（<key>.meta.json）を組で保存する。解析済みのデータは
+    プロセス内にも保持し、同じ版を二度解析しない。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or FORECAST_CACHE_DIR
+        self.max_bytes = FORECAST_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.meta.json")
+
+    def _write_atomic(self, path, content):
+        # 複数のプロセス（リプレイのワーカー・デーモン・cron）が同じディレクトリに書き込むため、
+        # 一時ファイルの名前にはプロセスIDとスレッドIDを含める
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _load_meta(self, key):
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._body_path(key)):
+            return None
+        return meta
+
+    def _save_meta(self, key, meta):
+        self._write_atomic(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+
+    def _load_body(self, key, meta):
+        # 同じ版を解析済みであれば、それを返す
+        with self._lock:
+            cached = self._memory.get(key)
+        if cached is not None and cached[0] == meta["fetched_at"]:
+            return cached[1]
+
+        with open(self._body_path(key), "rb") as f:
+            data = loads_forecast(f.read())
+        with self._lock:
+            self._memory[key] = (meta["fetched_at"], data)
+        return data
+
+    def _touch(self, key):
+        # 最終利用時刻を更新（容量超過時の削除順に使う）
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+
+    def _evict(self, keep_key):
+        """
+        容量上限を超えている場合、最も長く使われていないキャッシュから削除する。
+        """
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".meta.json"):
+                continue
+            key = name[:-len(".meta.json")]
+            try:
+                size = os.path.getsize(self._meta_path(key)) + os.path.getsize(self._body_path(key))
+                last_used = os.path.getmtime(self._meta_path(key))
+            except OSError:
+                continue
+            entries.append((last_used, key, size))
+            total_bytes += size
+
+        entries.sort()
+        for _, key, size in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if key == keep_key:
+                continue
+            for path in (self._meta_path(key), self._body_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._memory.pop(key, None)
+            total_bytes -= size
+
+    def load_stale(self, key):
+        """
+        有効期限にかかわらず、保存済みの天気予報jsonを取得する（通信しない）。
+
+        Args:
+            key (str): キャッシュのキー（府県予報区コード）
+
+        Returns:
+            tuple: (天気予報データ, 取得時刻（304応答で確認した場合はその時刻）)、保存されていない・読み込めない場合はNone
+        """
+        meta = self._load_meta(key)
+        if meta is None:
+            return None
+        try:
+            data = self._load_body(key, meta)
+        except (OSError, ValueError):
+            return None
+        # 304応答で更新がないことを確認した時刻があれば、その時点の値として扱う
+        return data, datetime.fromisoformat(meta.get("validated_at") or meta["fetched_at"])
+
+    def fetch(self, url, key, timeout=10, now=None):
+        """
+        キャッシュを考慮して天気予報jsonを取得する。
+
+        Args:
+            url (str): 取得するURL
+            key (str): キャッシュのキー（府県予報区コード）
+            timeout (float): タイムアウト秒数
+            now (datetime): 現在時刻（省略時は実際の時刻）
+
+        Returns:
+            tuple: (天気予報データ, 状態) 状態は "fresh"（有効期限内）,
+                   "not_modified"（304応答）, "updated"（新しく取得）のいずれか
+
+        Raises:
+            requests.exceptions.RequestException: HTTPリクエストエラー
+            json.JSONDecodeError: 応答がjsonとして解析できない場合
+        """
+        if now is None:
+            now = datetime.now(JST)
+
+        meta = self._load_meta(key)
+        if meta is not None and now < datetime.fromisoformat(meta["expires_at"]):
+            self._touch(key)
+            return self._load_body(key, meta), "fresh"
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = get_session().get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            meta["validated_at"] = now.isoformat()
+            meta["expires_at"] = compute_expiry(meta["report_datetime"], now).isoformat()
+            self._save_meta(key, meta)
+            return self._load_body(key, meta), "not_modified"
+
+        response.raise_for_status()
+        body = response.content
+        data = loads_forecast(body)
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "report_datetime": data[0]["reportDatetime"],
+            "fetched_at": now.isoformat(),
+            "expires_at": compute_expiry(data[0]["reportDatetime"], now).isoformat(),
+        }
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._write_atomic(self._body_path(key), body)
+        self._save_meta(key, meta)
+        with self._lock:
+            self._memory[key] = (meta["fetched_at"], data)
+        self._evict(keep_key=key)
+
+        return data, "updated"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_forecast_cache():
+    """
+    プロセス内で共有する天気予報キャッシュを取得する（初回呼び出し時に作成）。
+
+    Returns:
+        ForecastCache: 共有キャッシュ
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ForecastCache()
+    return _cache
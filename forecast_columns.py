@@ -0,0 +1,419 @@
+"""
+天気予報データの列指向（地域 × 時刻の行列）への変換
+
+全地域・全日程の数値項目を、行優先のarrayにまとめて保持する。
+欠損値（""）は、浮動小数点の項目ではNaN、天気コード・信頼度では-1として格納する。
+信頼度はA/B/Cを0/1/2の番号で格納する（RELIABILITY_LEVELS）。
+値の変換・集計は要素ごとのPythonの処理を行わず、NumPyがインストールされていればNumPyで、
+なければ組み込み関数（map/filter/min/max）でまとめて行う。
+to_numpy()でコピーなしにndarrayとして参照できる。
+"""
+
+import math
+from array import array
+from itertools import filterfalse, repeat
+
+from forecast_index import ParsedForecast
+
+NAN = float("nan")
+
+# 行列に変換する項目とarrayの型コード（自由記述のweathers/winds/wavesは対象外）
+FIELD_TYPECODES = {
+    "weatherCodes": 'h',
+    "pops": 'd',
+    "temps": 'd',
+    "reliabilities": 'b',
+    "tempsMin": 'd',
+    "tempsMinUpper": 'd',
+    "tempsMinLower": 'd',
+    "tempsMax": 'd',
+    "tempsMaxUpper": 'd',
+    "tempsMaxLower": 'd',
+}
+
+# 型コードごとの欠損値
+MISSING_VALUES = {'d': NAN, 'h': -1, 'b': -1}
+
+# NumPyのdtype（arrayの型コードに対応）
+_NUMPY_DTYPES = {'d': 'float64', 'h': 'int16', 'b': 'int8'}
+
+# 信頼度（番号の順）
+RELIABILITY_LEVELS = ("A", "B", "C")
+_RELIABILITY_CODES = {level: code for code, level in enumerate(RELIABILITY_LEVELS)}
+
+# 欠損値（""）を変換前に置き換える文字列
+_BLANK_REPLACEMENTS = {'d': {"": "nan"}, 'h': {"": "-1"}}
+
+_numpy_module = None
+_numpy_checked = False
+
+def _numpy():
+    """
+    NumPyを取得する（インストールされていない場合はNone、初回呼び出し時に読み込む）。
+    """
+    global _numpy_module, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_module = numpy
+        _numpy_checked = True
+    return _numpy_module
+
+def reliability_label(code):
+    """
+    信頼度の番号を文字（"A"/"B"/"C"）に変換する（欠損値はNone）。
+    """
+    return RELIABILITY_LEVELS[code] if 0 <= code < len(RELIABILITY_LEVELS) else None
+
+def _convert_values(values, typecode):
+    """
+    文字列の値のリストを、arrayに格納できる値のイテレータに変換する。
+
+    欠損値の置き換えと数値への変換はmapで行い、要素ごとのPythonの処理を行わない。
+    """
+    if typecode == 'b':
+        return map(_RELIABILITY_CODES.get, values, repeat(-1))
+    replacements = _BLANK_REPLACEMENTS[typecode]
+    # dict.get(値, 値)で""だけを置き換える
+    values = map(replacements.get, values, values)
+    return map(float if typecode == 'd' else int, values)
+
+class ForecastMatrix:
+    """
+    1つの項目の 地域 × 時刻 の行列。
+
+    値は行優先（地域ごとに時刻が並ぶ）のarrayに格納する。
+
+    Attributes:
+        field (str): 項目名（"pops", "tempsMax"など）
+        area_codes (list): 行に対応する地域コード
+        area_names (list): 行に対応する地域名
+        time_defines (list): 列に対応するtimeDefines
+        epochs (array): 列に対応するエポック秒
+        values (array): 行優先の値
+    """
+
+    def __init__(self, field, area_codes, area_names, time_defines, epochs, values, date_groups=None):
+        self.field = field
+        self.area_codes = area_codes
+        self.area_names = area_names
+        self.time_defines = time_defines
+        self.epochs = epochs
+        self.values = values
+        self._date_groups = date_groups or []
+        self._area_positions = {code: i for i, code in enumerate(area_codes)}
+
+    @classmethod
+    def from_time_series(cls, time_series_index, field):
+        """
+        TimeSeriesIndexの指定項目から行列を作成する。
+
+        Args:
+            time_series_index (TimeSeriesIndex): 解析済みのtimeSeries
+            field (str): 項目名
+
+        Returns:
+            ForecastMatrix: 行列
+        """
+        typecode = FIELD_TYPECODES[field]
+        n_times = len(time_series_index.time_defines)
+
+        # 全地域の文字列を1つのリストにまとめてから、まとめて変換する
+        flat_strings = []
+        for area in time_series_index.areas:
+            area_values = area.get(field, ())
+            flat_strings.extend(area_values[:n_times])
+            # 項目の長さがtimeDefinesより短い場合は欠損値で揃える
+            if len(area_values) < n_times:
+                flat_strings.extend(repeat("", n_times - len(area_values)))
+        flat_values = array(typecode, _convert_values(flat_strings, typecode))
+
+        return cls(
+            field,
+            time_series_index.area_codes,
+            [area["area"]["name"] for area in time_series_index.areas],
+            time_series_index.time_defines,
+            time_series_index.epochs,
+            flat_values,
+            time_series_index.date_groups(),
+        )
+
+    @property
+    def shape(self):
+        return len(self.area_codes), len(self.time_defines)
+
+    @property
+    def typecode(self):
+        return self.values.typecode
+
+    def area_position(self, area_code):
+        return self._area_positions.get(area_code)
+
+    def row(self, area_index):
+        """
+        指定地域の全時刻の値を取得する。
+
+        Args:
+            area_index (int): 行の位置
+
+        Returns:
+            array: 値の配列
+        """
+        n_times = len(self.time_defines)
+        start = area_index * n_times
+        return self.values[start:start + n_times]
+
+    def column(self, time_index):
+        """
+        指定時刻の全地域の値を取得する。
+
+        Args:
+            time_index (int): 列の位置
+
+        Returns:
+            array: 値の配列
+        """
+        return self.values[time_index::len(self.time_defines)]
+
+    def get(self, area_index, time_index):
+        return self.values[area_index * len(self.time_defines) + time_index]
+
+    def with_values(self, field, values):
+        """
+        地域・時刻が同じで、値だけが異なる行列を作成する。
+
+        Args:
+            field (str): 項目名
+            values (array): 行優先の値（この行列と同じ要素数）
+
+        Returns:
+            ForecastMatrix: 行列
+        """
+        return ForecastMatrix(field, self.area_codes, self.area_names, self.time_defines,
+                              self.epochs, values, self._date_groups)
+
+    def to_numpy(self):
+        """
+        行列をNumPyのndarrayとして参照する（コピーなし）。
+
+        Returns:
+            numpy.ndarray: 形状(地域数, 時刻数)の配列
+
+        Raises:
+            ImportError: NumPyがインストールされていない場合
+        """
+        import numpy as np
+
+        return np.frombuffer(self.values, dtype=_NUMPY_DTYPES[self.typecode]).reshape(self.shape)
+
+    def _valid_values(self, values):
+        """
+        欠損値を除いた値のイテレータ（NaN・-1の判定は組み込み関数で行う）。
+        """
+        if self.typecode == 'd':
+            return filterfalse(math.isnan, values)
+        return filter(MISSING_VALUES[self.typecode].__ne__, values)
+
+    def _numpy_masked(self, np):
+        """
+        NumPyの配列と、欠損値でない要素を示す配列を取得する。
+        """
+        values = self.to_numpy()
+        if self.typecode == 'd':
+            return values, ~np.isnan(values)
+        return values.astype("float64"), values != MISSING_VALUES[self.typecode]
+
+    def _reduce_all(self, name):
+        np = _numpy()
+        if np is not None and len(self.values):
+            values, valid = self._numpy_masked(np)
+            if not valid.any():
+                return NAN
+            result = values[valid].min() if name == "min" else values[valid].max()
+            return result.item()
+        valid = list(self._valid_values(self.values))
+        if not valid:
+            return NAN
+        return float(min(valid) if name == "min" else max(valid))
+
+    def min(self):
+        """
+        行列全体の最小値（欠損値を除く、値がない場合はNaN）。
+        """
+        return self._reduce_all("min")
+
+    def max(self):
+        """
+        行列全体の最大値（欠損値を除く、値がない場合はNaN）。
+        """
+        return self._reduce_all("max")
+
+    def _group_positions(self):
+        """
+        日付ごとの列の位置（連続している場合はslice、そうでなければ位置のリスト）。
+        """
+        positions = []
+        for _, indices in self._date_groups:
+            if indices == list(range(indices[0], indices[-1] + 1)):
+                positions.append(slice(indices[0], indices[-1] + 1))
+            else:
+                positions.append(indices)
+        return positions
+
+    def _daily_matrix(self, reduced):
+        dates = [day for day, _ in self._date_groups]
+        return ForecastMatrix(
+            self.field,
+            self.area_codes,
+            self.area_names,
+            [day.isoformat() for day in dates],
+            array('d', [self.epochs[indices[0]] for _, indices in self._date_groups]),
+            reduced,
+            [(day, [i]) for i, day in enumerate(dates)],
+        )
+
+    def _numpy_daily(self, np, name):
+        """
+        日付ごとの集計をNumPyで全地域まとめて行う（形状(地域数, 日数)）。
+        """
+        values, valid = self._numpy_masked(np)
+        n_areas = len(self.area_codes)
+        reduced = np.full((n_areas, len(self._date_groups)), np.nan)
+        for day_index, position in enumerate(self._group_positions()):
+            group_values = values[:, position]
+            group_valid = valid[:, position]
+            counts = group_valid.sum(axis=1)
+            if name == "mean":
+                sums = np.where(group_valid, group_values, 0.0).sum(axis=1)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    reduced[:, day_index] = sums / counts
+                continue
+            # 欠損値は集計に影響しない値に置き換える
+            fill = np.inf if name == "min" else -np.inf
+            filled = np.where(group_valid, group_values, fill)
+            result = filled.min(axis=1) if name == "min" else filled.max(axis=1)
+            reduced[:, day_index] = np.where(counts > 0, result, np.nan)
+        return array('d', reduced.tobytes())
+
+    def daily_reduce(self, reducer):
+        """
+        日付ごとに各地域の値を集計し、地域 × 日付 の行列を作成する。
+
+        Args:
+            reducer (callable): 欠損値を除いた値のリストを受け取り1つの値を返す関数
+
+        Returns:
+            ForecastMatrix: 列が日付（"YYYY-MM-DD"）の行列（値がない場合はNaN）
+        """
+        n_times = len(self.time_defines)
+        positions = self._group_positions()
+        reduced = array('d')
+        for area_index in range(len(self.area_codes)):
+            start = area_index * n_times
+            row = self.values[start:start + n_times]
+            for position in positions:
+                group = row[position] if isinstance(position, slice) else map(row.__getitem__, position)
+                valid = list(self._valid_values(group))
+                reduced.append(float(reducer(valid)) if valid else NAN)
+        return self._daily_matrix(reduced)
+
+    def _daily(self, name, reducer):
+        np = _numpy()
+        if np is not None and len(self.values):
+            return self._daily_matrix(self._numpy_daily(np, name))
+        return self.daily_reduce(reducer)
+
+    def daily_min(self):
+        return self._daily("min", min)
+
+    def daily_max(self):
+        return self._daily("max", max)
+
+    def daily_mean(self):
+        return self._daily("mean", lambda values: math.fsum(values) / len(values))
+
+    def subtract_rows(self, field, offsets):
+        """
+        地域ごとに1つの値を各時刻の値から引いた行列を作成する（平年差など）。
+
+        Args:
+            field (str): 作成する行列の項目名
+            offsets (list): 行ごとに引く値（行数と同じ要素数、NaNの行は結果もNaN）
+
+        Returns:
+            ForecastMatrix: 浮動小数点の行列（欠損値はNaN）
+
+        Raises:
+            TypeError: 浮動小数点の行列でない場合
+        """
+        if self.typecode != 'd':
+            raise TypeError(f"{self.field}は浮動小数点の項目ではありません")
+        np = _numpy()
+        if np is not None and len(self.values):
+            result = self.to_numpy() - np.asarray(offsets, dtype="float64")[:, None]
+            return self.with_values(field, array('d', result.tobytes()))
+
+        n_times = len(self.time_defines)
+        values = array('d')
+        for area_index, offset in enumerate(offsets):
+            row = self.values[area_index * n_times:(area_index + 1) * n_times]
+            # float.__rsub__(value) は value - offset（NaNとの差はNaN）
+            values.extend(map(float(offset).__rsub__, row))
+        return self.with_values(field, values)
+
+def _extract_block(time_series_indexes):
+    """
+    timeSeriesのリストから、項目名 → ForecastMatrix の辞書を作成する。
+    """
+    matrices = {}
+    for time_series_index in time_series_indexes:
+        fields = set()
+        for area in time_series_index.areas:
+            fields.update(field for field in area if field in FIELD_TYPECODES)
+        for field in sorted(fields):
+            matrices[field] = ForecastMatrix.from_time_series(time_series_index, field)
+    return matrices
+
+def _extract_averages(average_block):
+    """
+    tempAverage/precipAverageから、地域コード・最小・最大の配列を作成する。
+    """
+    if not average_block:
+        return None
+    areas = average_block.get("areas", [])
+    return {
+        "area_codes": [area["area"]["code"] for area in areas],
+        "area_names": [area["area"]["name"] for area in areas],
+        "min": array('d', _convert_values([area.get("min", "") for area in areas], 'd')),
+        "max": array('d', _convert_values([area.get("max", "") for area in areas], 'd')),
+    }
+
+def extract_forecast_columns(forecast_data):
+    """
+    天気予報データ全体を列指向の行列に変換する。
+
+    Args:
+        forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+
+    Returns:
+        dict: {
+            "report_datetime": 短期予報の発表時刻,
+            "short_term": 項目名 → ForecastMatrix（weatherCodes, pops, temps）,
+            "weekly": 項目名 → ForecastMatrix（weatherCodes, pops, reliabilities, tempsMin/Max...）,
+            "temp_average": 平年の気温（ない場合はNone）,
+            "precip_average": 平年の降水量（ない場合はNone）,
+        }
+    """
+    if not isinstance(forecast_data, ParsedForecast):
+        forecast_data = ParsedForecast(forecast_data)
+
+    weekly_raw = forecast_data.raw[1] if len(forecast_data.raw) > 1 else {}
+    return {
+        "report_datetime": forecast_data.report_datetime,
+        "short_term": _extract_block(forecast_data.short_term),
+        "weekly": _extract_block(forecast_data.weekly),
+        "temp_average": _extract_averages(weekly_raw.get("tempAverage")),
+        "precip_average": _extract_averages(weekly_raw.get("precipAverage")),
+    }
@@ -0,0 +1,463 @@
+"""
+天気予報の列指向ファイルへのエクスポート
+
+実行ごとに取得した天気予報の全地域・全timeSeries（短期予報・週間予報の行列と平年値、
+短期予報の自由記述の天気・風・波）を、(発表時刻, 区分, 項目, 地域, 対象時刻, 値, 文字列) の縦長の表として
+<出力先>/office_code=<府県予報区コード>/date=<発表日>/<発表時刻>.<拡張子> に書き出す。
+pyarrowがインストールされていればParquet（またはArrow IPC）で、値の列は行列のarrayを
+コピーせずに参照して書き出す。なければgzip圧縮のCSVで書き出す。
+pyarrow.datasetなどでHive形式のパーティションとして読み込めば、jsonを解析し直さずに長期間のデータを扱える。
+"""
+
+import csv
+import gzip
+import itertools
+import math
+import os
+import threading
+from array import array
+from datetime import datetime
+from itertools import repeat
+
+from forecast_cache import JST
+from forecast_columns import RELIABILITY_LEVELS, extract_forecast_columns, reliability_label
+from forecast_index import ParsedForecast
+
+# エクスポートの出力先（設定するとエクスポートを有効化）
+FORECAST_EXPORT_DIR = os.getenv('FORECAST_EXPORT_DIR')
+
+# 出力形式（auto: pyarrowがあればParquet、なければCSV, parquet, arrow, csv）
+FORECAST_EXPORT_FORMAT = os.getenv('FORECAST_EXPORT_FORMAT', 'auto')
+
+# Parquetの圧縮方式
+FORECAST_EXPORT_COMPRESSION = os.getenv('FORECAST_EXPORT_COMPRESSION', 'zstd')
+
+# CSVで1回に書き出す行数
+CSV_BATCH_ROWS = 10000
+
+# 形式ごとの拡張子
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv.gz"}
+
+# 列の名前（office_code・dateはパーティションのディレクトリ名で表す）
+COLUMNS = ("report_datetime", "block", "field", "area_code", "area_name", "target_time", "value", "text")
+
+# 平年値の項目名（対象時刻はなし）
+AVERAGE_FIELDS = (
+    ("temp_average", "tempAverage"),
+    ("precip_average", "precipAverage"),
+)
+
+# 文字列の列に書き出す短期予報の自由記述の項目（値の列は空）
+TEXT_FIELDS = ("weathers", "winds", "waves")
+
+def export_directory():
+    """
+    エクスポートの出力先を取得する（設定されていない場合はNone）。
+    """
+    # .envファイルで設定された場合にも対応するため、環境変数は呼び出し時に読む
+    return os.getenv('FORECAST_EXPORT_DIR', FORECAST_EXPORT_DIR)
+
+def _pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def resolve_format(fmt=None):
+    """
+    出力形式を決める。
+
+    Args:
+        fmt (str): 出力形式（省略時はFORECAST_EXPORT_FORMAT）
+
+    Returns:
+        str: "parquet", "arrow", "csv" のいずれか
+
+    Raises:
+        ImportError: parquet・arrowを指定したが、pyarrowがインストールされていない場合
+        ValueError: 不明な形式を指定した場合
+    """
+    fmt = fmt or os.getenv('FORECAST_EXPORT_FORMAT', FORECAST_EXPORT_FORMAT)
+    if fmt == "auto":
+        return "parquet" if _pyarrow_available() else "csv"
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"不明なエクスポート形式です: {fmt}")
+    if fmt != "csv" and not _pyarrow_available():
+        raise ImportError(f"FORECAST_EXPORT_FORMAT={fmt} ですが、pyarrowがインストールされていません")
+    return fmt
+
+def _report_time(report_datetime):
+    return datetime.fromisoformat(report_datetime).astimezone(JST)
+
+def export_path(directory, office_code, report_datetime, fmt):
+    """
+    エクスポート先のファイルのパスを作成する。
+
+    Args:
+        directory (str): 出力先
+        office_code (str): 府県予報区コード
+        report_datetime (str): 短期予報の発表時刻
+        fmt (str): 出力形式
+
+    Returns:
+        str: <出力先>/office_code=<コード>/date=<発表日>/<発表時刻>.<拡張子>
+    """
+    report_time = _report_time(report_datetime)
+    return os.path.join(directory, f"office_code={office_code}", f"date={report_time.date().isoformat()}",
+                        f"{report_time:%Y%m%dT%H%M}{EXTENSIONS[fmt]}")
+
+def _blocks(forecast_data):
+    """
+    天気予報データの行列と平年値を、区分ごとに取得する。
+
+    Returns:
+        tuple: ([(区分, 区分の発表時刻, 項目名 → ForecastMatrix)...], 列指向の変換結果)
+    """
+    columns = extract_forecast_columns(forecast_data)
+    weekly_report = forecast_data.raw[1].get("reportDatetime") if len(forecast_data.raw) > 1 else None
+    blocks = [("short_term", forecast_data.report_datetime, columns["short_term"])]
+    if columns["weekly"]:
+        blocks.append(("weekly", weekly_report or forecast_data.report_datetime, columns["weekly"]))
+    return blocks, columns
+
+def _text_fields(forecast_data):
+    """
+    短期予報の自由記述の項目を、全地域・全時刻の文字列のリストとして取得する。
+
+    Returns:
+        list: (項目名, TimeSeriesIndex, 行優先の文字列のリスト（""・値なしはNone）) のリスト
+    """
+    texts = []
+    for time_series_index in forecast_data.short_term:
+        n_times = len(time_series_index.time_defines)
+        for field in TEXT_FIELDS:
+            if not any(field in area for area in time_series_index.areas):
+                continue
+            values = []
+            for area in time_series_index.areas:
+                area_values = area.get(field, ())[:n_times]
+                values.extend(value or None for value in area_values)
+                # 項目の長さがtimeDefinesより短い場合は値なしで揃える
+                values.extend(repeat(None, n_times - len(area_values)))
+            texts.append((field, time_series_index, values))
+    return texts
+
+# pyarrowによる書き出し（値の列は行列のarrayをコピーせずに参照する）
+
+def _arrow_schema(pa):
+    timestamp = pa.timestamp("s", tz="+09:00")
+    string = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("report_datetime", timestamp),
+        ("block", string),
+        ("field", string),
+        ("area_code", string),
+        ("area_name", string),
+        ("target_time", timestamp),
+        ("value", pa.float64()),
+        ("text", pa.string()),
+    ])
+
+def _from_array(pa, values, arrow_type):
+    # arrayのバッファをコピーせずにArrowの配列として参照する（欠損値なし）
+    return pa.Array.from_buffers(arrow_type, len(values), [None, pa.py_buffer(values)])
+
+def _float_values(pa, values):
+    """
+    浮動小数点のarrayを、欠損値（NaN）をnullとするArrowの配列として参照する。
+
+    値のバッファはコピーせず、有効な値を示すビットマップだけを新しく作る。
+    """
+    import pyarrow.compute as pc
+
+    array_values = _from_array(pa, values, pa.float64())
+    valid = pc.invert(pc.is_nan(array_values))
+    return pa.Array.from_buffers(pa.float64(), len(values), [valid.buffers()[1], array_values.buffers()[1]])
+
+def _repeated(pa, value, length):
+    # 同じ値の列は、1要素の辞書と0の添字で表す
+    return pa.DictionaryArray.from_arrays(
+        _from_array(pa, array('i', bytes(4 * length)), pa.int32()), pa.array([value], pa.string()))
+
+def _grid_columns(pa, n_areas, epochs):
+    """
+    地域の添字（各地域を時刻数だけ繰り返す）と、対象時刻（時刻の並びを地域数だけ繰り返す）を作成する。
+    """
+    n_times = len(epochs)
+    area_indices = array('i')
+    for area_index in range(n_areas):
+        area_indices.extend(array('i', [area_index]) * n_times)
+    return _from_array(pa, area_indices, pa.int32()), array('q', [int(epoch) for epoch in epochs]) * n_areas
+
+def _matrix_batch(pa, schema, report_epoch, block, matrix):
+    """
+    1つの行列を、地域ごとに時刻が並ぶ順（行列の行優先の順）のRecordBatchに変換する。
+    """
+    n_areas, n_times = matrix.shape
+    length = n_areas * n_times
+    area_indices, target_times = _grid_columns(pa, n_areas, matrix.epochs)
+
+    text = pa.nulls(length, pa.string())
+    if matrix.typecode == 'd':
+        # 浮動小数点の値はarrayのバッファをそのまま参照する
+        value = _float_values(pa, matrix.values)
+    elif matrix.typecode == 'h':
+        import pyarrow.compute as pc
+
+        codes = _from_array(pa, matrix.values, pa.int16())
+        value = pc.if_else(pc.equal(codes, -1), pa.scalar(None, pa.float64()), pc.cast(codes, pa.float64()))
+    else:
+        import pyarrow.compute as pc
+
+        # 信頼度の番号を文字に変換する（欠損値の-1はnull）
+        codes = _from_array(pa, matrix.values, pa.int8())
+        codes = pc.if_else(pc.less(codes, 0), pa.scalar(None, pa.int8()), codes)
+        value = pa.nulls(length, pa.float64())
+        text = pc.take(pa.array(RELIABILITY_LEVELS, pa.string()), codes)
+
+    return pa.RecordBatch.from_arrays([
+        _from_array(pa, array('q', [report_epoch]) * length, schema.field("report_datetime").type),
+        _repeated(pa, block, length),
+        _repeated(pa, matrix.field, length),
+        pa.DictionaryArray.from_arrays(area_indices, pa.array(matrix.area_codes, pa.string())),
+        pa.DictionaryArray.from_arrays(area_indices, pa.array(matrix.area_names, pa.string())),
+        _from_array(pa, target_times, schema.field("target_time").type),
+        value,
+        text,
+    ], schema=schema)
+
+def _text_batch(pa, schema, report_epoch, field, time_series_index, texts):
+    """
+    短期予報の自由記述の項目を、文字列の列に値を持つRecordBatchに変換する。
+    """
+    length = len(texts)
+    area_indices, target_times = _grid_columns(pa, len(time_series_index.area_codes), time_series_index.epochs)
+    return pa.RecordBatch.from_arrays([
+        _from_array(pa, array('q', [report_epoch]) * length, schema.field("report_datetime").type),
+        _repeated(pa, "short_term", length),
+        _repeated(pa, field, length),
+        pa.DictionaryArray.from_arrays(area_indices, pa.array(time_series_index.area_codes, pa.string())),
+        pa.DictionaryArray.from_arrays(
+            area_indices, pa.array([area["area"]["name"] for area in time_series_index.areas], pa.string())),
+        _from_array(pa, target_times, schema.field("target_time").type),
+        pa.nulls(length, pa.float64()),
+        pa.array(texts, pa.string()),
+    ], schema=schema)
+
+def _average_batch(pa, schema, report_epoch, field, averages):
+    """
+    平年値（地点ごとの最小・最大）を、項目名 "<平年値>Min" / "<平年値>Max" のRecordBatchに変換する。
+    """
+    n_areas = len(averages["area_codes"])
+    area_indices = _from_array(pa, array('i', range(n_areas)) * 2, pa.int32())
+    values = array('d', averages["min"]) + array('d', averages["max"])
+    fields = pa.DictionaryArray.from_arrays(
+        _from_array(pa, array('i', [0]) * n_areas + array('i', [1]) * n_areas, pa.int32()),
+        pa.array([f"{field}Min", f"{field}Max"], pa.string()))
+    length = 2 * n_areas
+    return pa.RecordBatch.from_arrays([
+        _from_array(pa, array('q', [report_epoch]) * length, schema.field("report_datetime").type),
+        _repeated(pa, "weekly", length),
+        fields,
+        pa.DictionaryArray.from_arrays(area_indices, pa.array(averages["area_codes"], pa.string())),
+        pa.DictionaryArray.from_arrays(area_indices, pa.array(averages["area_names"], pa.string())),
+        pa.nulls(length, schema.field("target_time").type),
+        _float_values(pa, values),
+        pa.nulls(length, pa.string()),
+    ], schema=schema)
+
+def _arrow_batches(forecast_data):
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa)
+    blocks, columns = _blocks(forecast_data)
+    batches = []
+    for block, report_datetime, matrices in blocks:
+        report_epoch = int(_report_time(report_datetime).timestamp())
+        batches.extend(_matrix_batch(pa, schema, report_epoch, block, matrix) for matrix in matrices.values())
+    report_epoch = int(_report_time(blocks[0][1]).timestamp())
+    for field, time_series_index, texts in _text_fields(forecast_data):
+        batches.append(_text_batch(pa, schema, report_epoch, field, time_series_index, texts))
+    weekly_epoch = int(_report_time(blocks[-1][1]).timestamp())
+    for key, field in AVERAGE_FIELDS:
+        if columns[key]:
+            batches.append(_average_batch(pa, schema, weekly_epoch, field, columns[key]))
+    return schema, batches
+
+def _write_arrow(path, forecast_data, fmt, compression):
+    import pyarrow as pa
+
+    schema, batches = _arrow_batches(forecast_data)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        # 行列ごとのバッチを連結せずに1つの表として渡し、行グループにまとめて書き出す
+        pq.write_table(pa.Table.from_batches(batches, schema=schema), path, compression=compression)
+    else:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            # Arrow IPCファイルは列ごとに1つの辞書しか持てないため、辞書を統合する（値の列はそのまま）
+            writer.write_table(pa.Table.from_batches(batches, schema=schema).unify_dictionaries())
+    return sum(batch.num_rows for batch in batches)
+
+# CSVによる書き出し（pyarrowがない場合）
+
+def _format_value(value):
+    return "" if value is None or value != value else repr(value)
+
+def _csv_rows(forecast_data):
+    blocks, columns = _blocks(forecast_data)
+    for block, report_datetime, matrices in blocks:
+        for field, matrix in matrices.items():
+            n_times = len(matrix.time_defines)
+            for area_index, (area_code, area_name) in enumerate(zip(matrix.area_codes, matrix.area_names)):
+                row = matrix.values[area_index * n_times:(area_index + 1) * n_times]
+                for time_define, value in zip(matrix.time_defines, row):
+                    if matrix.typecode == 'b':
+                        yield (report_datetime, block, field, area_code, area_name, time_define,
+                               "", reliability_label(value) or "")
+                    elif matrix.typecode == 'h':
+                        yield (report_datetime, block, field, area_code, area_name, time_define,
+                               "" if value < 0 else value, "")
+                    else:
+                        yield (report_datetime, block, field, area_code, area_name, time_define,
+                               _format_value(value), "")
+    report_datetime = blocks[0][1]
+    for field, time_series_index, texts in _text_fields(forecast_data):
+        n_times = len(time_series_index.time_defines)
+        for area_index, area in enumerate(time_series_index.areas):
+            row = texts[area_index * n_times:(area_index + 1) * n_times]
+            for time_define, text in zip(time_series_index.time_defines, row):
+                yield (report_datetime, "short_term", field, area["area"]["code"], area["area"]["name"],
+                       time_define, "", text or "")
+    report_datetime = blocks[-1][1]
+    for key, field in AVERAGE_FIELDS:
+        averages = columns[key]
+        if not averages:
+            continue
+        for suffix, values in (("Min", averages["min"]), ("Max", averages["max"])):
+            for area_code, area_name, value in zip(averages["area_codes"], averages["area_names"], values):
+                yield (report_datetime, "weekly", f"{field}{suffix}", area_code, area_name, "",
+                       "" if math.isnan(value) else repr(value), "")
+
+def _write_csv(path, forecast_data):
+    rows = 0
+    row_iter = _csv_rows(forecast_data)
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        # CSV_BATCH_ROWS行ずつまとめて書き出す
+        while True:
+            batch = list(itertools.islice(row_iter, CSV_BATCH_ROWS))
+            if not batch:
+                break
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+class ForecastExporter:
+    """
+    天気予報を府県予報区・発表日ごとのファイルに書き出すエクスポーター。
+
+    同じ府県予報区・発表時刻のファイルがすでにあれば書き出さない。
+    """
+
+    def __init__(self, directory=None, fmt=None, compression=None):
+        self.directory = directory or export_directory()
+        self.format = resolve_format(fmt)
+        self.compression = compression or os.getenv('FORECAST_EXPORT_COMPRESSION', FORECAST_EXPORT_COMPRESSION)
+        self._lock = threading.Lock()
+
+    def export(self, forecast_data, office_code):
+        """
+        1つの府県予報区の天気予報を書き出す。
+
+        Args:
+            forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+            office_code (str): 府県予報区コード
+
+        Returns:
+            tuple: (ファイルのパス, 書き出した行数)、書き出し済みの場合は行数が0
+        """
+        if not isinstance(forecast_data, ParsedForecast):
+            forecast_data = ParsedForecast(forecast_data)
+        path = export_path(self.directory, office_code, forecast_data.report_datetime, self.format)
+        if os.path.exists(path):
+            return path, 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if self.format == "csv":
+                rows = _write_csv(tmp_path, forecast_data)
+            else:
+                rows = _write_arrow(tmp_path, forecast_data, self.format, self.compression)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path, rows
+
+    def export_many(self, forecasts):
+        """
+        複数の府県予報区の天気予報をまとめて書き出す。
+
+        Args:
+            forecasts (iterable): (府県予報区コード, 天気予報データ) の組
+
+        Returns:
+            list: exportの戻り値のリスト
+        """
+        # 書き出しは1つずつ行い、一括取得の並列処理と書き出しが重ならないようにする
+        with self._lock:
+            return [self.export(forecast_data, office_code) for office_code, forecast_data in forecasts]
+
+def open_export_dataset(directory=None, fmt=None):
+    """
+    エクスポートしたファイルをpyarrowのデータセットとして開く。
+
+    office_code・dateの列はディレクトリ名から付与される。
+
+    Args:
+        directory (str): 出力先（省略時はFORECAST_EXPORT_DIR）
+        fmt (str): 出力形式（省略時はFORECAST_EXPORT_FORMAT）
+
+    Returns:
+        pyarrow.dataset.Dataset: データセット（to_table()で表として読み込める）
+
+    Raises:
+        ImportError: pyarrowがインストールされていない場合
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    fmt = resolve_format(fmt)
+    partitioning = ds.partitioning(pa.schema([("office_code", pa.string()), ("date", pa.string())]), flavor="hive")
+    schema = None
+    if fmt == "csv":
+        # CSVでは型を推測させず、地域コードなどを文字列として読む
+        schema = pa.schema([(field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+                            for field in _arrow_schema(pa)] + list(partitioning.schema))
+    file_format = {"parquet": "parquet", "arrow": "ipc"}.get(fmt)
+    if fmt == "csv":
+        import pyarrow.csv
+
+        file_format = ds.CsvFileFormat(convert_options=pyarrow.csv.ConvertOptions(strings_can_be_null=True))
+    return ds.dataset(directory or export_directory(), schema=schema, format=file_format, partitioning=partitioning)
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def get_forecast_exporter():
+    """
+    プロセス内で共有するエクスポーターを取得する（初回呼び出し時に作成）。
+
+    Returns:
+        ForecastExporter: 共有のエクスポーター
+    """
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = ForecastExporter()
+    return _exporter
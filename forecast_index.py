@@ -0,0 +1,145 @@
+"""
+天気予報データの時系列インデックス
+
+timeSeriesごとにtimeDefinesを一度だけ解析し、日付 → インデックスの対応表と
+エポック秒の配列を作っておくことで、任意の(地域, 日付)の値をすぐに引けるようにする。
+"""
+
+from array import array
+from datetime import date, datetime
+
+def _to_date(value):
+    """
+    datetime/dateから日付部分を取得する。
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    raise TypeError(f"日付として扱えない値です: {value!r}")
+
+class TimeSeriesIndex:
+    """
+    1つのtimeSeriesに対する時刻・日付・地域のインデックス。
+
+    Attributes:
+        time_defines (list): 元のtimeDefines文字列
+        epochs (array): timeDefinesのエポック秒（float）
+        areas (list): 元のareas
+        area_codes (list): 地域コードの一覧（areasと同じ順序）
+    """
+
+    def __init__(self, time_series):
+        self.time_defines = time_series["timeDefines"]
+        self.areas = time_series["areas"]
+
+        self.epochs = array('d')
+        self._date_indices = {}
+        for i, time_str in enumerate(self.time_defines):
+            time_obj = datetime.fromisoformat(time_str)
+            self.epochs.append(time_obj.timestamp())
+            self._date_indices.setdefault(time_obj.date(), []).append(i)
+
+        self.area_codes = [area["area"]["code"] for area in self.areas]
+        self._area_positions = {code: i for i, code in enumerate(self.area_codes)}
+
+    def dates(self):
+        """
+        この時系列に含まれる日付の一覧を取得する。
+
+        Returns:
+            list: dateのリスト（時系列の順）
+        """
+        return list(self._date_indices)
+
+    def date_groups(self):
+        """
+        日付ごとのtimeDefinesのインデックスを取得する。
+
+        Returns:
+            list: (date, インデックスのリスト) のリスト（時系列の順）
+        """
+        return list(self._date_indices.items())
+
+    def indices_for(self, target_date):
+        """
+        指定日に該当するtimeDefinesのインデックスを取得する。
+
+        Args:
+            target_date (datetime | date): 取得対象の日付
+
+        Returns:
+            list: インデックスのリスト（該当なしの場合は空リスト）
+        """
+        return self._date_indices.get(_to_date(target_date), [])
+
+    def area_position(self, area_code):
+        """
+        地域コードからareas内の位置を取得する。
+
+        Args:
+            area_code (str): 地域コード
+
+        Returns:
+            int: areas内の位置（該当なしの場合はNone）
+        """
+        return self._area_positions.get(area_code)
+
+    def values(self, area_index, field, target_date):
+        """
+        指定地域・指定日の値を取得する。
+
+        Args:
+            area_index (int): areas内の位置
+            field (str): 取得する項目名（"weatherCodes", "pops", "temps"など）
+            target_date (datetime | date): 取得対象の日付
+
+        Returns:
+            list: 値のリスト（該当なしの場合は空リスト）
+        """
+        area_values = self.areas[area_index][field]
+        return [area_values[i] for i in self.indices_for(target_date)]
+
+class ParsedForecast:
+    """
+    天気予報データ全体を一度だけ解析した結果。
+
+    Attributes:
+        publishing_office (str): 発表元
+        report_datetime (str): 発表時刻
+        short_term (list): 短期予報の各timeSeriesのTimeSeriesIndex
+            （[0]=天気, [1]=降水確率, [2]=気温）
+        weekly (list): 週間予報の各timeSeriesのTimeSeriesIndex（ない場合は空リスト）
+    """
+
+    def __init__(self, forecast_data):
+        short_term_forecast = forecast_data[0]
+        self.raw = forecast_data
+        self.publishing_office = short_term_forecast["publishingOffice"]
+        self.report_datetime = short_term_forecast["reportDatetime"]
+        self.short_term = [TimeSeriesIndex(ts) for ts in short_term_forecast["timeSeries"]]
+        if len(forecast_data) > 1:
+            self.weekly = [TimeSeriesIndex(ts) for ts in forecast_data[1]["timeSeries"]]
+        else:
+            self.weekly = []
+
+    @property
+    def weather(self):
+        return self.short_term[0]
+
+    @property
+    def rain(self):
+        return self.short_term[1]
+
+    @property
+    def temperature(self):
+        return self.short_term[2]
+
+    def dates(self):
+        """
+        短期予報の天気に含まれる日付の一覧を取得する。
+
+        Returns:
+            list: dateのリスト
+        """
+        return self.weather.dates()
@@ -0,0 +1,388 @@
+"""
+保存済みの天気予報jsonの一括取り込み
+
+ディレクトリ以下の天気予報json（samples/と同じ形式）をメモリマップして、
+複数のワーカープロセスで並列に解析する。ワーカーからは辞書ではなく、
+列ごとのarrayのバイト列（府県予報区・地域・時刻・項目・値）を受け取り、
+そのまま (府県予報区, 地域, 時刻, 項目) の列指向の配列に追加する。
+処理中のスナップショット数には上限を設け、出力先を指定した場合は一定行数ごとに
+ファイルへ書き出すため、ファイル数が増えてもメモリ使用量はほぼ一定になる。
+"""
+
+import json
+import os
+import re
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from forecast_columns import FIELD_TYPECODES
+from forecast_json import load_mapped
+
+# 1回にワーカーへ渡すスナップショット数
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '64'))
+
+# 出力先に書き出すまでにメモリに保持する行数
+INGEST_FLUSH_ROWS = int(os.getenv('INGEST_FLUSH_ROWS', '1000000'))
+
+# ワーカー1つあたりの処理中のバッチ数の上限
+_BATCHES_PER_WORKER = 2
+
+# 予報の区分（天気予報データの[0]=短期予報, [1]=週間予報）
+BLOCKS = ("short_term", "weekly")
+
+# 取り込む項目（"区分.項目名"、数値の項目のみで信頼度は対象外）
+METRICS = tuple(
+    f"{block}.{field}"
+    for block in BLOCKS
+    for field in FIELD_TYPECODES if field != "reliabilities"
+)
+_METRIC_IDS = {metric: i for i, metric in enumerate(METRICS)}
+
+# 列名とarrayの型コード（府県予報区・地域・項目は一覧への番号、時刻はエポック秒）
+COLUMNS = (
+    ("office", 'H'),
+    ("report_time", 'q'),
+    ("area", 'H'),
+    ("time", 'q'),
+    ("metric", 'B'),
+    ("value", 'd'),
+)
+
+# 出力先の列の一覧などを保存するファイル
+_META_FILE = "columns.json"
+
+# パスに含まれる府県予報区コード（6桁の数字）
+_OFFICE_CODE_PATTERN = re.compile(r'(?<!\d)(\d{6})(?!\d)')
+
+def find_snapshot_files(directory):
+    """
+    ディレクトリ以下の天気予報jsonを順に探す（一覧をまとめて作らない）。
+
+    Args:
+        directory (str): スナップショットのディレクトリ
+
+    Yields:
+        str: jsonファイルのパス（ディレクトリごとに名前順）
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".json"):
+                yield os.path.join(root, name)
+
+def office_code_from_path(path, default=None):
+    """
+    パス（ファイル名・ディレクトリ名）から府県予報区コードを取得する。
+
+    Args:
+        path (str): jsonファイルのパス
+        default (str): コードを含まない場合の値
+
+    Returns:
+        str: 府県予報区コード（ファイル名に近い方を優先）
+    """
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        match = _OFFICE_CODE_PATTERN.search(part)
+        if match:
+            return match.group(1)
+    return default
+
+class _Lookup:
+    """
+    文字列 → 番号 の対応表（番号は追加順）。
+    """
+
+    def __init__(self, values=()):
+        self.values = []
+        self._ids = {}
+        for value in values:
+            self.id(value)
+
+    def id(self, value):
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+def _new_columns():
+    return {name: array(typecode) for name, typecode in COLUMNS}
+
+def _append_snapshot(columns, offices, areas, forecast_data, office_code):
+    """
+    1つのスナップショットの数値を列に追加する（欠損値の行は追加しない）。
+
+    Returns:
+        int: 追加した行数
+    """
+    report_epoch = int(datetime.fromisoformat(forecast_data[0]["reportDatetime"]).timestamp())
+
+    # 途中で解析に失敗した場合に列が中途半端にならないよう、まとめてから追加する
+    rows = _new_columns()
+    for block, forecast in zip(BLOCKS, forecast_data):
+        for time_series in forecast.get("timeSeries", ()):
+            epochs = [int(datetime.fromisoformat(t).timestamp()) for t in time_series["timeDefines"]]
+            for area in time_series["areas"]:
+                area_id = areas.id(area["area"]["code"])
+                for field, values in area.items():
+                    metric_id = _METRIC_IDS.get(f"{block}.{field}")
+                    if metric_id is None:
+                        continue
+                    for epoch, value in zip(epochs, values):
+                        if value == "":
+                            continue
+                        rows["area"].append(area_id)
+                        rows["time"].append(epoch)
+                        rows["metric"].append(metric_id)
+                        rows["value"].append(float(value))
+
+    n_rows = len(rows["value"])
+    rows["office"] = array('H', [offices.id(office_code)]) * n_rows
+    rows["report_time"] = array('q', [report_epoch]) * n_rows
+    for name, _ in COLUMNS:
+        columns[name].extend(rows[name])
+    return n_rows
+
+def decode_batch(paths, default_office_code=None):
+    """
+    複数のスナップショットをメモリマップして解析し、列ごとのバイト列にまとめる（ワーカーで実行）。
+
+    府県予報区・地域はバッチ内の番号で格納し、番号に対応するコードの一覧を一緒に返す。
+
+    Args:
+        paths (list): jsonファイルのパスのリスト
+        default_office_code (str): パスに府県予報区コードを含まない場合のコード
+
+    Returns:
+        tuple: (府県予報区コードの一覧, 地域コードの一覧, 列名 → バイト列, 取り込んだファイル数, エラーのリスト)
+    """
+    columns = _new_columns()
+    offices = _Lookup()
+    areas = _Lookup()
+    errors = []
+    decoded = 0
+    for path in paths:
+        try:
+            forecast_data = load_mapped(path)
+            _append_snapshot(columns, offices, areas, forecast_data,
+                             office_code_from_path(path, default_office_code))
+            decoded += 1
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            errors.append((path, f"{type(e).__name__}: {e}"))
+    encoded = {name: column.tobytes() for name, column in columns.items()}
+    return offices.values, areas.values, encoded, decoded, errors
+
+def _decode_batch(args):
+    return decode_batch(*args)
+
+class IngestedColumns:
+    """
+    取り込んだ値の列指向の配列（1行 = 府県予報区・発表時刻・地域・時刻・項目・値）。
+
+    出力先を指定した場合は、INGEST_FLUSH_ROWS行ごとに列ごとのファイル（<列名>.bin）へ追記し、
+    メモリには書き出す前の行だけを保持する。
+
+    Attributes:
+        offices (list): 府県予報区コードの一覧（office列の番号に対応）
+        areas (list): 地域コードの一覧（area列の番号に対応）
+        metrics (tuple): 項目の一覧（metric列の番号に対応）
+        columns (dict): 列名 → array
+        rows (int): 行数（書き出した行を含む）
+        files (int): 取り込んだファイル数
+        errors (list): (パス, エラー内容) のリスト
+    """
+
+    def __init__(self, output_dir=None, flush_rows=None):
+        self.output_dir = output_dir
+        self.flush_rows = INGEST_FLUSH_ROWS if flush_rows is None else flush_rows
+        self._offices = _Lookup()
+        self._areas = _Lookup()
+        self.metrics = METRICS
+        self.columns = _new_columns()
+        self.rows = 0
+        self.files = 0
+        self.errors = []
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            for name, _ in COLUMNS:
+                open(self._column_path(name), "wb").close()
+
+    @property
+    def offices(self):
+        return self._offices.values
+
+    @property
+    def areas(self):
+        return self._areas.values
+
+    def _column_path(self, name):
+        return os.path.join(self.output_dir, f"{name}.bin")
+
+    def add_batch(self, decoded):
+        """
+        decode_batchの戻り値を追加する（バッチ内の番号を全体の番号に付け替える）。
+        """
+        office_codes, area_codes, encoded, files, errors = decoded
+        office_ids = [self._offices.id(code) for code in office_codes]
+        area_ids = [self._areas.id(code) for code in area_codes]
+
+        batch = _new_columns()
+        for name, data in encoded.items():
+            batch[name].frombytes(data)
+        if office_ids != list(range(len(office_ids))):
+            batch["office"] = array('H', [office_ids[i] for i in batch["office"]])
+        if area_ids != list(range(len(area_ids))):
+            batch["area"] = array('H', [area_ids[i] for i in batch["area"]])
+
+        for name, _ in COLUMNS:
+            self.columns[name].extend(batch[name])
+        self.rows += len(batch["value"])
+        self.files += files
+        self.errors.extend(errors)
+
+        if self.output_dir and len(self.columns["value"]) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        メモリに保持している行を出力先のファイルに追記する（出力先がない場合は何もしない）。
+        """
+        if not self.output_dir:
+            return
+        for name, column in self.columns.items():
+            with open(self._column_path(name), "ab") as f:
+                column.tofile(f)
+        self.columns = _new_columns()
+
+    def close(self):
+        """
+        残りの行を書き出し、列の一覧などを出力先に保存する。
+        """
+        if not self.output_dir:
+            return
+        self.flush()
+        meta = {
+            "rows": self.rows,
+            "files": self.files,
+            "offices": self.offices,
+            "areas": self.areas,
+            "metrics": list(self.metrics),
+            "columns": [list(column) for column in COLUMNS],
+        }
+        with open(os.path.join(self.output_dir, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    def to_numpy(self):
+        """
+        メモリに保持している列をNumPyのndarrayとして参照する（コピーなし）。
+
+        Returns:
+            dict: 列名 → numpy.ndarray
+
+        Raises:
+            ImportError: NumPyがインストールされていない場合
+        """
+        import numpy as np
+
+        return {name: np.frombuffer(column, dtype=column.typecode) for name, column in self.columns.items()}
+
+def load_ingested_columns(output_dir, mmap_mode=None):
+    """
+    ingest_directoryで書き出した列を読み込む。
+
+    Args:
+        output_dir (str): 出力先のディレクトリ
+        mmap_mode (str): NumPyのmemmapとして開く場合のモード（"r"など、NumPyが必要）
+
+    Returns:
+        dict: {"offices", "areas", "metrics", "rows", "files", "columns": 列名 → array/ndarray}
+    """
+    with open(os.path.join(output_dir, _META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    columns = {}
+    for name, typecode in meta["columns"]:
+        path = os.path.join(output_dir, f"{name}.bin")
+        if mmap_mode:
+            import numpy as np
+            columns[name] = np.memmap(path, dtype=typecode, mode=mmap_mode, shape=(meta["rows"],)) \
+                if meta["rows"] else np.array([], typecode)
+        else:
+            column = array(typecode)
+            with open(path, "rb") as f:
+                column.fromfile(f, meta["rows"])
+            columns[name] = column
+    meta["columns"] = columns
+    return meta
+
+def _batches(paths, batch_size):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest_directory(directory, output_dir=None, workers=None, batch_size=None, office_code=None,
+                     flush_rows=None):
+    """
+    ディレクトリ以下のスナップショットをすべて列指向の配列に取り込む。
+
+    Args:
+        directory (str): スナップショットのディレクトリ
+        output_dir (str): 列を書き出すディレクトリ（省略時はメモリに保持）
+        workers (int): プロセス数（省略時はCPUコア数、1の場合はこのプロセスで処理）
+        batch_size (int): 1回にワーカーへ渡すスナップショット数（省略時はINGEST_BATCH_SIZE）
+        office_code (str): パスに府県予報区コードを含まない場合のコード
+        flush_rows (int): 書き出すまでにメモリに保持する行数（省略時はINGEST_FLUSH_ROWS）
+
+    Returns:
+        IngestedColumns: 取り込んだ列
+    """
+    if batch_size is None:
+        batch_size = INGEST_BATCH_SIZE
+    ingested = IngestedColumns(output_dir, flush_rows)
+    tasks = ((batch, office_code) for batch in _batches(find_snapshot_files(directory), batch_size))
+
+    if workers == 1:
+        for task in tasks:
+            ingested.add_batch(_decode_batch(task))
+        ingested.close()
+        return ingested
+
+    max_pending = _BATCHES_PER_WORKER * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 処理中のバッチ数を抑えて、結果がたまらないようにする（取り込みはファイル名順）
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_decode_batch, task))
+            if len(pending) >= max_pending:
+                ingested.add_batch(pending.popleft().result())
+        while pending:
+            ingested.add_batch(pending.popleft().result())
+    ingested.close()
+    return ingested
+
+def show_ingest_summary(ingested, elapsed_seconds=None):
+    """
+    取り込みの結果を表示する。
+
+    Args:
+        ingested (IngestedColumns): ingest_directoryの戻り値
+        elapsed_seconds (float): 処理時間（秒）
+    """
+    for path, error in ingested.errors:
+        print(f"❌ {os.path.relpath(path)}: {error}", file=sys.stderr)
+
+    summary = (f"\n📥 取り込み完了: {ingested.files}件, {ingested.rows}行"
+               f"（府県予報区{len(ingested.offices)}件, 地域{len(ingested.areas)}件, 失敗{len(ingested.errors)}件）")
+    if elapsed_seconds:
+        summary += f" {elapsed_seconds:.2f}秒, {ingested.files / elapsed_seconds:.1f}件/秒"
+    print(summary)
+    if ingested.output_dir:
+        print(f"💾 出力先: {ingested.output_dir}")
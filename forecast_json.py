@@ -0,0 +1,101 @@
+"""
+天気予報jsonの高速な解析
+
+orjsonがインストールされていればそれを使い、なければ標準のjsonモジュールを使う。
+"""
+
+import json
+import mmap
+import os
+
+from instrumentation import timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 使用するjsonライブラリ（auto: orjsonがあれば使用, orjson, json）
+FORECAST_JSON_BACKEND = os.getenv('FORECAST_JSON_BACKEND', 'auto')
+
+def _use_orjson():
+    if FORECAST_JSON_BACKEND == "json":
+        return False
+    if FORECAST_JSON_BACKEND == "orjson" and orjson is None:
+        raise ImportError("FORECAST_JSON_BACKEND=orjson ですが、orjsonがインストールされていません")
+    return orjson is not None
+
+def backend_name():
+    """
+    使用するjsonライブラリの名前を返す。
+    """
+    return "orjson" if _use_orjson() else "json"
+
+def loads(data):
+    """
+    jsonを解析する（orjsonがあればそれを使う）。
+
+    Args:
+        data (bytes | str): json
+
+    Returns:
+        解析結果
+
+    Raises:
+        json.JSONDecodeError: jsonとして解析できない場合（orjsonのエラーもこのサブクラス）
+    """
+    if _use_orjson():
+        return orjson.loads(data)
+    return json.loads(data)
+
+def loads_forecast(data):
+    """
+    天気予報jsonを解析する（所要時間を計測する）。
+
+    Args:
+        data (bytes | str): 天気予報json
+
+    Returns:
+        list: 天気予報データ（[0]=短期予報, [1]=週間予報）
+
+    Raises:
+        json.JSONDecodeError: jsonとして解析できない場合
+    """
+    with timer("decode", backend=backend_name()):
+        return loads(data)
+
+def load_forecast_file(path):
+    """
+    保存済みの天気予報jsonファイルを解析する。
+
+    Args:
+        path (str): ファイルのパス
+
+    Returns:
+        list: 天気予報データ
+    """
+    with open(path, "rb") as f:
+        return loads_forecast(f.read())
+
+def load_mapped(path):
+    """
+    天気予報jsonファイルをメモリマップして解析する。
+
+    orjsonの場合はマップした領域をそのまま解析するため、ファイル全体を読み込むコピーを作らない。
+
+    Args:
+        path (str): ファイルのパス
+
+    Returns:
+        list: 天気予報データ
+
+    Raises:
+        ValueError: 空のファイル、またはjsonとして解析できない場合
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if _use_orjson():
+                # memoryviewを解放してからマップを閉じる
+                with memoryview(mapped) as view:
+                    return orjson.loads(view)
+            return json.loads(mapped[:])
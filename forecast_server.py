@@ -0,0 +1,444 @@
+"""
+天気予報のHTTP APIサーバー（asyncio）
+
+抽出済みの天気・降水確率・予想気温を、府県予報区・地域・日付ごとのjsonとして返す。
+天気予報データは府県予報区ごとにメモリに保持し、気象庁の発表時刻（5時・11時・17時）まで
+そのまま使う。有効期限が切れた予報区を同時に複数のリクエストが参照した場合も、
+気象庁への取得は1回だけ行い、全員がその結果を待つ（シングルフライト）。
+作成したjsonは版ごとに保持するため、2回目以降の応答はメモリから返すだけで済む。
+
+エンドポイント:
+    GET /forecast/<府県予報区コード>                 全地域の予報
+    GET /forecast/<府県予報区コード>/<地域コード>    1地域の予報（?station=観測地点コード）
+    GET /weekly/<府県予報区コード>                   全地域の週間予報（7日分・平年差）
+    GET /health                                    保持している予報区と取得回数
+    （いずれも ?date=YYYY-MM-DD で対象日を指定、省略時は明日）
+"""
+
+import asyncio
+import json
+import os
+import re
+import signal
+from datetime import date, datetime, time as dt_time, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+import instrumentation
+import weather_forecast
+from forecast_cache import FORECAST_CACHE_RETRY_SECONDS, JST, compute_expiry, next_publish_time
+from forecast_index import ParsedForecast
+
+# 待ち受けるアドレスとポート
+FORECAST_SERVER_HOST = os.getenv('FORECAST_SERVER_HOST', '127.0.0.1')
+FORECAST_SERVER_PORT = int(os.getenv('FORECAST_SERVER_PORT', '8080'))
+
+# 発表時刻から、保持している予報区を取得し直すまでの待ち時間（秒）
+FORECAST_SERVER_REFRESH_DELAY_SECONDS = int(os.getenv('FORECAST_SERVER_REFRESH_DELAY_SECONDS', '60'))
+
+# 計測を有効にしている場合に、計測結果を書き出す間隔（秒）
+FORECAST_SERVER_METRICS_FLUSH_SECONDS = int(os.getenv('FORECAST_SERVER_METRICS_FLUSH_SECONDS', '60'))
+
+# リクエストヘッダーの大きさの上限（バイト）と、keep-alive接続の待ち時間（秒）
+_MAX_HEADER_BYTES = 16 * 1024
+_KEEP_ALIVE_SECONDS = 30
+
+# /forecast/<府県予報区コード>[/<地域コード>]
+_FORECAST_PATH_PATTERN = re.compile(r'^/forecast/(\d{6})(?:/(\d+))?/?$')
+
+# /weekly/<府県予報区コード>
+_WEEKLY_PATH_PATTERN = re.compile(r'^/weekly/(\d{6})/?$')
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            502: "Bad Gateway"}
+
+class HTTPError(Exception):
+    """
+    エラー応答（ステータスコードとメッセージ）。
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class CachedForecast:
+    """
+    1つの府県予報区の天気予報データと、作成済みの応答。
+    """
+
+    def __init__(self, office_code, forecast_data, fetched_at, expires_at):
+        self.office_code = office_code
+        self.forecast_data = forecast_data
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self._responses = {}
+
+    def response(self, target_date, area_code=None, station_code=None):
+        """
+        指定日・地域の応答（json）を作成する（同じ指定の2回目以降は作成済みのものを返す）。
+
+        Raises:
+            HTTPError: 該当日・地域のデータがない場合
+        """
+        key = (target_date, area_code, station_code)
+        body = self._responses.get(key)
+        if body is not None:
+            return body
+
+        selections = [(area_code, station_code)] if area_code else None
+        try:
+            forecasts = weather_forecast.extract_area_forecasts(
+                self.forecast_data, datetime.combine(target_date, dt_time(), JST), selections)
+        except ValueError as e:
+            raise HTTPError(404, str(e))
+
+        document = {
+            "office_code": self.office_code,
+            "publishing_office": self.forecast_data.publishing_office,
+            "report_datetime": self.forecast_data.report_datetime,
+            "date": target_date.isoformat(),
+            "expires_at": self.expires_at.isoformat(),
+        }
+        if area_code:
+            document["forecast"] = forecasts[0]
+        else:
+            document["areas"] = forecasts
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        self._responses[key] = body
+        return body
+
+    def weekly_response(self):
+        """
+        全地域の週間予報の応答（json）を作成する（2回目以降は作成済みのものを返す）。
+        """
+        from forecast_weekly import get_weekly_forecast
+
+        body = self._responses.get("weekly")
+        if body is not None:
+            return body
+        try:
+            weekly = get_weekly_forecast(self.forecast_data)
+        except ValueError as e:
+            raise HTTPError(404, str(e))
+        document = {
+            "office_code": self.office_code,
+            "publishing_office": weekly.publishing_office,
+            "report_datetime": weekly.report_datetime,
+            "expires_at": self.expires_at.isoformat(),
+            "areas": weekly.to_records(),
+        }
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        self._responses["weekly"] = body
+        return body
+
+def _fetch_with_fallback(office_code):
+    """
+    天気予報データを時間の上限つきで取得する（間に合わない・失敗した場合は前回取得した予報）。
+
+    Returns:
+        tuple: (天気予報データ, 前回取得した予報かどうか)
+    """
+    from upstream_fallback import describe_stale
+
+    fetched = weather_forecast.fetch_forecast_data_with_fallback(office_code)
+    if fetched.stale:
+        print(f"⚠️  {office_code}: 前回取得した予報を返します（{describe_stale(fetched)}）")
+    return fetched.value, fetched.stale
+
+class ForecastMemoryCache:
+    """
+    府県予報区ごとの天気予報データのメモリキャッシュ（取得はシングルフライト）。
+    """
+
+    def __init__(self, fetch=None):
+        """
+        Args:
+            fetch (callable): 府県予報区コードから天気予報データを取得する関数（スレッドで実行）
+                              （省略時はフォールバック・サーキットブレーカーつきで取得し、
+                              前回取得した予報を返した場合はFORECAST_CACHE_RETRY_SECONDS後に取得し直す）
+        """
+        self._fetch = fetch
+        self._entries = {}
+        self._inflight = {}
+        self.upstream_fetches = 0
+
+    @property
+    def office_codes(self):
+        return list(self._entries)
+
+    def peek(self, office_code):
+        return self._entries.get(office_code)
+
+    async def get(self, office_code, now=None):
+        """
+        天気予報データを取得する（有効期限内であればメモリから返す）。
+
+        Returns:
+            CachedForecast: 天気予報データ
+        """
+        if now is None:
+            now = datetime.now(JST)
+        entry = self._entries.get(office_code)
+        if entry is not None and now < entry.expires_at:
+            instrumentation.increment("server_cache", result="hit")
+            return entry
+        instrumentation.increment("server_cache", result="miss")
+        return await self.refresh(office_code)
+
+    async def refresh(self, office_code):
+        """
+        天気予報データを取得し直す（取得中の予報区は、その結果を待つ）。
+        """
+        task = self._inflight.get(office_code)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(office_code))
+            self._inflight[office_code] = task
+            task.add_done_callback(lambda _: self._inflight.pop(office_code, None))
+        # 待っているリクエストが切断されても、取得自体は続ける
+        return await asyncio.shield(task)
+
+    def _load(self, office_code):
+        if self._fetch is None:
+            forecast_data, stale = _fetch_with_fallback(office_code)
+        else:
+            forecast_data, stale = self._fetch(office_code), False
+        return ParsedForecast(forecast_data), stale
+
+    async def _refresh(self, office_code):
+        loop = asyncio.get_running_loop()
+        self.upstream_fetches += 1
+        forecast_data, stale = await loop.run_in_executor(None, self._load, office_code)
+        now = datetime.now(JST)
+        if stale:
+            expires_at = now + timedelta(seconds=FORECAST_CACHE_RETRY_SECONDS)
+        else:
+            expires_at = compute_expiry(forecast_data.report_datetime, now)
+        entry = CachedForecast(office_code, forecast_data, now, expires_at)
+        self._entries[office_code] = entry
+        return entry
+
+    async def refresh_all(self):
+        """
+        保持しているすべての予報区を取得し直す（失敗した予報区は古いデータのまま）。
+        """
+        office_codes = self.office_codes
+        results = await asyncio.gather(*(self.refresh(code) for code in office_codes),
+                                       return_exceptions=True)
+        for office_code, result in zip(office_codes, results):
+            if isinstance(result, Exception):
+                print(f"⚠️  {office_code} の更新に失敗しました: {type(result).__name__}: {result}")
+
+def _parse_date(query):
+    values = query.get("date")
+    if not values:
+        return (datetime.now(JST) + timedelta(days=1)).date()
+    try:
+        return date.fromisoformat(values[0])
+    except ValueError:
+        raise HTTPError(400, f"日付の形式が正しくありません: {values[0]}（YYYY-MM-DD）")
+
+class ForecastServer:
+    """
+    天気予報のjsonを返すHTTPサーバー。
+    """
+
+    def __init__(self, cache=None, office_codes=()):
+        """
+        Args:
+            cache (ForecastMemoryCache): 天気予報データのキャッシュ（省略時は作成）
+            office_codes (iterable): 起動時に取得しておく府県予報区コード
+        """
+        self.cache = cache or ForecastMemoryCache()
+        self.office_codes = list(office_codes)
+        self._server = None
+        self._refresher = None
+        self._metrics_flusher = None
+        self._connections = set()
+
+    async def handle_path(self, target):
+        """
+        リクエストのパスから応答を作成する。
+
+        Returns:
+            tuple: (ステータスコード, 応答の本文)
+        """
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path in ("/health", "/health/"):
+            offices = {}
+            for office_code in self.cache.office_codes:
+                entry = self.cache.peek(office_code)
+                offices[office_code] = {
+                    "report_datetime": entry.forecast_data.report_datetime,
+                    "fetched_at": entry.fetched_at.isoformat(),
+                    "expires_at": entry.expires_at.isoformat(),
+                }
+            document = {"status": "ok", "offices": offices, "upstream_fetches": self.cache.upstream_fetches}
+            return 200, json.dumps(document, ensure_ascii=False).encode("utf-8")
+
+        weekly_match = _WEEKLY_PATH_PATTERN.match(url.path)
+        if weekly_match:
+            entry = await self._get_entry(weekly_match.group(1))
+            return 200, entry.weekly_response()
+
+        match = _FORECAST_PATH_PATTERN.match(url.path)
+        if not match:
+            raise HTTPError(404, f"不明なパスです: {url.path}")
+        office_code, area_code = match.groups()
+        target_date = _parse_date(query)
+        station_code = query.get("station", [None])[0]
+        entry = await self._get_entry(office_code)
+        return 200, entry.response(target_date, area_code, station_code)
+
+    async def _get_entry(self, office_code):
+        """
+        府県予報区の天気予報データを取得する（取得の失敗はエラー応答に変換する）。
+        """
+        try:
+            return await self.cache.get(office_code)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 404:
+                raise HTTPError(404, f"府県予報区コード {office_code} が見つかりません")
+            raise HTTPError(502, f"天気予報の取得に失敗しました: {e}")
+        except Exception as e:
+            raise HTTPError(502, f"天気予報の取得に失敗しました: {type(e).__name__}: {e}")
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), _KEEP_ALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._write_response(writer, 400, {"error": "リクエストヘッダーが大きすぎます"}, False)
+                    return
+
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    await self._write_response(writer, 400, {"error": "リクエストが不正です"}, False)
+                    return
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                with instrumentation.timer("server_request"):
+                    if method not in ("GET", "HEAD"):
+                        status, body = 405, {"error": f"{method} には対応していません"}
+                    else:
+                        try:
+                            status, body = await self.handle_path(target)
+                        except HTTPError as e:
+                            status, body = e.status, {"error": str(e)}
+                    await self._write_response(writer, status, body, keep_alive, head_only=method == "HEAD")
+                if not keep_alive:
+                    return
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _write_response(self, writer, status, body, keep_alive, head_only=False):
+        if isinstance(body, dict):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        header = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        ).encode("latin-1")
+        writer.write(header if head_only else header + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _refresh_forever(self):
+        """
+        発表時刻ごとに、保持しているすべての予報区を取得し直す。
+        """
+        while True:
+            now = datetime.now(JST)
+            refresh_at = next_publish_time(now) + timedelta(seconds=FORECAST_SERVER_REFRESH_DELAY_SECONDS)
+            await asyncio.sleep((refresh_at - now).total_seconds())
+            await self.cache.refresh_all()
+
+    async def _flush_metrics_forever(self):
+        """
+        常駐中も一定の間隔で計測結果を書き出す（ファイルへの書き込みは別スレッドで行う）。
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FORECAST_SERVER_METRICS_FLUSH_SECONDS)
+            await loop.run_in_executor(None, instrumentation.flush_metrics)
+
+    async def start(self, host=None, port=None):
+        """
+        サーバーを起動する（指定された予報区は先に取得しておく）。
+
+        Returns:
+            list: 待ち受けているアドレスのリスト
+        """
+        if self.office_codes:
+            await asyncio.gather(*(self.cache.refresh(code) for code in self.office_codes),
+                                 return_exceptions=True)
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            FORECAST_SERVER_HOST if host is None else host,
+            FORECAST_SERVER_PORT if port is None else port,
+            limit=_MAX_HEADER_BYTES,
+        )
+        self._refresher = asyncio.ensure_future(self._refresh_forever())
+        if instrumentation.enabled():
+            self._metrics_flusher = asyncio.ensure_future(self._flush_metrics_forever())
+        return [sock.getsockname() for sock in self._server.sockets]
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+        if self._metrics_flusher is not None:
+            self._metrics_flusher.cancel()
+        if self._server is not None:
+            self._server.close()
+            # keep-alive接続を閉じて、待機中の処理を終わらせる
+            for writer in list(self._connections):
+                writer.close()
+            while self._connections:
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+
+async def _serve(host, port, office_codes):
+    server = ForecastServer(office_codes=office_codes)
+    addresses = await server.start(host, port)
+    for address in addresses:
+        print(f"🌐 天気予報APIサーバーを開始しました: http://{address[0]}:{address[1]}/forecast/{weather_forecast.OFFICE_CODE}")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    await stopped.wait()
+    await server.close()
+    instrumentation.flush_metrics()
+    print("🛑 天気予報APIサーバーを停止しました")
+
+def run_server(host=None, port=None, office_codes=()):
+    """
+    天気予報APIサーバーを起動する（SIGINT/SIGTERMで停止）。
+
+    Args:
+        host (str): 待ち受けるアドレス（省略時はFORECAST_SERVER_HOST）
+        port (int): 待ち受けるポート（省略時はFORECAST_SERVER_PORT）
+        office_codes (iterable): 起動時に取得しておく府県予報区コード
+    """
+    asyncio.run(_serve(host, port, list(office_codes)))
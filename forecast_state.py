@@ -0,0 +1,189 @@
+"""
+天気予報の変化の検出
+
+地域と対象日ごとに、天気コード・降水確率・最高/最低気温から求めた指紋（ハッシュ値）を
+小さなjsonファイルに保存しておき、前回の通知から予報が変わったかどうかを判定する。
+変わっていなければメッセージの作成と通知を省略し、変わっていれば変更点をまとめる。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from weather_codes import get_weather_description
+
+# 変化の検出を行うかどうか（FORECAST_CHANGE_DETECTION=0で無効化）
+FORECAST_CHANGE_DETECTION = os.getenv('FORECAST_CHANGE_DETECTION', '1') != '0'
+
+# 状態の保存先
+FORECAST_STATE_PATH = os.getenv(
+    'FORECAST_STATE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "forecast_state.json"),
+)
+
+# 対象日からこの日数を過ぎた状態は削除する
+FORECAST_STATE_KEEP_DAYS = int(os.getenv('FORECAST_STATE_KEEP_DAYS', '7'))
+
+# 指紋の対象とする項目と、変更点の表示名
+FINGERPRINT_FIELDS = (
+    ("weather_code", "天気"),
+    ("rain_values", "降水確率"),
+    ("max_forecast", "最高気温"),
+    ("min_forecast", "最低気温"),
+)
+
+def state_key(office_code, area_name, target_date):
+    """
+    状態のキー（府県予報区コード/地域名/対象日）を作成する。
+    """
+    if isinstance(target_date, datetime):
+        target_date = target_date.date()
+    return f"{office_code}/{area_name}/{target_date.isoformat()}"
+
+def _canonical_value(name, value):
+    # 数値は文字列・floatのどちらで渡されても同じ値になるようにそろえる
+    if name == "rain_values":
+        return [str(v) for v in value or []]
+    if name in ("max_forecast", "min_forecast") and value not in (None, ""):
+        return f"{float(value):.1f}"
+    return None if value is None else str(value)
+
+def forecast_fingerprint(fields):
+    """
+    予報の項目から指紋を求める。
+
+    Args:
+        fields (dict): FINGERPRINT_FIELDSの項目を含む辞書（with_actualがあれば含める）
+
+    Returns:
+        str: 指紋（SHA-256の16進文字列の先頭16文字）
+    """
+    canonical = [_canonical_value(name, fields.get(name)) for name, _ in FINGERPRINT_FIELDS]
+    canonical.append(bool(fields.get("with_actual")))
+    encoded = json.dumps(canonical, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def _display(name, value):
+    if value is None:
+        return "なし"
+    if name == "weather_code":
+        return get_weather_description(value)
+    if name == "rain_values":
+        return "/".join(f"{v}%" for v in value)
+    return f"{value}℃"
+
+def format_change_message(previous, current):
+    """
+    前回と今回の予報の変更点をまとめたメッセージを作成する。
+
+    Args:
+        previous (dict): 前回の項目（FINGERPRINT_FIELDSの項目）
+        current (dict): 今回の項目
+
+    Returns:
+        str: 変更点のメッセージ（変更がなければ空文字列）
+    """
+    lines = []
+    for name, label in FINGERPRINT_FIELDS:
+        if _canonical_value(name, previous.get(name)) == _canonical_value(name, current.get(name)):
+            continue
+        lines.append(f"- {label}：{_display(name, previous.get(name))} → {_display(name, current.get(name))}")
+    if not lines:
+        return ""
+    return "### 前回の通知からの変更点\n" + "\n".join(lines)
+
+class ForecastStateStore:
+    """
+    地域・対象日ごとの最新の指紋を保持するjsonファイル。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or FORECAST_STATE_PATH
+        self._lock = threading.Lock()
+        self._states = None
+
+    def _load(self):
+        if self._states is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._states = json.load(f)
+            except (OSError, ValueError):
+                self._states = {}
+        return self._states
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._states, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """
+        保存済みの状態を取得する。
+
+        Returns:
+            dict: {"fingerprint", "fields", "updated_at"}（なければNone）
+        """
+        with self._lock:
+            return self._load().get(key)
+
+    def check(self, key, fields):
+        """
+        予報が前回の記録から変わったかどうかを判定する（記録はしない）。
+
+        Args:
+            key (str): state_keyで作成したキー
+            fields (dict): FINGERPRINT_FIELDSの項目を含む辞書
+
+        Returns:
+            tuple: (変わったかどうか, 前回の項目（初回はNone）, 今回の指紋)
+        """
+        fingerprint = forecast_fingerprint(fields)
+        previous = self.get(key)
+        if previous is None:
+            return True, None, fingerprint
+        return previous["fingerprint"] != fingerprint, previous["fields"], fingerprint
+
+    def record(self, key, fields, fingerprint=None):
+        """
+        今回の予報を記録する（対象日がFORECAST_STATE_KEEP_DAYSより古い記録は削除する）。
+        """
+        if fingerprint is None:
+            fingerprint = forecast_fingerprint(fields)
+        stored_fields = {name: fields.get(name) for name, _ in FINGERPRINT_FIELDS}
+        stored_fields["with_actual"] = bool(fields.get("with_actual"))
+        with self._lock:
+            states = self._load()
+            states[key] = {
+                "fingerprint": fingerprint,
+                "fields": stored_fields,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            # 最も新しい対象日を基準にする（記録済みデータのリプレイでも消えすぎないように）
+            newest = max(k.rsplit("/", 1)[-1] for k in states)
+            cutoff = (date.fromisoformat(newest) - timedelta(days=FORECAST_STATE_KEEP_DAYS)).isoformat()
+            for old_key in [k for k in states if k.rsplit("/", 1)[-1] < cutoff]:
+                del states[old_key]
+            self._save()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_forecast_state_store():
+    """
+    プロセス内で共有する状態の保存先を取得する（初回呼び出し時に作成）。
+
+    Returns:
+        ForecastStateStore: 共有の保存先
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ForecastStateStore()
+    return _store
@@ -0,0 +1,329 @@
+"""
+予報気温の検証（予報と実測の比較）
+
+アーカイブに保存した予報の最高・最低気温と、観測データHTMLから保存した実測値を
+地点・リードタイム（発表時刻から対象日の0時までの時間）ごとに突き合わせ、
+誤差（予報 - 実測）の平均（バイアス）・平均絶対誤差（MAE）・二乗平均平方根誤差（RMSE）を求める。
+
+統計量は誤差の和・絶対値の和・二乗和として保持し、新しい日の誤差を足し込むだけで更新する。
+直近VERIFICATION_WINDOW_DAYS日の統計量も、期間から外れた日の誤差を差し引いて更新する。
+"""
+
+import math
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from forecast_archive import (
+    BLOCK_SHORT_TERM,
+    BLOCK_WEEKLY,
+    FORECAST_ARCHIVE_PATH,
+    JST,
+    ForecastArchive,
+)
+
+# 直近の統計量を求める期間（日数）
+VERIFICATION_WINDOW_DAYS = int(os.getenv('VERIFICATION_WINDOW_DAYS', '30'))
+
+# 検証に使う予報の項目: (区分, 項目名) → 要素（"max"=最高気温, "min"=最低気温）
+# 短期予報のtempsは0時が最低気温、9時が最高気温を表す
+_FORECAST_ELEMENTS = {
+    (BLOCK_WEEKLY, "tempsMax"): "max",
+    (BLOCK_WEEKLY, "tempsMin"): "min",
+}
+_SHORT_TERM_TEMP_HOURS = {0: "min", 9: "max"}
+
+# 検証結果の1行
+VerificationStats = namedtuple(
+    "VerificationStats",
+    ["station_code", "element", "block", "lead_hours", "count", "bias", "mae", "rmse",
+     "window_count", "window_bias", "window_mae", "window_rmse", "last_date"],
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verification_errors (
+    station_code TEXT NOT NULL,
+    element TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    lead_hours INTEGER NOT NULL,
+    target_date TEXT NOT NULL,
+    error REAL NOT NULL,
+    PRIMARY KEY (station_code, element, block, lead_hours, target_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS verification_stats (
+    station_code TEXT NOT NULL,
+    element TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    lead_hours INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    sum_error REAL NOT NULL,
+    sum_abs_error REAL NOT NULL,
+    sum_sq_error REAL NOT NULL,
+    window_n INTEGER NOT NULL,
+    window_sum_error REAL NOT NULL,
+    window_sum_abs_error REAL NOT NULL,
+    window_sum_sq_error REAL NOT NULL,
+    last_date TEXT NOT NULL,
+    PRIMARY KEY (station_code, element, block, lead_hours)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS verified_days (
+    station_code TEXT NOT NULL,
+    target_date TEXT NOT NULL,
+    PRIMARY KEY (station_code, target_date)
+) WITHOUT ROWID;
+"""
+
+def _summarize(n, sum_error, sum_abs_error, sum_sq_error):
+    if n == 0:
+        return None, None, None
+    return sum_error / n, sum_abs_error / n, math.sqrt(sum_sq_error / n)
+
+class ForecastVerifier:
+    """
+    アーカイブの予報と実測を突き合わせて、検証の統計量を更新・取得する。
+
+    統計量はアーカイブと同じSQLiteファイルに保存する。
+    """
+
+    def __init__(self, archive=None, window_days=None):
+        self.archive = archive or ForecastArchive()
+        self.window_days = VERIFICATION_WINDOW_DAYS if window_days is None else window_days
+        self._connection = sqlite3.connect(self.archive.path)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _forecast_errors(self, station_code, target_date, observation):
+        """
+        指定地点・指定日の予報誤差を、(要素, 区分, リードタイム) ごとに求める。
+        """
+        day_start = datetime(target_date.year, target_date.month, target_date.day, tzinfo=JST)
+        day_end = day_start + timedelta(days=1)
+        observed = {"max": observation.max_temp, "min": observation.min_temp}
+
+        errors = {}
+        for value in self.archive.query(station_code, day_start, day_end,
+                                        fields=("temps", "tempsMax", "tempsMin")):
+            if value.value is None:
+                continue
+            # 対象日より前に発表された予報のみを検証する
+            # （当日発表分の最低気温は実況で置き換えられているため対象外）
+            if value.report_datetime >= day_start:
+                continue
+            if value.block == BLOCK_SHORT_TERM:
+                element = _SHORT_TERM_TEMP_HOURS.get(value.target_time.hour)
+            else:
+                element = _FORECAST_ELEMENTS.get((value.block, value.field))
+            if element is None or observed[element] is None:
+                continue
+
+            lead_hours = int((day_start - value.report_datetime).total_seconds() // 3600)
+            errors[(element, value.block, lead_hours)] = value.value - observed[element]
+        return errors
+
+    def _add_error(self, station_code, element, block, lead_hours, target_date_str, error):
+        """
+        1件の誤差を統計量に足し込む（直近期間から外れた日の誤差は差し引く）。
+        """
+        key = (station_code, element, block, lead_hours)
+        row = self._connection.execute(
+            "SELECT n, sum_error, sum_abs_error, sum_sq_error, window_n, window_sum_error,"
+            " window_sum_abs_error, window_sum_sq_error, last_date FROM verification_stats"
+            " WHERE station_code = ? AND element = ? AND block = ? AND lead_hours = ?", key,
+        ).fetchone()
+        if row is None:
+            row = (0, 0.0, 0.0, 0.0, 0, 0.0, 0.0, 0.0, None)
+        n, sum_error, sum_abs_error, sum_sq_error, window_n, window_sum_error, \
+            window_sum_abs_error, window_sum_sq_error, last_date = row
+
+        n += 1
+        sum_error += error
+        sum_abs_error += abs(error)
+        sum_sq_error += error * error
+
+        window = timedelta(days=self.window_days)
+        if last_date is None or target_date_str > last_date:
+            if last_date is not None:
+                # 新しい日が加わって直近期間から外れた日の誤差を差し引く
+                old_start = (date.fromisoformat(last_date) - window).isoformat()
+                new_start = (date.fromisoformat(target_date_str) - window).isoformat()
+                for (dropped,) in self._connection.execute(
+                        "SELECT error FROM verification_errors"
+                        " WHERE station_code = ? AND element = ? AND block = ? AND lead_hours = ?"
+                        " AND target_date > ? AND target_date <= ?", key + (old_start, new_start)):
+                    window_n -= 1
+                    window_sum_error -= dropped
+                    window_sum_abs_error -= abs(dropped)
+                    window_sum_sq_error -= dropped * dropped
+            last_date = target_date_str
+
+        if target_date_str > (date.fromisoformat(last_date) - window).isoformat():
+            window_n += 1
+            window_sum_error += error
+            window_sum_abs_error += abs(error)
+            window_sum_sq_error += error * error
+
+        self._connection.execute(
+            "INSERT INTO verification_errors VALUES (?, ?, ?, ?, ?, ?)", key + (target_date_str, error))
+        self._connection.execute(
+            "INSERT OR REPLACE INTO verification_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            key + (n, sum_error, sum_abs_error, sum_sq_error, window_n, window_sum_error,
+                   window_sum_abs_error, window_sum_sq_error, last_date),
+        )
+
+    def add_day(self, station_code, target_date):
+        """
+        指定地点・指定日の予報誤差を統計量に反映する（反映済みの日は何もしない）。
+
+        誤差を1件以上反映できた日だけを反映済みとして記録する。
+        予報がまだアーカイブにない日は記録しないため、後から予報を保存すれば再び対象になる。
+
+        Args:
+            station_code (str): 観測地点のコード（例: "60131"）
+            target_date (date): 検証する日
+
+        Returns:
+            int: 反映した誤差の件数（観測値・予報がない、反映済みの場合は0）
+        """
+        target_date_str = target_date.isoformat()
+        if self._connection.execute(
+                "SELECT 1 FROM verified_days WHERE station_code = ? AND target_date = ?",
+                (station_code, target_date_str)).fetchone():
+            return 0
+
+        station_name = self.archive.area_name(station_code)
+        if station_name is None:
+            return 0
+        observation = self.archive.get_observation(station_name, target_date)
+        if observation is None:
+            return 0
+
+        errors = self._forecast_errors(station_code, target_date, observation)
+        if not errors:
+            return 0
+        with self._connection:
+            for (element, block, lead_hours), error in sorted(errors.items()):
+                self._add_error(station_code, element, block, lead_hours, target_date_str, error)
+            self._connection.execute(
+                "INSERT INTO verified_days VALUES (?, ?)", (station_code, target_date_str))
+        return len(errors)
+
+    def update(self, until=None):
+        """
+        未反映の観測日をすべて統計量に反映する。
+
+        当日の観測値は確定していないため、until（省略時は今日）より前の日のみを対象とする。
+        最も古い保存済みの発表より前の日は、検証できる予報がないため対象としない。
+
+        Args:
+            until (date): この日より前の観測日を反映する
+
+        Returns:
+            int: 誤差を反映した日数（地点 × 日）
+        """
+        if until is None:
+            until = datetime.now(JST).date()
+
+        pending = self._connection.execute(
+            "SELECT areas.area_code, observations.observed_date"
+            " FROM observations JOIN areas ON areas.area_name = observations.station_name"
+            " WHERE observations.observed_date < ?"
+            " AND observations.observed_date > (SELECT date(MIN(report_datetime), 'unixepoch', '+9 hours')"
+            "   FROM snapshots)"
+            " AND NOT EXISTS (SELECT 1 FROM verified_days"
+            "   WHERE verified_days.station_code = areas.area_code"
+            "   AND verified_days.target_date = observations.observed_date)"
+            " ORDER BY observations.observed_date, areas.area_code",
+            (until.isoformat(),),
+        ).fetchall()
+
+        updated_days = 0
+        for station_code, observed_date in pending:
+            if self.add_day(station_code, date.fromisoformat(observed_date)):
+                updated_days += 1
+        return updated_days
+
+    def stats(self, station_code=None):
+        """
+        検証の統計量を取得する。
+
+        Args:
+            station_code (str): 観測地点のコードで絞り込む場合に指定
+
+        Returns:
+            list: VerificationStatsのリスト（地点・要素・区分・リードタイムの順）
+        """
+        sql = "SELECT * FROM verification_stats"
+        params = []
+        if station_code is not None:
+            sql += " WHERE station_code = ?"
+            params.append(station_code)
+        sql += " ORDER BY station_code, element, block, lead_hours"
+
+        results = []
+        for row in self._connection.execute(sql, params):
+            (code, element, block, lead_hours, n, sum_error, sum_abs_error, sum_sq_error,
+             window_n, window_sum_error, window_sum_abs_error, window_sum_sq_error, last_date) = row
+            bias, mae, rmse = _summarize(n, sum_error, sum_abs_error, sum_sq_error)
+            window_bias, window_mae, window_rmse = _summarize(
+                window_n, window_sum_error, window_sum_abs_error, window_sum_sq_error)
+            results.append(VerificationStats(
+                code, element, block, lead_hours, n, bias, mae, rmse,
+                window_n, window_bias, window_mae, window_rmse, last_date))
+        return results
+
+def show_verification(stats, window_days=None):
+    """
+    検証の統計量を一覧表示する。
+
+    Args:
+        stats (list): ForecastVerifier.statsの戻り値
+        window_days (int): 直近期間の日数（表示用）
+    """
+    if window_days is None:
+        window_days = VERIFICATION_WINDOW_DAYS
+    element_names = {"max": "最高", "min": "最低"}
+    block_names = {BLOCK_SHORT_TERM: "短期", BLOCK_WEEKLY: "週間"}
+
+    print(f"\n" + "="*60)
+    print(f"📈 予報気温の検証結果（誤差 = 予報 - 実測）")
+    print(f"="*60)
+    if not stats:
+        print("   ⚠️  検証できるデータがありません")
+    for s in stats:
+        line = (f"{s.station_code} {element_names[s.element]} {block_names[s.block]} "
+                f"{s.lead_hours:>3}h前: n={s.count} バイアス{s.bias:+.2f} MAE{s.mae:.2f} RMSE{s.rmse:.2f}")
+        if s.window_count:
+            line += (f" / 直近{window_days}日 n={s.window_count} バイアス{s.window_bias:+.2f}"
+                     f" MAE{s.window_mae:.2f} RMSE{s.window_rmse:.2f}")
+        print(line)
+    print(f"="*60)
+
+def run_verification(station_code=None, archive_path=None):
+    """
+    未反映の観測日を統計量に反映し、結果を表示する。
+
+    Args:
+        station_code (str): 観測地点のコードで絞り込む場合に指定
+        archive_path (str): アーカイブの保存先（省略時はFORECAST_ARCHIVE_PATH）
+
+    Returns:
+        list: VerificationStatsのリスト
+    """
+    with ForecastArchive(archive_path or FORECAST_ARCHIVE_PATH) as archive:
+        with ForecastVerifier(archive) as verifier:
+            updated_days = verifier.update()
+            print(f"🔍 検証データを更新しました: {updated_days}件")
+            stats = verifier.stats(station_code)
+    show_verification(stats)
+    return stats
@@ -0,0 +1,319 @@
+"""
+週間天気予報と平年値の抽出
+
+天気予報データの[1]（週間予報）から、全地域の7日分の天気・降水確率・信頼度、
+予想最高/最低気温とその予測範囲（Upper/Lower）、平年値（tempAverage/precipAverage）を
+まとめて取り出し、予想気温の平年差（予想 - 平年値）を地点ごとに求める。
+項目ごとの行列（ForecastMatrix）を1回作るだけで全地域・全日を処理し、
+結果は発表元・発表時刻ごとに保持して同じ版を二度処理しない。
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from forecast_columns import extract_forecast_columns, reliability_label
+from forecast_index import ParsedForecast
+from weather_codes import get_weather_description
+
+# 発表時刻ごとに保持する結果の数
+WEEKLY_CACHE_SIZE = 64
+
+# 地域コードと気温の地点コードの対応（"250000:60131,130010:44132"のように指定）
+# 指定がない地域は、地域と地点の数が同じ場合に限り、週間予報の中で同じ位置にあるものを組にする
+WEEKLY_STATION_AREAS = os.getenv('WEEKLY_STATION_AREAS', '')
+
+# 地点ごとの予想気温の項目と、対応する平年値（tempAverageのmin/max）
+TEMPERATURE_FIELDS = (
+    ("tempsMin", "min"),
+    ("tempsMax", "max"),
+)
+
+# 日ごとの値として出力する項目（出力名, 行列の項目名）
+_AREA_DAY_FIELDS = (
+    ("weather_code", "weatherCodes"),
+    ("pop", "pops"),
+    ("reliability", "reliabilities"),
+)
+_STATION_DAY_FIELDS = (
+    ("temp_min", "tempsMin"),
+    ("temp_min_upper", "tempsMinUpper"),
+    ("temp_min_lower", "tempsMinLower"),
+    ("temp_max", "tempsMax"),
+    ("temp_max_upper", "tempsMaxUpper"),
+    ("temp_max_lower", "tempsMaxLower"),
+)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _optional(value):
+    """
+    行列の値を出力用に変換する（欠損値はNone）。
+    """
+    if isinstance(value, float):
+        return None if math.isnan(value) else value
+    return None if value < 0 else value
+
+def parse_station_areas(text):
+    """
+    "地域コード:地点コード"のカンマ区切りを辞書に変換する。
+
+    Args:
+        text (str): WEEKLY_STATION_AREASの形式の文字列
+
+    Returns:
+        dict: 地域コード → 地点コード
+    """
+    station_areas = {}
+    for pair in text.split(","):
+        if ":" in pair:
+            area_code, station_code = pair.split(":", 1)
+            station_areas[area_code.strip()] = station_code.strip()
+    return station_areas
+
+def pair_stations(area_codes, station_codes, station_areas=None):
+    """
+    地域ごとに、気温の地点の位置を求める。
+
+    対応表にある地域はその地点と組にする。対応表にない地域は、地域と地点の数が同じ場合に限り
+    同じ位置の地点と組にし、数が異なる場合は組にしない（地点の取り違えを避ける）。
+
+    Args:
+        area_codes (list): 地域コードのリスト
+        station_codes (list): 地点コードのリスト
+        station_areas (dict): 地域コード → 地点コード（省略時は対応表なし）
+
+    Returns:
+        list: 地域ごとの地点の位置（組にする地点がない場合はNone）
+    """
+    station_positions = {code: i for i, code in enumerate(station_codes)}
+    positional = len(area_codes) == len(station_codes)
+    pairs = []
+    for area_index, area_code in enumerate(area_codes):
+        if station_areas and area_code in station_areas:
+            pairs.append(station_positions.get(station_areas[area_code]))
+        else:
+            pairs.append(area_index if positional else None)
+    return pairs
+
+def _rows(matrix, row_indexes, n_dates, column_indexes=None):
+    """
+    行列の指定行を、出力用の値（欠損値はNone）のリストとしてまとめて取り出す。
+
+    Args:
+        matrix (ForecastMatrix): 行列（Noneの場合は全行がNone）
+        row_indexes (list): 取り出す行の位置（Noneの行は全列がNone）
+        n_dates (int): 週間予報の日数（項目がない場合の行の長さ）
+        column_indexes (list): 取り出す列の位置（省略時は全列、Noneの列はNone）
+
+    Returns:
+        list: 行ごとの値のリスト
+    """
+    empty = [None] * n_dates
+    if matrix is None:
+        return [empty for _ in row_indexes]
+
+    # 配列を一度にPythonの値のリストに変換し、行はスライスで取り出す
+    n_times = len(matrix.time_defines)
+    values = matrix.values.tolist()
+    if matrix.typecode == 'd':
+        values = [None if value != value else value for value in values]
+    else:
+        values = [None if value < 0 else value for value in values]
+
+    rows = []
+    for row_index in row_indexes:
+        if row_index is None:
+            rows.append(empty)
+            continue
+        row = values[row_index * n_times:(row_index + 1) * n_times]
+        if column_indexes is not None:
+            row = [row[column] if column is not None else None for column in column_indexes]
+        rows.append(row)
+    return rows
+
+def temperature_anomalies(matrix, averages, key):
+    """
+    予想気温の行列から、地点ごとの平年差（予想 - 平年値）の行列を作成する。
+
+    Args:
+        matrix (ForecastMatrix): 予想気温（tempsMin/tempsMax）の行列
+        averages (dict): extract_forecast_columnsのtemp_average
+        key (str): 平年値の項目（"min" / "max"）
+
+    Returns:
+        ForecastMatrix: 平年差の行列（平年値がない地点・欠損値はNaN）
+    """
+    normals = {}
+    if averages:
+        normals = dict(zip(averages["area_codes"], averages[key]))
+    # NaNとの差はNaNになるため、欠損値・平年値なしはそのままNaNになる
+    offsets = [normals.get(area_code, math.nan) for area_code in matrix.area_codes]
+    return matrix.subtract_rows(f"{matrix.field}Anomaly", offsets)
+
+class WeeklyForecast:
+    """
+    1つの府県予報区の週間予報（全地域・全日）。
+
+    Attributes:
+        publishing_office (str): 発表元
+        report_datetime (str): 週間予報の発表時刻
+        dates (list): 対象日（"YYYY-MM-DD"）のリスト
+        matrices (dict): 項目名 → ForecastMatrix（weatherCodes, pops, reliabilities, tempsMin/Max...）
+        anomalies (dict): "tempsMin" / "tempsMax" → 平年差のForecastMatrix
+        temp_average (dict): 地点ごとの気温の平年値（ない場合はNone）
+        precip_average (dict): 地点ごとの7日間降水量の平年並の範囲（ない場合はNone）
+        station_areas (dict): 地域コード → 気温の地点コードの対応表
+    """
+
+    def __init__(self, forecast_data, station_areas=None):
+        if not isinstance(forecast_data, ParsedForecast):
+            forecast_data = ParsedForecast(forecast_data)
+        if not forecast_data.weekly:
+            raise ValueError("週間予報のデータがありません")
+
+        weekly_raw = forecast_data.raw[1]
+        columns = extract_forecast_columns(forecast_data)
+        self.publishing_office = weekly_raw.get("publishingOffice", forecast_data.publishing_office)
+        self.report_datetime = weekly_raw.get("reportDatetime", forecast_data.report_datetime)
+        self.matrices = columns["weekly"]
+        self.temp_average = columns["temp_average"]
+        self.precip_average = columns["precip_average"]
+        self.station_areas = (parse_station_areas(WEEKLY_STATION_AREAS)
+                              if station_areas is None else dict(station_areas))
+
+        self.anomalies = {
+            field: temperature_anomalies(self.matrices[field], self.temp_average, key)
+            for field, key in TEMPERATURE_FIELDS if field in self.matrices
+        }
+
+        area_matrix = self.matrices["weatherCodes"]
+        self.dates = [time_define[:10] for time_define in area_matrix.time_defines]
+
+    def _station_matrix(self):
+        return self.matrices.get("tempsMax") or self.matrices.get("tempsMin")
+
+    def to_records(self):
+        """
+        地域ごとの7日分の予報を辞書のリストに変換する。
+
+        地域（天気・降水確率）と気温の地点はpair_stations()で組にする
+        （station_areasの対応表、なければ地域と地点の数が同じ場合に同じ位置のもの）。
+
+        Returns:
+            list: 地域ごとの辞書（area_code, area_name, station_code, station_name,
+                  temp_average, precip_average, days）のリスト
+        """
+        area_matrix = self.matrices["weatherCodes"]
+        station_matrix = self._station_matrix()
+        temp_normals = _averages_by_code(self.temp_average)
+        precip_normals = _averages_by_code(self.precip_average)
+        area_indexes = range(len(area_matrix.area_codes))
+
+        station_indexes = [None] * len(area_matrix.area_codes)
+        station_columns = None
+        if station_matrix is not None:
+            station_indexes = pair_stations(area_matrix.area_codes, station_matrix.area_codes, self.station_areas)
+            # 日付ごとの列の位置（地域と地点でtimeDefinesが異なる場合に備える）
+            station_dates = [time_define[:10] for time_define in station_matrix.time_defines]
+            if station_dates != self.dates:
+                positions = {day: i for i, day in enumerate(station_dates)}
+                station_columns = [positions.get(day) for day in self.dates]
+
+        n_dates = len(self.dates)
+        area_columns = {name: _rows(self.matrices.get(field), area_indexes, n_dates)
+                        for name, field in _AREA_DAY_FIELDS}
+        station_values = {name: _rows(self.matrices.get(field), station_indexes, n_dates, station_columns)
+                          for name, field in _STATION_DAY_FIELDS}
+        for field, key in TEMPERATURE_FIELDS:
+            station_values[f"temp_{key}_anomaly"] = _rows(
+                self.anomalies.get(field), station_indexes, n_dates, station_columns)
+
+        records = []
+        for area_index, area_code in enumerate(area_matrix.area_codes):
+            station_index = station_indexes[area_index]
+            station_code = station_matrix.area_codes[station_index] if station_index is not None else None
+
+            days = []
+            for time_index, day in enumerate(self.dates):
+                entry = {"date": day}
+                for name, rows in area_columns.items():
+                    entry[name] = rows[area_index][time_index]
+                if entry["pop"] is not None:
+                    entry["pop"] = int(entry["pop"])
+                if entry["reliability"] is not None:
+                    entry["reliability"] = reliability_label(entry["reliability"])
+                if entry["weather_code"] is not None:
+                    entry["weather_code"] = str(entry["weather_code"])
+                    entry["weather"] = get_weather_description(entry["weather_code"])
+                else:
+                    entry["weather"] = None
+                for name, rows in station_values.items():
+                    entry[name] = rows[area_index][time_index]
+                for field, key in TEMPERATURE_FIELDS:
+                    name = f"temp_{key}_anomaly"
+                    if entry[name] is not None:
+                        entry[name] = round(entry[name], 1)
+                days.append(entry)
+
+            records.append({
+                "area_code": area_code,
+                "area_name": area_matrix.area_names[area_index],
+                "station_code": station_code,
+                "station_name": station_matrix.area_names[station_index] if station_index is not None else None,
+                "temp_average": temp_normals.get(station_code),
+                "precip_average": precip_normals.get(station_code),
+                "days": days,
+            })
+        return records
+
+def _averages_by_code(averages):
+    """
+    平年値を 地点コード → {"min", "max"} の辞書に変換する。
+    """
+    if not averages:
+        return {}
+    return {
+        code: {"min": _optional(minimum), "max": _optional(maximum)}
+        for code, minimum, maximum in zip(averages["area_codes"], averages["min"], averages["max"])
+    }
+
+def get_weekly_forecast(forecast_data, station_areas=None):
+    """
+    週間予報を取得する（同じ発表元・発表時刻の版は保持している結果を返す）。
+
+    Args:
+        forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+        station_areas (dict): 地域コード → 気温の地点コード（省略時はWEEKLY_STATION_AREAS）
+
+    Returns:
+        WeeklyForecast: 週間予報
+
+    Raises:
+        ValueError: 週間予報のデータがない場合
+    """
+    raw = forecast_data.raw if isinstance(forecast_data, ParsedForecast) else forecast_data
+    if len(raw) < 2:
+        raise ValueError("週間予報のデータがありません")
+    # 同じ発表元が複数の府県予報区を発表する場合に備えて、地域コードもキーに含める
+    time_series = raw[1].get("timeSeries") or [{}]
+    area_codes = tuple(area["area"]["code"] for area in time_series[0].get("areas", ()))
+    if station_areas is None:
+        station_areas = parse_station_areas(WEEKLY_STATION_AREAS)
+    key = (raw[1].get("publishingOffice"), raw[1].get("reportDatetime"), area_codes,
+           tuple(sorted(station_areas.items())))
+
+    with _cache_lock:
+        weekly = _cache.get(key)
+        if weekly is not None:
+            _cache.move_to_end(key)
+            return weekly
+
+    weekly = WeeklyForecast(forecast_data, station_areas)
+    with _cache_lock:
+        _cache[key] = weekly
+        while len(_cache) > WEEKLY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return weekly
@@ -0,0 +1,239 @@
+"""
+気象庁・Discordへの通信で共有するHTTPセッション
+
+計測が有効な場合（instrumentation）は、リクエストごとに名前解決・TCP接続・TLS・
+最初の応答まで・本文の受信の所要時間と、再試行の回数を記録する。
+"""
+
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+# 接続プールの大きさ（同時に保持するkeep-alive接続数）
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+
+# 429/5xx応答時の再試行回数と待機時間の係数（0.5秒, 1秒, 2秒...と増加）
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+
+# 再試行の対象とするステータスコード
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+# 処理中のリクエストの段階ごとの所要時間（スレッドごと）
+_phases = threading.local()
+
+# リクエストごとの再試行設定の上書き（スレッドごと、no_retriesで設定）
+_retry_override = threading.local()
+
+def _record_phase(name, seconds):
+    phases = getattr(_phases, "current", None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+class _TimedConnectionMixin:
+    """
+    名前解決・TCP接続・TLSの所要時間を記録する接続。
+    """
+
+    def _new_conn(self):
+        if not instrumentation.enabled():
+            return super()._new_conn()
+
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            # 名前解決のエラーの扱いはurllib3に任せる
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        _record_phase("dns", resolved - started)
+
+        # 解決済みのアドレスに順に接続する（証明書の確認にはもとのホスト名を使う）
+        dns_host = self._dns_host
+        try:
+            for index, (*_, sockaddr) in enumerate(addresses):
+                self._dns_host = sockaddr[0]
+                try:
+                    sock = super()._new_conn()
+                    break
+                except NewConnectionError:
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+        self._connected_at = time.perf_counter()
+        _record_phase("connect", self._connected_at - resolved)
+        return sock
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        self._connected_at = None
+        super().connect()
+        if self._connected_at is not None:
+            _record_phase("tls", time.perf_counter() - self._connected_at)
+
+class _RetryOverrideMixin:
+    """
+    no_retriesの中で送信するリクエストは、セッションの再試行設定を使わずに1回だけ送信する接続プール。
+    """
+
+    def urlopen(self, method, url, *args, **kwargs):
+        retries = getattr(_retry_override, "retries", None)
+        if retries is not None:
+            kwargs["retries"] = retries
+        return super().urlopen(method, url, *args, **kwargs)
+
+class _TimedHTTPConnectionPool(_RetryOverrideMixin, HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(_RetryOverrideMixin, HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+@contextmanager
+def no_retries():
+    """
+    このスレッドでwithの中で送信するリクエストを再試行しないようにする。
+
+    共有セッション（get_session）の接続プールをそのまま使い、429/5xx応答も再試行せずに返す
+    （Discordのレート制限のように、呼び出し側で待ち時間を管理する場合に使う）。
+    """
+    previous = getattr(_retry_override, "retries", None)
+    _retry_override.retries = Retry(total=0, raise_on_status=False)
+    try:
+        yield
+    finally:
+        _retry_override.retries = previous
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """
+    接続の段階ごとの所要時間を応答（response.timings）に記録するアダプター。
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        if not instrumentation.enabled():
+            return super().send(request, **kwargs)
+        _phases.current = phases = {}
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        finally:
+            _phases.current = None
+        # 接続から応答ヘッダーの受信まで（本文の受信は含まない）
+        phases["response"] = time.perf_counter() - started
+        response.timings = phases
+        return response
+
+class InstrumentedSession(requests.Session):
+    """
+    リクエストごとの所要時間・再試行の回数を記録するセッション。
+    """
+
+    def send(self, request, **kwargs):
+        if not instrumentation.enabled():
+            return super().send(request, **kwargs)
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        total = time.perf_counter() - started
+
+        host = urlsplit(request.url).hostname
+        timings = getattr(response, "timings", {})
+        connection_seconds = 0.0
+        for phase in ("dns", "connect", "tls"):
+            if phase in timings:
+                instrumentation.observe(f"http_{phase}", timings[phase], host=host)
+                connection_seconds += timings[phase]
+        response_seconds = timings.get("response", total)
+        instrumentation.observe("http_ttfb", response_seconds - connection_seconds, host=host)
+        if not kwargs.get("stream"):
+            instrumentation.observe("http_download", total - response_seconds, host=host)
+
+        instrumentation.increment("http_requests", host=host, status=response.status_code,
+                                  connection="new" if "connect" in timings else "reused")
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            instrumentation.increment("http_retries", len(retries.history), host=host)
+        return response
+
+def create_session(pool_size=None, max_retries=None, backoff_factor=None):
+    """
+    接続プールと再試行設定を持つrequests.Sessionを作成する。
+
+    Args:
+        pool_size (int): 接続プールの大きさ（省略時はHTTP_POOL_SIZE）
+        max_retries (int): 429/5xx応答時の再試行回数（省略時はHTTP_MAX_RETRIES）
+        backoff_factor (float): 再試行間隔の係数（省略時はHTTP_BACKOFF_FACTOR）
+
+    Returns:
+        requests.Session: 設定済みのセッション
+    """
+    if pool_size is None:
+        pool_size = HTTP_POOL_SIZE
+    if max_retries is None:
+        max_retries = HTTP_MAX_RETRIES
+    if backoff_factor is None:
+        backoff_factor = HTTP_BACKOFF_FACTOR
+
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        respect_retry_after_header=True,
+        # 再試行しきっても応答を返し、ステータスの判定は呼び出し側に任せる
+        raise_on_status=False,
+    )
+    adapter = InstrumentedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = InstrumentedSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    """
+    プロセス内で共有するHTTPセッションを取得する（初回呼び出し時に作成）。
+
+    Returns:
+        requests.Session: 共有セッション
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def close_session():
+    """
+    共有HTTPセッションを閉じ、保持している接続を解放する。
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,311 @@
+"""
+処理時間・件数の計測
+
+処理の段階（HTTP通信のDNS/接続/TLS/最初の応答/受信、jsonの解析、データの抽出、
+メッセージの作成、通知）ごとの所要時間と、キャッシュの利用・再試行などの件数を集計する。
+timer()（withで使う）・timed()（デコレーター）・increment()で記録し、
+JSON Lines形式またはPrometheusのテキスト形式でファイルに出力する。
+計測を有効にしていない場合は何も記録しない。
+"""
+
+import contextlib
+import functools
+from collections import deque
+import os
+import sys
+import threading
+import time
+
+# 計測結果の出力先（設定すると計測を有効化）
+METRICS_OUTPUT = os.getenv('METRICS_OUTPUT')
+
+# 出力形式（auto: 拡張子が.promならPrometheus、それ以外はJSON Lines, jsonl, prometheus）
+METRICS_FORMAT = os.getenv('METRICS_FORMAT', 'auto')
+
+# JSON Lines形式で出力するまで保持する記録の上限（超えた場合は古い記録から捨てる）
+METRICS_MAX_EVENTS = int(os.getenv('METRICS_MAX_EVENTS', '10000'))
+
+# Prometheusの名前の接頭辞
+PROMETHEUS_PREFIX = "weather_forecast"
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+class Metrics:
+    """
+    段階ごとの所要時間（回数・合計・最大）と件数の集計。
+
+    JSON Lines形式では記録ごとの値を、Prometheus形式では集計値を出力する。
+    出力するまでの記録はmax_events件まで保持し、超えた分は古い記録から捨てる
+    （集計値には影響しない）。
+    """
+
+    def __init__(self, output=None, fmt=None, enabled=None, max_events=None):
+        self.output = output
+        self.format = fmt or METRICS_FORMAT
+        self.enabled = bool(output) if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+        self._events = deque(maxlen=METRICS_MAX_EVENTS if max_events is None else max_events)
+
+    def observe(self, stage, seconds, **labels):
+        """
+        段階の所要時間を記録する。
+
+        Args:
+            stage (str): 段階の名前（"http_ttfb", "decode"など）
+            seconds (float): 所要時間（秒）
+            **labels: 地域・ホストなどの分類
+        """
+        if not self.enabled:
+            return
+        key = (stage, _label_key(labels))
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                self._timings[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+            self._events.append({"ts": time.time(), "type": "timer", "stage": stage,
+                                 "seconds": round(seconds, 6), **labels})
+
+    def increment(self, counter, value=1, **labels):
+        """
+        件数を加算する。
+
+        Args:
+            counter (str): 件数の名前（"cache", "http_retries"など）
+            value (int): 加算する値
+            **labels: 結果・ホストなどの分類
+        """
+        if not self.enabled:
+            return
+        key = (counter, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._events.append({"ts": time.time(), "type": "counter", "counter": counter,
+                                 "value": value, **labels})
+
+    @contextlib.contextmanager
+    def timer(self, stage, **labels):
+        """
+        withブロックの所要時間を記録する（例外が発生した場合もerror=Trueとして記録）。
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, error=True, **labels)
+            raise
+        self.observe(stage, time.perf_counter() - started, **labels)
+
+    def timed(self, stage, **labels):
+        """
+        関数の所要時間を記録するデコレーターを作成する。
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.timer(stage, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        集計値を取得する。
+
+        Returns:
+            dict: {"timings": [{"stage", "labels", "count", "sum", "max"}...],
+                   "counters": [{"counter", "labels", "value"}...]}
+        """
+        with self._lock:
+            timings = [
+                {"stage": stage, "labels": dict(labels), "count": count, "sum": total, "max": maximum}
+                for (stage, labels), (count, total, maximum) in sorted(self._timings.items())
+            ]
+            counters = [
+                {"counter": counter, "labels": dict(labels), "value": value}
+                for (counter, labels), value in sorted(self._counters.items())
+            ]
+        return {"timings": timings, "counters": counters}
+
+    def _resolved_format(self, path):
+        if self.format == "auto":
+            return "prometheus" if path.endswith(".prom") else "jsonl"
+        return self.format
+
+    def flush(self, path=None):
+        """
+        計測結果をファイルに出力する。
+
+        JSON Lines形式では前回の出力以降の記録を追記し、
+        Prometheus形式ではその時点の集計値でファイルを置き換える。
+
+        Args:
+            path (str): 出力先（省略時はoutput）
+        """
+        path = path or self.output
+        if not self.enabled or not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if self._resolved_format(path) == "prometheus":
+            # 記録ごとの値は出力しないため、保持している記録は捨てる
+            with self._lock:
+                self._events.clear()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+            return
+
+        import json
+
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        with open(path, "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def to_prometheus(self):
+        """
+        集計値をPrometheusのテキスト形式に変換する。
+
+        Returns:
+            str: テキスト形式の計測結果
+        """
+        def format_labels(labels):
+            if not labels:
+                return ""
+            escaped = (
+                name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                for name, value in labels.items()
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        summary = self.summary()
+        stage_metric = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        lines = [f"# TYPE {stage_metric} summary", f"# TYPE {stage_metric}_max gauge"]
+        for timing in summary["timings"]:
+            labels = format_labels({"stage": timing["stage"], **timing["labels"]})
+            lines.append(f"{stage_metric}_count{labels} {timing['count']}")
+            lines.append(f"{stage_metric}_sum{labels} {timing['sum']:.6f}")
+            lines.append(f"{stage_metric}_max{labels} {timing['max']:.6f}")
+
+        declared = set()
+        for counter in summary["counters"]:
+            name = f"{PROMETHEUS_PREFIX}_{counter['counter']}_total"
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+            self._events.clear()
+
+_metrics = Metrics(METRICS_OUTPUT)
+
+def get_metrics():
+    """
+    プロセス内で共有する計測の集計を取得する。
+
+    Returns:
+        Metrics: 共有の集計
+    """
+    return _metrics
+
+def configure(output=None, fmt=None):
+    """
+    計測結果の出力先を設定し、計測を有効にする。
+
+    Args:
+        output (str): 出力先（省略時はMETRICS_OUTPUT、どちらもなければ計測しない）
+        fmt (str): 出力形式（省略時はMETRICS_FORMAT）
+    """
+    # .envファイルで設定された場合にも対応するため、環境変数は呼び出し時に読む
+    _metrics.output = output or os.getenv('METRICS_OUTPUT', METRICS_OUTPUT)
+    _metrics.format = fmt or os.getenv('METRICS_FORMAT', METRICS_FORMAT)
+    _metrics.enabled = bool(_metrics.output)
+
+def timer(stage, **labels):
+    """
+    withブロックの所要時間を記録する（get_metrics().timerと同じ）。
+    """
+    return _metrics.timer(stage, **labels)
+
+def timed(stage, **labels):
+    """
+    関数の所要時間を記録するデコレーター（get_metrics().timedと同じ）。
+    """
+    return _metrics.timed(stage, **labels)
+
+def observe(stage, seconds, **labels):
+    _metrics.observe(stage, seconds, **labels)
+
+def increment(counter, value=1, **labels):
+    _metrics.increment(counter, value, **labels)
+
+def enabled():
+    return _metrics.enabled
+
+def flush_metrics():
+    """
+    計測結果を出力先に書き出す（計測が無効な場合は何もしない）。
+    """
+    _metrics.flush()
+
+class _NullOutput:
+    """
+    書き込みを捨てる出力先（--quiet用）。
+    """
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+# 途中経過を表示するか（--quietで止める）
+_show_progress = True
+
+# set_quiet()で置き換える前の標準出力
+_saved_stdout = None
+
+def show_progress():
+    """
+    途中経過を表示するかを返す（表示する文字列を作る前に確認する）。
+    """
+    return _show_progress
+
+def set_quiet(quiet=True):
+    """
+    途中経過と標準出力への表示を止める（またはもとに戻す）。
+
+    止める前の標準出力を保持し、もとに戻すときはその出力先に戻す。
+    """
+    global _show_progress, _saved_stdout
+    if quiet and _saved_stdout is None:
+        _saved_stdout = sys.stdout
+        sys.stdout = _NullOutput()
+    elif not quiet and _saved_stdout is not None:
+        sys.stdout, _saved_stdout = _saved_stdout, None
+    _show_progress = not quiet
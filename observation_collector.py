@@ -0,0 +1,150 @@
+"""
+全地点の観測値の収集
+
+観測データHTML（synopday/data1s.html）の全地点の行を1回の走査で解析し、
+最高・最低気温とその時刻を (地点名, 日付) ごとに履歴アーカイブへ保存する。
+同じ日をすでに取得していれば（日付が変わった後の取得、またはOBSERVATION_MAX_AGE_SECONDS以内の取得）
+通信せずに保存済みの値を返すため、1日1回の取得で全地点の前日比に使える。
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+import forecast_archive
+from forecast_cache import JST
+
+# 保存済みの当日の観測値を使う期間（秒、これより古ければ取得し直す）
+OBSERVATION_MAX_AGE_SECONDS = int(os.getenv('OBSERVATION_MAX_AGE_SECONDS', str(3 * 60 * 60)))
+
+_collector = None
+_collector_lock = threading.Lock()
+
+class ObservationCollector:
+    """
+    日付ごとの全地点の観測値を、保存済みであればアーカイブから、なければ取得して返す。
+    """
+
+    def __init__(self, fetch, archive=None, max_age_seconds=None):
+        """
+        Args:
+            fetch (callable): 全地点の観測値（地点名 → StationObservation）を取得する関数
+            archive (ForecastArchive): 保存先（Noneの場合はプロセス内にのみ保持）
+            max_age_seconds (int): 当日の観測値を使う期間（省略時はOBSERVATION_MAX_AGE_SECONDS）
+        """
+        self._fetch = fetch
+        self.archive = archive
+        self.max_age = timedelta(
+            seconds=OBSERVATION_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds)
+        # 日付 → (取得時刻, 観測値)
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _is_current(self, observed_date, collected_at, now):
+        if collected_at is None:
+            return False
+        # 日付が変わった後に取得した値はその日の確定値として扱う
+        if collected_at.astimezone(JST).date() > observed_date:
+            return True
+        return now - collected_at < self.max_age
+
+    def _stored(self, observed_date, now):
+        """
+        保存済みの観測値を取得する（取得し直す必要がある場合はNone）。
+        """
+        collected_at, observations = self._memory.get(observed_date, (None, None))
+        if self._is_current(observed_date, collected_at, now):
+            return observations
+
+        if self.archive is not None:
+            collected_at = self.archive.observation_collected_at(observed_date)
+            if self._is_current(observed_date, collected_at, now):
+                observations = self.archive.get_observations(observed_date)
+                self._memory[observed_date] = (collected_at, observations)
+                return observations
+        return None
+
+    def collect(self, now=None, force=False):
+        """
+        今日の全地点の観測値を取得する（取得済みであれば通信しない）。
+
+        同時に複数のスレッドから呼ばれた場合も、取得は1回だけ行う。
+
+        Args:
+            now (datetime): 現在時刻（省略時は実際の時刻）
+            force (bool): 保存済みの値があっても取得し直すか
+
+        Returns:
+            tuple: (地点名 → StationObservation, 通信して取得したか)
+
+        Raises:
+            requests.exceptions.RequestException: HTTPリクエストエラー
+        """
+        if now is None:
+            now = datetime.now(JST)
+        observed_date = now.astimezone(JST).date()
+
+        with self._lock:
+            if not force:
+                observations = self._stored(observed_date, now)
+                if observations is not None:
+                    return observations, False
+
+            observations = self._fetch()
+            if self.archive is not None and observations:
+                self.archive.append_observations(observed_date, observations, complete=True, recorded_at=now)
+            self._memory = {observed_date: (now, observations)}
+            return observations, True
+
+    def last_collected(self, now=None):
+        """
+        取得し直す間隔にかかわらず、今日の保存済みの観測値を取得する（通信しない）。
+
+        Returns:
+            tuple: (地点名 → StationObservation, 取得時刻)、今日の値がない場合はNone
+        """
+        if now is None:
+            now = datetime.now(JST)
+        observed_date = now.astimezone(JST).date()
+
+        # 取得中（_lockを保持したまま応答を待っている場合）でも待たずに返す
+        collected_at, observations = self._memory.get(observed_date, (None, None))
+        if collected_at is None and self.archive is not None:
+            collected_at = self.archive.observation_collected_at(observed_date)
+            if collected_at is not None:
+                observations = self.archive.get_observations(observed_date)
+        if collected_at is None:
+            return None
+        return observations, collected_at
+
+    def get(self, station_name, now=None):
+        """
+        今日の指定地点の観測値を取得する。
+
+        Returns:
+            StationObservation: 観測値（地点がない場合はNone）
+        """
+        observations, _ = self.collect(now)
+        return observations.get(station_name)
+
+def get_observation_collector(fetch):
+    """
+    プロセス内で共有する観測値の収集を取得する（初回呼び出し時に作成）。
+
+    履歴アーカイブが有効な場合（FORECAST_ARCHIVE）は、観測値をアーカイブに保存する。
+
+    Args:
+        fetch (callable): 全地点の観測値を取得する関数（初回のみ使用）
+
+    Returns:
+        ObservationCollector: 共有の収集
+    """
+    global _collector
+    if _collector is None:
+        with _collector_lock:
+            if _collector is None:
+                archive = None
+                if forecast_archive.FORECAST_ARCHIVE_ENABLED:
+                    archive = forecast_archive.get_forecast_archive()
+                _collector = ObservationCollector(fetch, archive)
+    return _collector
@@ -0,0 +1,111 @@
+"""
+気象庁の観測データHTML（synopday/data1s.html）の逐次解析
+
+ページ全体を読み込まずに、受信したチャンクを行ごとに解析して
+地点ごとの最高・最低気温とその時刻を取り出す。
+"""
+
+import re
+from collections import namedtuple
+
+# 地点ごとの観測値（気温は℃のfloat、時刻は"HH:MM"の文字列）
+StationObservation = namedtuple("StationObservation", ["max_temp", "max_time", "min_temp", "min_time"])
+
+# HTMLのタグに挟まれたテキスト
+_TEXT_NODE_PATTERN = re.compile(r'>([^<>]+)<')
+
+# 地点名の後に続く観測値: 値] 時刻] 最高気温] 時刻] 最低気温] (時刻])
+_ROW_VALUES_PATTERN = re.compile(
+    r'(\d+\.\d+)\].*?(\d+:\d+)\].*?(\d+\.\d+)\].*?(\d+:\d+)\].*?(\d+\.\d+)\]'
+    r'(?:.*?(\d+:\d+)\])?'
+)
+
+_DIGIT_PATTERN = re.compile(r'\d')
+
+def parse_observation_line(line):
+    """
+    HTMLの1行（表の1行分）から地点名と観測値を取り出す。
+
+    地点名は最初の数値セルの直前にある日本語のテキストとする。
+
+    Args:
+        line (str): HTMLの1行
+
+    Returns:
+        tuple: (地点名, StationObservation)、観測値の行でない場合はNone
+    """
+    if "]" not in line:
+        return None
+
+    station_name = None
+    values_start = None
+    for match in _TEXT_NODE_PATTERN.finditer(line):
+        text = match.group(1).strip()
+        if not text:
+            continue
+        if _DIGIT_PATTERN.search(text):
+            break
+        if not text.isascii():
+            station_name = text
+            values_start = match.end()
+
+    if station_name is None:
+        return None
+
+    values = _ROW_VALUES_PATTERN.search(line, values_start)
+    if values is None:
+        return None
+
+    return station_name, StationObservation(
+        max_temp=float(values.group(3)),
+        max_time=values.group(4),
+        min_temp=float(values.group(5)),
+        min_time=values.group(6),
+    )
+
+def parse_observation_stream(chunks, stations=None, encoding="utf-8"):
+    """
+    HTMLをチャンク単位で受け取りながら、地点ごとの観測値を取り出す。
+
+    stationsを指定した場合は、すべての地点が見つかった時点で読み込みを終了する。
+
+    Args:
+        chunks (iterable): HTMLのバイト列チャンク（response.iter_contentなど）
+        stations (iterable): 取得する地点名（省略時は全地点）
+        encoding (str): HTMLの文字エンコーディング
+
+    Returns:
+        dict: 地点名 → StationObservation
+    """
+    remaining = set(stations) if stations is not None else None
+    observations = {}
+    buffer = b""
+
+    def handle_line(raw_line):
+        parsed = parse_observation_line(raw_line.decode(encoding, errors="replace"))
+        if parsed is None:
+            return
+        station_name, observation = parsed
+        if station_name in observations:
+            return
+        if remaining is None:
+            observations[station_name] = observation
+        elif station_name in remaining:
+            observations[station_name] = observation
+            remaining.discard(station_name)
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        # 改行のバイト(0x0A)はUTF-8の多バイト文字の途中には現れないため、そのまま分割できる
+        *lines, buffer = buffer.split(b"\n")
+        for raw_line in lines:
+            handle_line(raw_line)
+            if remaining is not None and not remaining:
+                return observations
+
+    if buffer:
+        handle_line(buffer)
+
+    return observations
@@ -0,0 +1,204 @@
+"""
+記録済みデータによるリプレイ（オフライン実行）
+
+保存しておいた天気予報json（samples/と同じ形式）と観測データHTMLを使い、
+通信せずに get_weather_forecast_with_comparison の処理全体を再現する。
+実行時刻は仮想時刻に置き換え、複数のスナップショットはプロセスプールで並列に処理する。
+"""
+
+import contextlib
+import glob
+import io
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time
+
+import forecast_archive
+import weather_forecast
+from forecast_ingest import office_code_from_path
+from forecast_json import loads_forecast
+from observation_parser import parse_observation_stream
+
+# ファイル名に含まれる日付（2025-07-01 または 20250701）
+_FILE_DATE_PATTERN = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})')
+
+# 観測データHTMLを読み込む単位（バイト）
+_READ_CHUNK_SIZE = 64 * 1024
+
+def find_snapshots(directory):
+    """
+    ディレクトリ以下の天気予報jsonを探す。
+
+    Args:
+        directory (str): 記録済みデータのディレクトリ
+
+    Returns:
+        list: jsonファイルのパスのリスト（名前順）
+    """
+    return sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True))
+
+def find_observation_files(directory):
+    """
+    ディレクトリ以下の観測データHTMLを、ファイル名の日付ごとに探す。
+
+    Args:
+        directory (str): 記録済みデータのディレクトリ
+
+    Returns:
+        dict: 日付 → HTMLのパス（日付を含まないファイルはキーNoneとして全日に使用）
+    """
+    observation_files = {}
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.html"), recursive=True)):
+        match = _FILE_DATE_PATTERN.search(os.path.basename(path))
+        key = None
+        if match:
+            try:
+                key = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            except ValueError:
+                key = None
+        observation_files.setdefault(key, path)
+    return observation_files
+
+def _read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def _virtual_now(forecast_data, fixed_now, time_of_day):
+    """
+    スナップショットごとの仮想時刻を決める。
+
+    fixed_nowがあればそれを使い、なければ発表時刻（time_of_dayがあればその日の指定時刻）とする。
+    """
+    if fixed_now is not None:
+        return fixed_now
+    report_datetime = datetime.fromisoformat(forecast_data[0]["reportDatetime"])
+    if time_of_day is not None:
+        return datetime.combine(report_datetime.date(), time_of_day, tzinfo=report_datetime.tzinfo)
+    return report_datetime
+
+def _init_worker(archive):
+    # リプレイでは既定でアーカイブへの保存を行わない
+    if not archive:
+        forecast_archive.FORECAST_ARCHIVE_ENABLED = False
+
+def replay_snapshot(path, observation_files, fixed_now=None, time_of_day=None, station_name=None):
+    """
+    1つのスナップショットで処理全体を再現する（標準出力には何も表示しない）。
+
+    Args:
+        path (str): 天気予報jsonのパス
+        observation_files (dict): find_observation_filesの戻り値
+        fixed_now (datetime): すべてのスナップショットで使う仮想時刻
+        time_of_day (time): 発表日のこの時刻を仮想時刻とする
+        station_name (str): 実績気温の観測地点名（省略時はOBSERVATION_STATION_NAME）
+
+    Returns:
+        dict: パス・仮想時刻・処理結果（失敗時はresultがNoneで、errorに表示内容）
+    """
+    if station_name is None:
+        station_name = weather_forecast.OBSERVATION_STATION_NAME
+
+    # エラー（❌）は標準エラー出力に表示されるため、両方をまとめて受け取る
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            with open(path, "rb") as f:
+                forecast_data = loads_forecast(f.read())
+            now = _virtual_now(forecast_data, fixed_now, time_of_day)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            return {"path": path, "now": None, "result": None, "error": f"{type(e).__name__}: {e}"}
+
+        today_actual = (None, None)
+        observation_path = observation_files.get(now.date(), observation_files.get(None))
+        if observation_path is not None:
+            observation = parse_observation_stream(
+                _read_chunks(observation_path), stations=[station_name]).get(station_name)
+            if observation is not None:
+                today_actual = (observation.max_temp, observation.min_temp)
+
+        # パスに府県予報区コードが含まれていれば、その予報区として処理する
+        result = weather_forecast.get_weather_forecast_with_comparison(
+            send_to_discord=False, now=now, forecast_data=forecast_data,
+            today_actual=today_actual, format_message=True,
+            office_code=office_code_from_path(path, weather_forecast.OFFICE_CODE))
+
+    error = None
+    if result is None:
+        # エラー時はget_weather_forecast_with_comparisonが表示した内容を返す
+        error = "\n".join(line for line in output.getvalue().splitlines() if line.startswith("❌"))
+    return {"path": path, "now": now.isoformat(), "result": result, "error": error}
+
+def _replay_one(args):
+    return replay_snapshot(*args)
+
+def run_replay(directory, fixed_now=None, time_of_day=None, workers=None, archive=False, chunksize=16):
+    """
+    ディレクトリ内のすべてのスナップショットをプロセスプールで並列にリプレイする。
+
+    Args:
+        directory (str): 記録済みデータのディレクトリ
+        fixed_now (datetime): すべてのスナップショットで使う仮想時刻
+        time_of_day (time): 発表日のこの時刻を仮想時刻とする（例: 16:00で15時以降の処理を再現）
+        workers (int): プロセス数（省略時はCPUコア数）
+        archive (bool): リプレイしたデータをアーカイブに保存するか
+        chunksize (int): 1回にプロセスへ渡すスナップショット数
+
+    Returns:
+        list: replay_snapshotの戻り値のリスト（ファイル名順）
+    """
+    snapshots = find_snapshots(directory)
+    observation_files = find_observation_files(directory)
+    tasks = [(path, observation_files, fixed_now, time_of_day) for path in snapshots]
+    if not tasks:
+        return []
+
+    if workers == 1:
+        # プロセスを起動せずにこのプロセスで順に処理する
+        archive_enabled = forecast_archive.FORECAST_ARCHIVE_ENABLED
+        _init_worker(archive)
+        try:
+            return [_replay_one(task) for task in tasks]
+        finally:
+            forecast_archive.FORECAST_ARCHIVE_ENABLED = archive_enabled
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(archive,)) as executor:
+        return list(executor.map(_replay_one, tasks, chunksize=chunksize))
+
+def show_replay_results(results, elapsed_seconds=None):
+    """
+    リプレイの結果を一覧表示する。
+
+    Args:
+        results (list): run_replayの戻り値
+        elapsed_seconds (float): 処理時間（秒）
+    """
+    succeeded = 0
+    for replayed in results:
+        name = os.path.relpath(replayed["path"])
+        result = replayed["result"]
+        if result is None:
+            print(f"❌ {name}: {replayed['error']}", file=sys.stderr)
+            continue
+        succeeded += 1
+        rain_display = "/".join(result["rain_values"])
+        print(f"✅ {name} [{replayed['now']}] {result['area_name']}: {result['weather']} "
+              f"降水確率{rain_display}% 最高{result['max_forecast']}℃({result['max_diff']}) "
+              f"最低{result['min_forecast']}℃({result['min_diff']})")
+
+    summary = f"\n🔁 リプレイ完了: {succeeded}/{len(results)}件成功"
+    if elapsed_seconds:
+        summary += f"（{elapsed_seconds:.2f}秒, {len(results) / elapsed_seconds:.1f}件/秒）"
+    print(summary)
+
+def parse_time_of_day(value):
+    """
+    "HH:MM" 形式の文字列をtimeに変換する。
+    """
+    hour, minute = value.split(":")
+    return time(int(hour), int(minute))
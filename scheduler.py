@@ -0,0 +1,254 @@
+"""
+常駐して気象庁の発表時刻に合わせて処理を実行するデーモン
+
+5時・11時・17時（日本時間）の発表直後に天気予報を取得し、15時には当日の実績気温との
+比較を別のジョブとして実行する。発表が反映されていない（reportDatetimeが進んでいない）
+場合は、間隔にばらつきを持たせながら再試行する。
+HTTPセッションや天気予報のキャッシュはプロセス内で保持したまま使い回す。
+結果は登録した出力先（シンク）に順に渡す。
+"""
+
+import json
+import os
+import random
+import signal
+import sys
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import instrumentation
+import weather_forecast
+from forecast_cache import JST, PUBLISH_HOURS, latest_publish_time
+from forecast_state import FORECAST_CHANGE_DETECTION
+
+# 発表時刻から取得を始めるまでの待ち時間（秒）
+DAEMON_PUBLISH_DELAY_SECONDS = int(os.getenv('DAEMON_PUBLISH_DELAY_SECONDS', '60'))
+
+# 当日の実績気温と比較するジョブの実行時刻
+DAEMON_COMPARISON_HOUR = int(os.getenv('DAEMON_COMPARISON_HOUR', '15'))
+
+# 発表が反映されていない場合の再試行間隔（秒、回数ごとに倍にする）と上限
+DAEMON_RETRY_BASE_SECONDS = float(os.getenv('DAEMON_RETRY_BASE_SECONDS', '60'))
+DAEMON_RETRY_MAX_SECONDS = float(os.getenv('DAEMON_RETRY_MAX_SECONDS', '600'))
+
+# 発表時刻から再試行をあきらめるまでの時間（秒）
+DAEMON_RETRY_DEADLINE_SECONDS = float(os.getenv('DAEMON_RETRY_DEADLINE_SECONDS', '1800'))
+
+# Discordに通知するジョブ（カンマ区切り）
+DAEMON_DISCORD_JOBS = tuple(
+    job for job in os.getenv('DAEMON_DISCORD_JOBS', 'comparison').split(',') if job)
+
+# ジョブ（毎日hour時からsecond_offset秒後に実行）
+Job = namedtuple("Job", ["name", "hour", "second_offset", "func"])
+
+def next_run_time(job, now):
+    """
+    ジョブの次回の実行時刻を求める。
+
+    Args:
+        job (Job): ジョブ
+        now (datetime): 現在時刻（タイムゾーン付き）
+
+    Returns:
+        datetime: 次回の実行時刻（日本時間）
+    """
+    now = now.astimezone(JST)
+    run_time = now.replace(hour=job.hour, minute=0, second=0, microsecond=0)
+    run_time += timedelta(seconds=job.second_offset)
+    if run_time <= now:
+        run_time += timedelta(days=1)
+    return run_time
+
+def retry_delay(attempt, base=None, maximum=None):
+    """
+    再試行までの待ち時間を求める（回数ごとに倍にし、±50%のばらつきを加える）。
+
+    Args:
+        attempt (int): 何回目の再試行か（0から）
+        base (float): 最初の待ち時間（秒）
+        maximum (float): 待ち時間の上限（秒）
+
+    Returns:
+        float: 待ち時間（秒）
+    """
+    if base is None:
+        base = DAEMON_RETRY_BASE_SECONDS
+    if maximum is None:
+        maximum = DAEMON_RETRY_MAX_SECONDS
+    return min(base * (2 ** attempt), maximum) * random.uniform(0.5, 1.5)
+
+def print_sink(job_name, result):
+    """
+    結果を標準出力に表示するシンク。
+    """
+    rain_display = "/".join(result["rain_values"])
+    print(f"📤 [{job_name}] {result['report_datetime']} {result['area_name']}: {result['weather']} "
+          f"降水確率{rain_display}% 最高{result['max_forecast']}℃({result['max_diff']}) "
+          f"最低{result['min_forecast']}℃({result['min_diff']})")
+
+def make_jsonl_sink(path):
+    """
+    結果をJSON Lines形式でファイルに追記するシンクを作成する。
+
+    Args:
+        path (str): 出力先のファイル
+
+    Returns:
+        callable: シンク
+    """
+    def jsonl_sink(job_name, result):
+        record = {"job": job_name, "emitted_at": datetime.now(JST).isoformat(), **result}
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return jsonl_sink
+
+def make_discord_sink(jobs=None):
+    """
+    指定したジョブの結果をDiscordに通知するシンクを作成する。
+
+    Args:
+        jobs (iterable): 通知するジョブ名（省略時はDAEMON_DISCORD_JOBS）
+
+    Returns:
+        callable: シンク
+    """
+    jobs = set(DAEMON_DISCORD_JOBS if jobs is None else jobs)
+
+    def discord_sink(job_name, result):
+        # 前回の通知から予報が変わっていない場合はメッセージが作成されていない
+        if job_name in jobs and result.get("discord_message"):
+            if weather_forecast.send_discord_notification(result["discord_message"], result.get("office_name")):
+                weather_forecast.record_notified_forecast(result)
+    return discord_sink
+
+class WeatherDaemon:
+    """
+    発表時刻に合わせて天気予報の取得・実績との比較を実行する常駐プロセス。
+    """
+
+    def __init__(self, sinks=None, office_code=None):
+        self.sinks = list(sinks) if sinks else [print_sink]
+        self.office_code = office_code or weather_forecast.OFFICE_CODE
+        self.last_report_datetime = None
+        self._stop_event = threading.Event()
+
+        self.jobs = [
+            Job(f"forecast{hour:02d}", hour, DAEMON_PUBLISH_DELAY_SECONDS, self.run_forecast_job)
+            for hour in PUBLISH_HOURS
+        ]
+        self.jobs.append(Job("comparison", DAEMON_COMPARISON_HOUR, DAEMON_PUBLISH_DELAY_SECONDS,
+                             self.run_comparison_job))
+
+    def stop(self):
+        """
+        デーモンを停止する（待機中であればすぐに終了する）。
+        """
+        self._stop_event.set()
+
+    def _emit(self, job_name, result):
+        for sink in self.sinks:
+            try:
+                sink(job_name, result)
+            except Exception as e:
+                print(f"⚠️  出力先でエラーが発生しました: {type(e).__name__}: {e}")
+
+    def _run_pipeline(self):
+        # 取得はCLIと同じくフォールバック・サーキットブレーカーつきで行い、
+        # 実行環境のタイムゾーンによらず日本時間で15時以降かどうかを判定する
+        return weather_forecast.get_weather_forecast_with_comparison(
+            send_to_discord=False, now=datetime.now(JST),
+            format_message=True, detect_changes=FORECAST_CHANGE_DETECTION, office_code=self.office_code)
+
+    def run_forecast_job(self, job_name, scheduled_time):
+        """
+        発表直後に天気予報を取得する。reportDatetimeが直近の発表時刻に
+        追いつくまで、間隔にばらつきを持たせて再試行する。
+        """
+        deadline = scheduled_time + timedelta(seconds=DAEMON_RETRY_DEADLINE_SECONDS)
+        attempt = 0
+        while not self._stop_event.is_set():
+            now = datetime.now(JST)
+            try:
+                result = self._run_pipeline()
+            except Exception as e:
+                print(f"⚠️  天気予報の取得に失敗しました: {type(e).__name__}: {e}")
+                result = None
+
+            if result is not None:
+                report_datetime = datetime.fromisoformat(result["report_datetime"])
+                if report_datetime >= latest_publish_time(now):
+                    self.last_report_datetime = report_datetime
+                    self._emit(job_name, result)
+                    return result
+
+            delay = retry_delay(attempt)
+            if datetime.now(JST) + timedelta(seconds=delay) > deadline:
+                print(f"❌ [{job_name}] 発表の反映を確認できませんでした。次回の発表を待ちます。", file=sys.stderr)
+                if result is not None:
+                    self._emit(job_name, result)
+                return result
+            print(f"⏳ [{job_name}] 発表が反映されていません。{delay:.0f}秒後に再試行します。")
+            instrumentation.increment("daemon_retries", job=job_name)
+            attempt += 1
+            self._stop_event.wait(delay)
+        return None
+
+    def run_comparison_job(self, job_name, scheduled_time):
+        """
+        当日の実績気温を取得して、明日の予報との前日比を求める。
+        """
+        result = self._run_pipeline()
+        if result is not None:
+            self._emit(job_name, result)
+        return result
+
+    def run_forever(self):
+        """
+        stop()が呼ばれるまで、ジョブを実行時刻ごとに実行し続ける。
+        """
+        print(f"🛰️  デーモンを開始しました（予報区: {self.office_code}）")
+        while not self._stop_event.is_set():
+            now = datetime.now(JST)
+            job = min(self.jobs, key=lambda job: next_run_time(job, now))
+            scheduled_time = next_run_time(job, now)
+            print(f"💤 次の実行: {job.name} {scheduled_time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+            # 時計のずれやスリープからの復帰に備えて、長い待機は分割する
+            while not self._stop_event.is_set():
+                remaining = (scheduled_time - datetime.now(JST)).total_seconds()
+                if remaining <= 0:
+                    break
+                self._stop_event.wait(min(remaining, 300))
+            if self._stop_event.is_set():
+                break
+
+            print(f"▶️  {job.name} を実行します")
+            try:
+                with instrumentation.timer("job", job=job.name):
+                    job.func(job.name, scheduled_time)
+            except Exception as e:
+                print(f"❌ [{job.name}] 予期せぬエラー: {type(e).__name__}: {e}", file=sys.stderr)
+            # 常駐中もジョブごとに計測結果を書き出す
+            instrumentation.flush_metrics()
+        print("🛑 デーモンを停止しました")
+
+def run_daemon(send_to_discord=False, jsonl_path=None, office_code=None):
+    """
+    デーモンを起動する（SIGINT/SIGTERMで停止）。
+
+    Args:
+        send_to_discord (bool): Discordに通知するか
+        jsonl_path (str): 結果を追記するJSON Linesファイル
+        office_code (str): 府県予報区コード（省略時はOFFICE_CODE）
+    """
+    sinks = [print_sink]
+    if jsonl_path:
+        sinks.append(make_jsonl_sink(jsonl_path))
+    if send_to_discord:
+        sinks.append(make_discord_sink())
+
+    daemon = WeatherDaemon(sinks, office_code)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop())
+    daemon.run_forever()
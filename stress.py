@@ -0,0 +1,592 @@
+"""
+抽出処理の性質テストと大規模データでの負荷試験
+
+乱数で気象庁の天気予報jsonと同じ形の文書を作成し（地域数・日数の変更、timeDefinesの欠け・重複・
+順序の入れ替わり、""の欠損値を含む）、抽出関数（get_weather_data / get_rain_data /
+get_temperature_data / extract_area_forecasts / extract_forecast_columns / format_discord_message）の
+結果を、timeDefinesを文字列のまま素直に走査する参照実装の結果と比較する。
+例外が発生する場合は、例外の種類が一致することを確認する。
+
+続いて数千地域の文書を作成し、1つの解析済みデータを複数のスレッドで共有した場合と、
+複数のプロセスで処理した場合について、処理速度と結果の正しさを確認する。
+不一致があった場合は、再現用のシードを表示して終了コード1で終了する。
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import weather_forecast
+from forecast_columns import FIELD_TYPECODES, MISSING_VALUES, RELIABILITY_LEVELS, extract_forecast_columns
+from forecast_index import ParsedForecast
+from forecast_weekly import WeeklyForecast
+from weather_codes import WEATHER_DATA, get_weather_description
+
+# 性質テストで作成する文書の数
+DEFAULT_CASES = 200
+
+# 負荷試験の文書の地域数・日数
+DEFAULT_SCALE_AREAS = 5000
+DEFAULT_SCALE_DAYS = 7
+
+# 欠損値（""）にする値の割合
+DEFAULT_BLANK_RATIO = 0.05
+
+# 日本標準時
+JST = timezone(timedelta(hours=9))
+
+# 天気予報の定時発表時刻
+_PUBLISH_HOURS = (5, 11, 17)
+
+# 不一致として表示する件数の上限
+MAX_REPORTED_FAILURES = 20
+
+def _iso(value):
+    return value.isoformat()
+
+def _day_times(rng, day, hours, irregular):
+    """
+    1日分のtimeDefinesを作成する（irregularの場合は時刻の欠け・追加・順序の入れ替わりを含む）。
+    """
+    times = [datetime(day.year, day.month, day.day, hour, tzinfo=JST) for hour in hours]
+    if irregular:
+        if len(times) > 1 and rng.random() < 0.2:
+            times.pop(rng.randrange(len(times)))
+        if rng.random() < 0.1:
+            times.append(datetime(day.year, day.month, day.day, rng.randrange(24), 30, tzinfo=JST))
+        if rng.random() < 0.2:
+            rng.shuffle(times)
+    return times
+
+def _value(rng, blank_ratio, make):
+    return "" if rng.random() < blank_ratio else make()
+
+def make_random_forecast(rng, n_areas, n_days, blank_ratio=DEFAULT_BLANK_RATIO, irregular=True, n_stations=None,
+                         n_weekly_days=7):
+    """
+    気象庁の天気予報jsonと同じ形の文書を乱数で作成する。
+
+    短期予報は天気（1日1つ）・降水確率（6時間ごと）・気温（0時と9時）の3つのtimeSeries、
+    週間予報は天気・降水確率・信頼度と、予想気温・予測範囲、平年値を持つ。
+
+    Args:
+        rng (random.Random): 乱数生成器
+        n_areas (int): 地域数
+        n_days (int): 短期予報の日数
+        blank_ratio (float): 降水確率・気温を""にする割合
+        irregular (bool): timeDefinesの欠け・追加・順序の入れ替わり、日の欠けを含めるか
+        n_stations (int): 気温の地点数（省略時は地域数と同じ）
+        n_weekly_days (int): 週間予報の日数
+
+    Returns:
+        list: 天気予報データ（[0]=短期予報, [1]=週間予報）
+    """
+    if n_stations is None:
+        n_stations = n_areas
+    report_day = date(2020, 1, 1) + timedelta(days=rng.randrange(3650))
+    report_hour = rng.choice(_PUBLISH_HOURS)
+    report_datetime = datetime(report_day.year, report_day.month, report_day.day, report_hour, tzinfo=JST)
+    days = [report_day + timedelta(days=offset) for offset in range(n_days)]
+    if irregular and len(days) > 2 and rng.random() < 0.2:
+        # 途中の日が抜けている
+        days.pop(rng.randrange(1, len(days) - 1))
+
+    weather_defines = [report_datetime] + [
+        time for day in days[1:] for time in _day_times(rng, day, (0,), irregular)]
+    pop_defines = [time for day in days for time in _day_times(rng, day, (0, 6, 12, 18), irregular)
+                   if time > report_datetime or time.date() > report_day]
+    temp_defines = [time for day in days for time in _day_times(rng, day, (0, 9), irregular)]
+
+    weather_codes = sorted(WEATHER_DATA)
+    area_codes = rng.sample(range(10000, 999999), n_areas + n_stations)
+    areas = [{"name": f"地域{i}", "code": str(code)} for i, code in enumerate(area_codes[:n_areas])]
+    stations = [{"name": f"地点{i}", "code": str(code)} for i, code in enumerate(area_codes[n_areas:])]
+
+    pop = lambda: str(rng.randrange(0, 101, 10))
+    temp = lambda: str(rng.randrange(-15, 40))
+    short_term = {
+        "publishingOffice": "合成気象台",
+        "reportDatetime": _iso(report_datetime),
+        "timeSeries": [
+            {
+                "timeDefines": [_iso(t) for t in weather_defines],
+                "areas": [{"area": area,
+                           "weatherCodes": [rng.choice(weather_codes) for _ in weather_defines],
+                           "weathers": ["くもり" for _ in weather_defines]} for area in areas],
+            },
+            {
+                "timeDefines": [_iso(t) for t in pop_defines],
+                "areas": [{"area": area, "pops": [_value(rng, blank_ratio, pop) for _ in pop_defines]}
+                          for area in areas],
+            },
+            {
+                "timeDefines": [_iso(t) for t in temp_defines],
+                "areas": [{"area": station, "temps": [_value(rng, blank_ratio, temp) for _ in temp_defines]}
+                          for station in stations],
+            },
+        ],
+    }
+
+    weekly_defines = [datetime(report_day.year, report_day.month, report_day.day, tzinfo=JST) + timedelta(days=i)
+                      for i in range(n_weekly_days)]
+    weekly_temps = {}
+    for station in stations:
+        entry = {"area": station}
+        for field in ("tempsMin", "tempsMinUpper", "tempsMinLower", "tempsMax", "tempsMaxUpper", "tempsMaxLower"):
+            entry[field] = [_value(rng, blank_ratio, temp) for _ in weekly_defines]
+        weekly_temps[station["code"]] = entry
+    weekly = {
+        "publishingOffice": "合成気象台",
+        "reportDatetime": _iso(report_datetime),
+        "timeSeries": [
+            {
+                "timeDefines": [_iso(t) for t in weekly_defines],
+                "areas": [{"area": area,
+                           "weatherCodes": [rng.choice(weather_codes) for _ in weekly_defines],
+                           "pops": [_value(rng, blank_ratio, pop) for _ in weekly_defines],
+                           "reliabilities": [_value(rng, 0.3, lambda: rng.choice("ABC")) for _ in weekly_defines]}
+                          for area in areas],
+            },
+            {
+                "timeDefines": [_iso(t) for t in weekly_defines],
+                "areas": list(weekly_temps.values()),
+            },
+        ],
+        "tempAverage": {"areas": [{"area": station, "min": _value(rng, blank_ratio, temp),
+                                   "max": _value(rng, blank_ratio, temp)} for station in stations]},
+        "precipAverage": {"areas": [{"area": station, "min": _value(rng, blank_ratio, pop),
+                                     "max": _value(rng, blank_ratio, pop)} for station in stations]},
+    }
+    return [short_term, weekly]
+
+# 参照実装（timeDefinesを文字列のまま先頭から走査する。速度は考慮しない）
+
+def _reference_indices(time_series, target_date):
+    day = target_date.date().isoformat()
+    return [i for i, time_define in enumerate(time_series["timeDefines"]) if time_define[:10] == day]
+
+def reference_weather(time_series, area_index, target_date):
+    area = time_series["areas"][area_index]
+    indices = _reference_indices(time_series, target_date)
+    if not indices:
+        raise ValueError("該当日のデータがありません")
+    code = area["weatherCodes"][indices[0]]
+    return area["area"]["name"], get_weather_description(code), code
+
+def reference_rain(time_series, area_index, target_date):
+    area = time_series["areas"][area_index]
+    indices = _reference_indices(time_series, target_date)
+    if not indices:
+        raise ValueError("該当日のデータがありません")
+    return area["area"]["name"], [area["pops"][i] for i in indices]
+
+def reference_temperature(time_series, area_index, target_date):
+    indices = _reference_indices(time_series, target_date)
+    if not indices:
+        raise ValueError("該当日のデータがありません")
+    area = time_series["areas"][area_index]
+    temps = [float(area["temps"][i]) for i in indices]
+    return min(temps), max(temps), area["area"]["name"]
+
+def reference_area_forecasts(forecast, target_date, per_function=False):
+    """
+    全地域の予報を、timeDefinesを文字列のまま走査して求める。
+
+    Args:
+        forecast (list): 天気予報データ
+        target_date (datetime): 対象日
+        per_function (bool): Trueの場合、地域ごとに get_weather_data / get_rain_data /
+            get_temperature_data の結果（_outcomeの形式、該当日の欠け・""の欠損値による例外を含む）の
+            タプルを返す
+
+    Returns:
+        list: extract_area_forecastsと同じ形の辞書のリスト（per_functionの場合は地域ごとのタプルのリスト）
+    """
+    if per_function:
+        weather_series, rain_series, temperature_series = forecast[0]["timeSeries"][:3]
+        return [
+            (_outcome(reference_weather, weather_series, area_index, target_date),
+             _outcome(reference_rain, rain_series, area_index, target_date),
+             _outcome(reference_temperature, temperature_series, area_index, target_date))
+            for area_index in range(len(weather_series["areas"]))
+        ]
+
+    weather_series, rain_series, temperature_series = forecast[0]["timeSeries"][:3]
+    weather_indices = _reference_indices(weather_series, target_date)
+    if not weather_indices:
+        raise ValueError("該当日のデータがありません")
+    rain_indices = _reference_indices(rain_series, target_date)
+    temperature_indices = _reference_indices(temperature_series, target_date)
+    rain_areas = {}
+    for rain_area in rain_series["areas"]:
+        rain_areas.setdefault(rain_area["area"]["code"], rain_area)
+
+    forecasts = []
+    for area_index, area in enumerate(weather_series["areas"]):
+        code = area["area"]["code"]
+        rain_area = rain_areas.get(code)
+        rain_values = [rain_area["pops"][i] for i in rain_indices] if rain_area else []
+        station = temperature_series["areas"][area_index] if area_index < len(temperature_series["areas"]) else None
+        temps = [float(station["temps"][i]) for i in temperature_indices if station["temps"][i] != ""] if station else []
+        weather_code = area["weatherCodes"][weather_indices[0]]
+        forecasts.append({
+            "area_code": code,
+            "area_name": area["area"]["name"],
+            "weather": get_weather_description(weather_code),
+            "weather_code": weather_code,
+            "rain_values": rain_values,
+            "station_code": station["area"]["code"] if station else None,
+            "station_name": station["area"]["name"] if station else None,
+            "min_temp": min(temps) if temps else None,
+            "max_temp": max(temps) if temps else None,
+        })
+    return forecasts
+
+def reference_rain_line(rain_values):
+    if len(rain_values) >= 3:
+        return f"- 降水確率：{rain_values[1]}% / {rain_values[2]}%"
+    return "- 降水確率：% / %"
+
+def _reference_matrix_value(raw_value, typecode):
+    if raw_value == "":
+        return MISSING_VALUES[typecode]
+    if typecode == 'd':
+        return float(raw_value)
+    if typecode == 'h':
+        return int(raw_value)
+    return RELIABILITY_LEVELS.index(raw_value)
+
+def _same(left, right):
+    # NaN同士は等しいものとして扱う
+    if isinstance(left, float) and isinstance(right, float) and left != left and right != right:
+        return True
+    return left == right
+
+def _outcome(func, *args):
+    """
+    関数を実行し、戻り値または例外の種類を返す。
+    """
+    try:
+        return "ok", func(*args)
+    except (ValueError, IndexError, KeyError, TypeError) as e:
+        return "error", type(e).__name__
+
+def _check_columns(forecast, failures, label):
+    columns = extract_forecast_columns(forecast)
+    for block_name, block in (("short_term", forecast[0]), ("weekly", forecast[1])):
+        matrices = columns[block_name]
+        for time_series in block["timeSeries"]:
+            n_times = len(time_series["timeDefines"])
+            for area_index, area in enumerate(time_series["areas"]):
+                for field, raw_values in area.items():
+                    if field not in FIELD_TYPECODES:
+                        continue
+                    matrix = matrices[field]
+                    typecode = FIELD_TYPECODES[field]
+                    for time_index in range(n_times):
+                        expected = _reference_matrix_value(raw_values[time_index], typecode)
+                        actual = matrix.get(area_index, time_index)
+                        if not _same(expected, actual):
+                            failures.append(f"{label} columns {block_name}.{field}[{area_index}, {time_index}]: "
+                                            f"{actual!r} != {expected!r}")
+                            return
+
+# 週間予報から除いても処理できることを確認する項目（出力名, 項目名）
+_OPTIONAL_WEEKLY_FIELDS = (("reliability", "reliabilities"), ("temp_min_upper", "tempsMinUpper"))
+
+def _without_weekly_fields(forecast, fields):
+    weekly = dict(forecast[1])
+    weekly["timeSeries"] = [
+        dict(time_series, areas=[{key: value for key, value in area.items() if key not in fields}
+                                 for area in time_series["areas"]])
+        for time_series in weekly["timeSeries"]
+    ]
+    return [forecast[0], weekly]
+
+def _check_weekly(forecast, failures, label):
+    """
+    週間予報の一部の項目がない文書でも、その項目をNoneとして他の項目は同じ結果になることを確認する。
+    """
+    expected = _outcome(lambda: WeeklyForecast(forecast).to_records())
+    stripped = _without_weekly_fields(forecast, {field for _, field in _OPTIONAL_WEEKLY_FIELDS})
+    actual = _outcome(lambda: WeeklyForecast(stripped).to_records())
+    if expected[0] == "ok" and actual[0] == "ok":
+        for record in expected[1]:
+            for day in record["days"]:
+                day.update((name, None) for name, _ in _OPTIONAL_WEEKLY_FIELDS)
+    if actual != expected:
+        failures.append(f"{label} WeeklyForecast（{', '.join(field for _, field in _OPTIONAL_WEEKLY_FIELDS)}なし）: "
+                        f"{actual if actual[0] == 'error' else '結果が一致しません'}")
+
+def check_forecast(forecast, rng, label, n_targets=4):
+    """
+    1つの文書について、抽出関数の結果を参照実装と比較する。
+
+    対象日は発表日から数日分と範囲外の日を、地域は範囲外の位置を含めて乱数で選ぶ。
+
+    Args:
+        forecast (list): 天気予報データ
+        rng (random.Random): 乱数生成器
+        label (str): 不一致の表示に使う名前
+        n_targets (int): 対象日・地域の組の数
+
+    Returns:
+        list: 不一致の説明のリスト
+    """
+    failures = []
+    parsed = ParsedForecast(forecast)
+    weather_series, rain_series, temperature_series = forecast[0]["timeSeries"][:3]
+    report_datetime = datetime.fromisoformat(forecast[0]["reportDatetime"])
+    n_areas = len(weather_series["areas"])
+
+    for _ in range(n_targets):
+        target_date = report_datetime + timedelta(days=rng.randrange(-1, 9))
+        area_index = rng.randrange(n_areas + 1) if rng.random() < 0.1 else rng.randrange(n_areas)
+        cases = (
+            ("get_weather_data", weather_forecast.get_weather_data, weather_series, parsed.weather,
+             lambda series: (series, target_date, area_index), reference_weather),
+            ("get_rain_data", weather_forecast.get_rain_data, rain_series, parsed.rain,
+             lambda series: (series, area_index, target_date), reference_rain),
+            ("get_temperature_data", weather_forecast.get_temperature_data, temperature_series, parsed.temperature,
+             lambda series: (series, area_index, target_date), reference_temperature),
+        )
+        for name, func, raw_series, index, make_args, reference in cases:
+            expected = _outcome(reference, raw_series, area_index, target_date)
+            # 辞書のままの時系列と解析済みのインデックスのどちらを渡しても同じ結果になること
+            for kind, series in (("index", index), ("dict", raw_series)):
+                actual = _outcome(func, *make_args(series))
+                if actual != expected:
+                    failures.append(f"{label} {name}[{kind}](area={area_index}, date={target_date.date()}): "
+                                    f"{actual!r} != {expected!r}")
+
+        expected = _outcome(reference_area_forecasts, forecast, target_date)
+        actual = _outcome(weather_forecast.extract_area_forecasts, parsed, target_date)
+        if actual != expected:
+            failures.append(f"{label} extract_area_forecasts(date={target_date.date()}): 参照実装と一致しません")
+
+        # 降水確率の数（""を含む、3つ未満を含む）によらずメッセージを作成できること
+        rain_values = [rng.choice(["", "0", "30", "100"]) for _ in range(rng.randrange(0, 7))]
+        outcome = _outcome(
+            weather_forecast.format_discord_message, "地域", "合成気象台", "発表", rng.random() < 0.5,
+            None, None, "くもり", rain_values, 30.0, 20.0, "データなし", "データなし", "200", target_date)
+        if outcome[0] != "ok" or reference_rain_line(rain_values) not in outcome[1].splitlines():
+            failures.append(f"{label} format_discord_message(rain_values={rain_values!r}): {outcome!r}")
+
+    _check_columns(forecast, failures, label)
+    _check_weekly(forecast, failures, label)
+    return failures
+
+def run_property_checks(cases=DEFAULT_CASES, seed=0, blank_ratio=DEFAULT_BLANK_RATIO, save_dir=None):
+    """
+    乱数で作成した文書を順に検査する。
+
+    文書ごとのシードは seed + 番号 で、--seed にそのシードを指定し --cases 1 とすると再現できる。
+
+    Args:
+        cases (int): 文書の数
+        seed (int): 最初の文書のシード
+        blank_ratio (float): 欠損値の割合
+        save_dir (str): 不一致があった文書を保存するディレクトリ
+
+    Returns:
+        list: 不一致の説明のリスト
+    """
+    failures = []
+    for case in range(cases):
+        case_seed = seed + case
+        rng = random.Random(case_seed)
+        forecast = make_random_forecast(
+            rng, n_areas=rng.randint(1, 12), n_days=rng.randint(1, 8), blank_ratio=blank_ratio,
+            n_stations=rng.randint(1, 12))
+        case_failures = check_forecast(forecast, rng, f"[seed={case_seed}]")
+        if case_failures and save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            with open(os.path.join(save_dir, f"stress_{case_seed}.json"), "w", encoding="utf-8") as f:
+                json.dump(forecast, f, ensure_ascii=False)
+        failures.extend(case_failures)
+    return failures
+
+# 負荷試験（スレッドで共有する解析済みデータ、プロセスごとの解析済みデータ）
+
+_worker_state = {}
+
+def _extract_range(parsed, target_date, area_range):
+    """
+    地域の範囲について3つの抽出関数を実行する（例外は種類を結果として記録する）。
+
+    Returns:
+        list: (地域の位置, (天気, 降水確率, 気温の各結果)) のリスト
+    """
+    extracted = []
+    for area_index in area_range:
+        extracted.append((area_index, (
+            _outcome(weather_forecast.get_weather_data, parsed.weather, target_date, area_index),
+            _outcome(weather_forecast.get_rain_data, parsed.rain, area_index, target_date),
+            _outcome(weather_forecast.get_temperature_data, parsed.temperature, area_index, target_date),
+        )))
+    return extracted
+
+def _compare_extracted(extracted, expected):
+    """
+    抽出結果を参照実装の結果と比較する。
+
+    Returns:
+        tuple: (比較した地域数, 不一致の説明のリスト)
+    """
+    failures = [
+        f"area={area_index}: 天気・降水確率・気温が参照実装と一致しません"
+        for area_index, actual in extracted
+        if actual != expected[area_index]
+    ]
+    return len(extracted), failures
+
+def _scale_target_date(forecast):
+    """
+    負荷試験の対象日（発表日の翌日以降で、天気のtimeDefinesにある最初の日）。
+    """
+    report_datetime = datetime.fromisoformat(forecast[0]["reportDatetime"])
+    for time_define in forecast[0]["timeSeries"][0]["timeDefines"]:
+        target_date = datetime.fromisoformat(time_define)
+        if target_date.date() > report_datetime.date():
+            return target_date
+    return report_datetime + timedelta(days=1)
+
+def _init_worker(seed, n_areas, n_days, blank_ratio, irregular):
+    # 親プロセスと同じシード・条件から同じ文書を作成する（大きな文書をプロセス間で受け渡さない）
+    rng = random.Random(seed)
+    forecast = make_random_forecast(rng, n_areas, n_days, blank_ratio=blank_ratio, irregular=irregular,
+                                    n_weekly_days=n_days)
+    _worker_state.update(parsed=ParsedForecast(forecast), target_date=_scale_target_date(forecast))
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+
+def _process_task(area_range):
+    return _extract_range(_worker_state["parsed"], _worker_state["target_date"], area_range)
+
+def _split(n_areas, n_chunks):
+    size = max(1, -(-n_areas // n_chunks))
+    return [range(start, min(start + size, n_areas)) for start in range(0, n_areas, size)]
+
+def run_scale_checks(n_areas=DEFAULT_SCALE_AREAS, n_days=DEFAULT_SCALE_DAYS, workers=None, seed=0,
+                     blank_ratio=DEFAULT_BLANK_RATIO, irregular=True):
+    """
+    数千地域の文書で、1スレッド・複数スレッド・複数プロセスの処理速度と結果を確認する。
+
+    複数スレッドでは1つの解析済みデータ（ParsedForecast）を共有し、
+    複数プロセスではプロセスごとに同じシード・条件から文書を作成して解析する。
+    文書は性質テストと同じく欠損値とtimeDefinesの欠け・重複・順序の入れ替わりを含み、
+    抽出関数の例外も参照実装と種類が一致することを確認する。
+
+    Args:
+        n_areas (int): 地域数
+        n_days (int): 日数（短期予報・週間予報の時刻の数が日数に比例して増える）
+        workers (int): スレッド数・プロセス数（省略時はCPUコア数）
+        seed (int): 文書のシード
+        blank_ratio (float): 欠損値の割合
+        irregular (bool): timeDefinesの欠け・追加・順序の入れ替わり、日の欠けを含めるか
+
+    Returns:
+        tuple: (測定結果のリスト, 不一致の説明のリスト)
+    """
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    forecast = make_random_forecast(rng, n_areas, n_days, blank_ratio=blank_ratio, irregular=irregular,
+                                    n_weekly_days=n_days)
+    generated = time.perf_counter() - started
+
+    target_date = _scale_target_date(forecast)
+    started = time.perf_counter()
+    parsed = ParsedForecast(forecast)
+    parse_seconds = time.perf_counter() - started
+    expected_areas = _outcome(reference_area_forecasts, forecast, target_date)
+    expected = reference_area_forecasts(forecast, target_date, per_function=True)
+
+    results = [("文書の作成", generated, None), ("ParsedForecast", parse_seconds, None)]
+    failures = []
+
+    def timed_run(name, run):
+        started = time.perf_counter()
+        checked, run_failures = run()
+        elapsed = time.perf_counter() - started
+        results.append((name, elapsed, checked / elapsed if elapsed else float("inf")))
+        failures.extend(f"[{name}] {failure}" for failure in run_failures)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        columns = extract_forecast_columns(parsed)
+        results.append(("extract_forecast_columns", time.perf_counter() - started, None))
+        if columns["short_term"]["pops"].shape != (n_areas, len(parsed.rain.time_defines)):
+            failures.append("extract_forecast_columns: 行列の大きさが一致しません")
+
+        def area_forecasts():
+            actual = _outcome(weather_forecast.extract_area_forecasts, parsed, target_date)
+            return n_areas, [] if actual == expected_areas else ["extract_area_forecasts: 参照実装と一致しません"]
+        timed_run("extract_area_forecasts", area_forecasts)
+
+        timed_run("1スレッド", lambda: _compare_extracted(_extract_range(parsed, target_date, range(n_areas)), expected))
+
+        def threads():
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                chunks = executor.map(lambda area_range: _extract_range(parsed, target_date, area_range),
+                                      _split(n_areas, workers * 4))
+                extracted = [item for chunk in chunks for item in chunk]
+            return _compare_extracted(extracted, expected)
+        timed_run(f"{workers}スレッド（共有）", threads)
+
+    def processes():
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(seed, n_areas, n_days, blank_ratio, irregular)) as executor:
+            extracted = [item for chunk in executor.map(_process_task, _split(n_areas, workers * 4))
+                         for item in chunk]
+        return _compare_extracted(extracted, expected)
+    timed_run(f"{workers}プロセス（起動・解析を含む）", processes)
+
+    return results, failures
+
+def show_scale_results(results, n_areas, n_days):
+    print(f"\n📈 負荷試験（{n_areas}地域 × {n_days}日）")
+    print(f"{'処理':<36} {'時間(ms)':>10} {'地域/秒':>12}")
+    for name, seconds, rate in results:
+        rate_display = f"{rate:>12.0f}" if rate is not None else f"{'-':>12}"
+        print(f"{name:<36} {seconds * 1000:>10.1f} {rate_display}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抽出処理の性質テストと大規模データでの負荷試験")
+    parser.add_argument("--cases", type=int, default=DEFAULT_CASES, help="性質テストで作成する文書の数")
+    parser.add_argument("--seed", type=int, default=0, help="最初の文書のシード（不一致の再現に使う）")
+    parser.add_argument("--blank-ratio", type=float, default=DEFAULT_BLANK_RATIO, help="欠損値（\"\"）の割合")
+    parser.add_argument("--areas", type=int, default=DEFAULT_SCALE_AREAS, help="負荷試験の地域数")
+    parser.add_argument("--days", type=int, default=DEFAULT_SCALE_DAYS, help="負荷試験の日数")
+    parser.add_argument("--workers", type=int, help="スレッド数・プロセス数（省略時はCPUコア数）")
+    parser.add_argument("--regular", action="store_true",
+                        help="負荷試験の文書にtimeDefinesの欠け・重複・順序の入れ替わりを含めない")
+    parser.add_argument("--skip-scale", action="store_true", help="負荷試験を行わない")
+    parser.add_argument("--save-failures", metavar="DIR", help="不一致があった文書を保存するディレクトリ")
+    args = parser.parse_args(argv)
+
+    print(f"🔍 性質テスト: {args.cases}件（シード{args.seed}〜{args.seed + args.cases - 1}）")
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        failures = run_property_checks(args.cases, args.seed, args.blank_ratio, args.save_failures)
+
+    if not args.skip_scale:
+        results, scale_failures = run_scale_checks(args.areas, args.days, args.workers, args.seed,
+                                                   args.blank_ratio, not args.regular)
+        show_scale_results(results, args.areas, args.days)
+        failures.extend(scale_failures)
+
+    if failures:
+        print(f"\n❌ 参照実装と一致しない結果が{len(failures)}件ありました:")
+        for failure in failures[:MAX_REPORTED_FAILURES]:
+            print(f"   {failure}")
+        return 1
+    print("\n✅ すべての結果が参照実装と一致しました")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
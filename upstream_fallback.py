@@ -0,0 +1,297 @@
+"""
+気象庁の応答が遅い・停止している場合のフォールバック
+
+取得はバックグラウンドのスレッドで行い、FALLBACK_BUDGET_SECONDS以内に終わらなければ
+前回取得できた値（天気予報はキャッシュ、観測値はアーカイブ）をその取得時刻とともにすぐ返す。
+取得自体は続けるため、常駐実行（デーモン・APIサーバー）では次回までに最新の値に置き換わる
+（1回だけの実行では、プロセスの終了とともに取得も打ち切られる）。
+続けて失敗した取得先はサーキットブレーカーで一定時間呼び出さず、保存済みの値だけを返す。
+サーキットブレーカーの状態はファイルに保存し、cronなどで繰り返し起動する実行やほかのプロセスと共有する。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+import instrumentation
+from forecast_cache import FORECAST_CACHE_DIR, JST
+
+# 取得を待つ時間の上限（秒、過ぎた場合は保存済みの値を返す）
+FALLBACK_BUDGET_SECONDS = float(os.getenv('FALLBACK_BUDGET_SECONDS', '5'))
+
+# 続けて失敗した回数がこれに達すると、取得先を呼び出さなくなる
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+
+# 呼び出しを止めてから、試しに1回呼び出すまでの時間（秒）
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '300'))
+
+# サーキットブレーカーの状態の保存先（空にすると保存せず、プロセス内だけで保持する）
+CIRCUIT_STATE_DIR = os.getenv('CIRCUIT_STATE_DIR', os.path.join(os.path.dirname(FORECAST_CACHE_DIR), "circuit"))
+
+# 取得結果（staleがTrueの場合は保存済みの値、fetched_atはその取得時刻）
+FallbackResult = namedtuple("FallbackResult", ["value", "stale", "fetched_at", "reason"])
+
+class CircuitOpenError(RuntimeError):
+    """
+    サーキットブレーカーが開いていて、取得先を呼び出さなかった場合のエラー。
+    """
+
+class CircuitBreaker:
+    """
+    続けて失敗した取得先の呼び出しを一定時間止めるサーキットブレーカー。
+
+    closed（通常）→ 失敗がfailure_thresholdに達するとopen（呼び出さない）→
+    reset_seconds経過後にhalf_open（1回だけ試す）→ 成功すればclosed、失敗すれば再びopen。
+    state_pathを指定すると、連続失敗回数と開いた時刻をファイルに保存し、判定のたびに読み直す
+    （half_openで試している最中かどうかはプロセスごとに持つ）。
+    """
+
+    def __init__(self, name, failure_threshold=None, reset_seconds=None, clock=None, state_path=None):
+        self.name = name
+        self.failure_threshold = CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_seconds = CIRCUIT_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.state_path = state_path
+        # プロセス間で共有する場合は、開いた時刻を実際の時刻で記録する
+        self._clock = clock or (time.time if state_path else time.monotonic)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def _load(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._failures = int(saved.get("failures", 0))
+        self._opened_at = saved.get("opened_at")
+
+    def _save(self):
+        if not self.state_path:
+            return
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"failures": self._failures, "opened_at": self._opened_at}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"⚠️  サーキットブレーカーの状態の保存に失敗しました: {e}")
+
+    @property
+    def state(self):
+        with self._lock:
+            self._load()
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or self._clock() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        取得先を呼び出してよいかを判定する（half_openでは同時に1回だけ許可する）。
+        """
+        with self._lock:
+            self._load()
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._load()
+            changed = self._failures or self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+            if changed:
+                self._save()
+
+    def record_failure(self):
+        with self._lock:
+            self._load()
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    instrumentation.increment("circuit_open", source=self.name)
+                self._opened_at = self._clock()
+            self._trial = False
+            self._save()
+
+class FallbackFetcher:
+    """
+    取得に時間の上限を設け、間に合わない・失敗した場合は保存済みの値を返す。
+
+    取得中のものがあれば新しく取得を始めずにその結果を待つため、
+    応答のない取得先に対してスレッドが増え続けることはない。
+    """
+
+    def __init__(self, name, fetch, load_stale, budget_seconds=None, breaker=None):
+        """
+        Args:
+            name (str): 取得先の名前（計測・表示用）
+            fetch (callable): 取得する関数（引数なし）
+            load_stale (callable): 保存済みの値を (値, 取得時刻) で返す関数（ない場合はNone）
+            budget_seconds (float): 取得を待つ時間の上限（省略時はFALLBACK_BUDGET_SECONDS）
+            breaker (CircuitBreaker): サーキットブレーカー（省略時は新しく作成）
+        """
+        self.name = name
+        self._fetch = fetch
+        self._load_stale = load_stale
+        self.budget_seconds = FALLBACK_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+        self.breaker = breaker or CircuitBreaker(name)
+        self._lock = threading.Lock()
+        self._inflight = None
+
+    def _run(self, future):
+        try:
+            value = self._fetch()
+        except BaseException as e:
+            self.breaker.record_failure()
+            future.set_exception(e)
+        else:
+            self.breaker.record_success()
+            future.set_result(value)
+        finally:
+            with self._lock:
+                if self._inflight is future:
+                    self._inflight = None
+
+    def refresh(self):
+        """
+        バックグラウンドでの取得を始める（取得中であればそれを返す）。
+
+        Returns:
+            Future: 取得結果（サーキットブレーカーが開いている場合はNone）
+        """
+        with self._lock:
+            if self._inflight is not None:
+                return self._inflight
+            if not self.breaker.allow():
+                return None
+            self._inflight = future = Future()
+        # 応答のない取得がプロセスの終了を妨げないよう、デーモンスレッドで実行する
+        threading.Thread(target=self._run, args=(future,), name=f"refresh-{self.name}", daemon=True).start()
+        return future
+
+    def get(self, budget_seconds=None):
+        """
+        値を取得する（上限時間内に取得できなければ保存済みの値を返す）。
+
+        保存済みの値がない場合は、取得が終わるまで待ってその結果を返す。
+
+        Args:
+            budget_seconds (float): 取得を待つ時間の上限（省略時はbudget_seconds）
+
+        Returns:
+            FallbackResult: 取得結果（reasonは "timeout", "error", "circuit_open" のいずれか、最新の場合はNone）
+
+        Raises:
+            CircuitOpenError: サーキットブレーカーが開いていて、保存済みの値もない場合
+            Exception: 取得に失敗し、保存済みの値もない場合は取得時のエラー
+        """
+        if budget_seconds is None:
+            budget_seconds = self.budget_seconds
+
+        future = self.refresh()
+        error = None
+        if future is None:
+            reason = "circuit_open"
+        else:
+            try:
+                value = future.result(timeout=budget_seconds)
+                instrumentation.increment("fallback", source=self.name, result="fresh")
+                return FallbackResult(value, False, datetime.now(JST), None)
+            except FutureTimeoutError:
+                reason = "timeout"
+            except Exception as e:
+                reason = "error"
+                error = e
+
+        stale = self._load_stale()
+        if stale is None:
+            instrumentation.increment("fallback", source=self.name, result="unavailable")
+            if reason == "timeout":
+                # 代わりに返す値がないため、取得が終わるまで待つ
+                value = future.result()
+                return FallbackResult(value, False, datetime.now(JST), None)
+            if error is not None:
+                raise error
+            raise CircuitOpenError(f"{self.name}の取得を一時停止しています（連続して失敗したため）")
+
+        instrumentation.increment("fallback", source=self.name, result=reason)
+        value, fetched_at = stale
+        return FallbackResult(value, True, fetched_at, reason)
+
+def describe_stale(result, now=None):
+    """
+    保存済みの値を使ったことを示す表示用の文字列を作成する。
+
+    Args:
+        result (FallbackResult): 取得結果
+        now (datetime): 現在時刻（省略時は実際の時刻）
+
+    Returns:
+        str: 取得時刻と経過時間（例: "7月1日 11:02取得・35分前"）、最新の値の場合は空文字列
+    """
+    if not result.stale:
+        return ""
+    if result.fetched_at is None:
+        return "取得時刻不明"
+    now = now or datetime.now(JST)
+    fetched_at = result.fetched_at.astimezone(JST)
+    minutes = max(0, int((now - fetched_at).total_seconds() // 60))
+    age = f"{minutes // 60}時間{minutes % 60}分前" if minutes >= 60 else f"{minutes}分前"
+    return f"{fetched_at.month}月{fetched_at.day}日 {fetched_at:%H:%M}取得・{age}"
+
+_fetchers = {}
+_fetchers_lock = threading.Lock()
+
+def circuit_state_path(name):
+    """
+    取得先の名前から、サーキットブレーカーの状態の保存先を作成する（保存しない場合はNone）。
+    """
+    state_dir = os.getenv('CIRCUIT_STATE_DIR', CIRCUIT_STATE_DIR)
+    if not state_dir:
+        return None
+    return os.path.join(state_dir, re.sub(r'[^0-9A-Za-z_.-]', '_', name) + ".json")
+
+def get_fallback_fetcher(name, fetch, load_stale):
+    """
+    プロセス内で共有するフォールバック付きの取得を取得する（名前ごとに初回呼び出し時に作成）。
+
+    サーキットブレーカーの状態と取得中のスレッドは、同じ名前の呼び出しで共有する
+    （サーキットブレーカーの状態はCIRCUIT_STATE_DIRに保存し、ほかのプロセスとも共有する）。
+
+    Args:
+        name (str): 取得先の名前（例: "forecast:250000", "observations"）
+        fetch (callable): 取得する関数（初回のみ使用）
+        load_stale (callable): 保存済みの値を返す関数（初回のみ使用）
+
+    Returns:
+        FallbackFetcher: 共有の取得
+    """
+    with _fetchers_lock:
+        fetcher = _fetchers.get(name)
+        if fetcher is None:
+            breaker = CircuitBreaker(name, state_path=circuit_state_path(name))
+            fetcher = _fetchers[name] = FallbackFetcher(name, fetch, load_stale, breaker=breaker)
+        return fetcher
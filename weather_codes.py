@@ -2,6 +2,8 @@
 気象庁の天気コード（weatherCode）辞書
 """
 
+import sys
+
 # 天気コードから天気情報（説明文と絵文字）へのマッピング
 WEATHER_DATA = {
     # 100番台: 晴れ系
@@ -135,32 +137,98 @@ WEATHER_DATA = {
     "450": {"description": "雪で雷を伴う", "emoji": "☃️⚡"}
 }
 
+# 天気コードの範囲
+WEATHER_CODE_MIN = 100
+WEATHER_CODE_MAX = 450
+
+def _build_weather_table():
+    """
+    WEATHER_DATAから、整数の天気コードで引ける固定長の表を作成する。
+
+    表の要素は (説明文, 絵文字) のタプルで、コードが定義されていない位置はNone。
+    同じ説明文・絵文字は同一の文字列オブジェクトを共有する。
+    """
+    table = [None] * (WEATHER_CODE_MAX - WEATHER_CODE_MIN + 1)
+    for code, weather_data in WEATHER_DATA.items():
+        table[int(code) - WEATHER_CODE_MIN] = (
+            sys.intern(weather_data["description"]),
+            sys.intern(weather_data["emoji"]),
+        )
+    return tuple(table)
+
+# 天気コード（整数）- WEATHER_CODE_MIN をインデックスとする (説明文, 絵文字) の表
+WEATHER_TABLE = _build_weather_table()
+
+# 文字列の天気コードから (説明文, 絵文字) への対応表（WEATHER_TABLEの要素を共有）
+_WEATHER_INFO_BY_CODE = {code: WEATHER_TABLE[int(code) - WEATHER_CODE_MIN] for code in WEATHER_DATA}
+
+# 未定義の天気コードに対する (説明文, 絵文字)（同じコードは一度だけ作成）
+_unknown_weather_info = {}
+_UNKNOWN_WEATHER_INFO_LIMIT = 256
+
+def _get_unknown_weather_info(weather_code):
+    weather_info = _unknown_weather_info.get(weather_code)
+    if weather_info is None:
+        weather_info = (f"不明な天気コード: {weather_code}", "")
+        if len(_unknown_weather_info) < _UNKNOWN_WEATHER_INFO_LIMIT:
+            _unknown_weather_info[weather_code] = weather_info
+    return weather_info
+
+def get_weather_info(weather_code):
+    """
+    weatherCodeから天気説明と絵文字をまとめて取得
+
+    Args:
+        weather_code (str | int): 気象庁の天気コード
+
+    Returns:
+        tuple: (天気の説明文, 絵文字) 未定義のコードは ("不明な天気コード: ...", "")
+    """
+    if isinstance(weather_code, int):
+        if WEATHER_CODE_MIN <= weather_code <= WEATHER_CODE_MAX:
+            weather_info = WEATHER_TABLE[weather_code - WEATHER_CODE_MIN]
+            if weather_info is not None:
+                return weather_info
+        return _get_unknown_weather_info(weather_code)
+
+    weather_info = _WEATHER_INFO_BY_CODE.get(weather_code)
+    if weather_info is not None:
+        return weather_info
+    return _get_unknown_weather_info(weather_code)
+
+def get_weather_infos(weather_codes):
+    """
+    天気コードの列をまとめて (天気説明, 絵文字) の列に変換
+
+    Args:
+        weather_codes (iterable): 天気コード（str または int）の列
+            （forecast_columnsの天気コードの行列の行・列もそのまま渡せる）
+
+    Returns:
+        list: (天気の説明文, 絵文字) のリスト
+    """
+    return [get_weather_info(weather_code) for weather_code in weather_codes]
+
 def get_weather_description(weather_code):
     """
     weatherCodeから天気説明を取得
     
     Args:
-        weather_code (str): 気象庁の天気コード
+        weather_code (str | int): 気象庁の天気コード
         
     Returns:
         str: 天気の説明文
     """
-    weather_data = WEATHER_DATA.get(weather_code)
-    if weather_data:
-        return weather_data["description"]
-    return f"不明な天気コード: {weather_code}"
+    return get_weather_info(weather_code)[0]
 
 def get_weather_emoji(weather_code):
     """
     weatherCodeから天気絵文字を取得
     
     Args:
-        weather_code (str): 気象庁の天気コード
+        weather_code (str | int): 気象庁の天気コード
         
     Returns:
         str: 天気に合う絵文字（マッピングが存在しない場合は空文字）
     """
-    weather_data = WEATHER_DATA.get(weather_code)
-    if weather_data:
-        return weather_data["emoji"]
-    return "" 
\ No newline at end of file
+    return get_weather_info(weather_code)[1]
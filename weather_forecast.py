@@ -1,112 +1,349 @@
-import requests
-import json
 import os
+import sys
 import warnings
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from instrumentation import timed, timer, increment, show_progress
 from weather_codes import get_weather_description, get_weather_emoji
-import re
-from dotenv import load_dotenv
+
+# requests・sqlite3・jsonなどの重いモジュールは、起動を速くするため使用する関数の中で読み込む
+# （--helpなどの短時間で終わる実行では読み込まない）
 
 # SSL警告を非表示にする（実際の通信には影響しない）
 warnings.filterwarnings('ignore', message='urllib3 v2 only supports OpenSSL 1.1.1+.*')
 
-# .envファイルから環境変数を読み込み
-load_dotenv()
+# 日本標準時（実行環境のタイムゾーンによらず、15時の判定や明日の日付は日本時間で行う）
+JST = timezone(timedelta(hours=9))
+
+_environment_loaded = False
+
+# 環境変数から設定を読み込む
+def _read_environment():
+    global DISCORD_WEBHOOK_URL, DISCORD_WEBHOOK_URLS, BATCH_MAX_WORKERS, TARGET_AREA_CODE, TARGET_STATION_CODE
+
+    # Discord Webhook URL設定
+    DISCORD_WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL', '')
+
+    # 複数のチャンネルに通知する場合のWebhook URL（カンマ区切り、DISCORD_WEBHOOK_URLと併用可）
+    DISCORD_WEBHOOK_URLS = [
+        url.strip() for url in [DISCORD_WEBHOOK_URL] + os.getenv('DISCORD_WEBHOOK_URLS', '').split(',')
+        if url.strip()
+    ]
+
+    # 複数予報区を一括取得する際の同時接続数の上限
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '16'))
 
-# Discord Webhook URL設定
-DISCORD_WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL', '')
+    # 対象地域の地域コード（例: 250020=北部）と、気温の予報・実績に使う観測地点コード（例: 60131=彦根）
+    # 未設定の場合はTARGET_AREA_INDEXの位置の地域・地点を使用
+    TARGET_AREA_CODE = os.getenv('TARGET_AREA_CODE', '')
+    TARGET_STATION_CODE = os.getenv('TARGET_STATION_CODE', '')
+
+_read_environment()
+
+def load_environment():
+    """
+    .envファイルから環境変数を読み込み、設定に反映する（2回目以降は何もしない）。
+    
+    モジュールの読み込み時には行わず、実際に処理を始めるときに呼び出す。
+    """
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    _environment_loaded = True
+    from dotenv import load_dotenv
+    load_dotenv()
+    _read_environment()
+
+# 気象庁の天気予報API（{office_code}に府県予報区コードが入る）
+FORECAST_API_URL_TEMPLATE = "https://www.jma.go.jp/bosai/forecast/data/forecast/{office_code}.json"
+
+# 滋賀県の府県予報区コード
+OFFICE_CODE = "250000"
 
 # 滋賀県の天気予報API
-FORECAST_API_URL = "https://www.jma.go.jp/bosai/forecast/data/forecast/250000.json"
+FORECAST_API_URL = FORECAST_API_URL_TEMPLATE.format(office_code=OFFICE_CODE)
+
+# 全国の府県予報区コード（北海道・鹿児島・沖縄は地方ごとに分割）
+ALL_OFFICE_CODES = (
+    "011000", "012000", "013000", "014030", "014100", "015000", "016000", "017000",
+    "020000", "030000", "040000", "050000", "060000", "070000",
+    "080000", "090000", "100000", "110000", "120000", "130000", "140000",
+    "150000", "160000", "170000", "180000", "190000", "200000",
+    "210000", "220000", "230000", "240000",
+    "250000", "260000", "270000", "280000", "290000", "300000",
+    "310000", "320000", "330000", "340000", "350000",
+    "360000", "370000", "380000", "390000",
+    "400000", "410000", "420000", "430000", "440000", "450000",
+    "460040", "460100", "471000", "472000", "473000", "474000",
+)
 
-# 対象地域: 0=南部, 1=北部
+# 対象地域: 0=南部, 1=北部（TARGET_AREA_CODE・TARGET_STATION_CODEが未設定の場合に使用）
 TARGET_AREA_INDEX = 1
 
 # 観測データHTML（毎日の全国データ）
 OBSERVATION_HTML_URL = "https://www.data.jma.go.jp/obd/stats/data/mdrr/synopday/data1s.html"
 
+# 今日の実測気温を取得する観測地点
+OBSERVATION_STATION_NAME = "彦根"
+
+# 観測データHTMLを読み込む単位（バイト）
+OBSERVATION_CHUNK_SIZE = 16 * 1024
+
 # テスト用時刻設定（None=実際の時刻を使用、数値=指定時刻でテスト）
 TEST_HOUR = None  # 例: 14で15時前をテスト、16で15時後をテスト
 
 # Discord通知機能
-def send_discord_notification(message):
+@timed("notify")
+def send_discord_notification(message, office_name=None):
     """
     Discord Webhookを使用してメッセージを送信する。
     
     Args:
         message (str): 送信するメッセージ
+        office_name (str): 府県予報区の表示名（ボットの表示名に使う、例: "滋賀県"）
         
     Returns:
         bool: 送信成功時True、失敗時False
     """
-    if not DISCORD_WEBHOOK_URL:
+    load_environment()
+    if not DISCORD_WEBHOOK_URLS:
         print("⚠️  Discord Webhook URLが設定されていません。")
         return False
     
+    print("📩 Discord通知送信中...")
+    
     try:
-        print("📩 Discord通知送信中...")
-        
-        # Discord Webhookに送信するデータ
-        data = {
-            "content": message,
-            "username": "滋賀県の天気予報"  # ボットの表示名
-        }
-        
-        response = requests.post(
-            DISCORD_WEBHOOK_URL,
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.status_code == 204:
+        from discord_notifier import NOTIFY_WAIT_SECONDS, get_notifier, office_username
+
+        # 設定されたすべてのWebhookへすぐに送信し（1件のため他の通知を待たない）、完了を待つ
+        delivery = get_notifier(DISCORD_WEBHOOK_URLS).notify(
+            message, coalesce=False, username=office_username(office_name))
+        if delivery.wait(NOTIFY_WAIT_SECONDS):
             print("✅ Discord通知送信成功")
             return True
-        else:
-            print(f"❌ Discord通知送信失敗: ステータスコード {response.status_code}")
-            print(f"レスポンス: {response.text}")
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Discord通知送信エラー: {e}")
+        if not delivery.done:
+            print(f"⏳ Discord通知が{NOTIFY_WAIT_SECONDS:.0f}秒以内に完了しませんでした"
+                  f"（送信はバックグラウンドで続けますが、このまま終了すると未送信の通知は破棄されます）")
         return False
     except Exception as e:
-        print(f"❌ Discord通知処理エラー: {e}")
+        print(f"❌ Discord通知処理エラー: {e}", file=sys.stderr)
         return False
 
+@timed("notify", kind="batch")
+def send_batch_discord_notifications(results, target_date=None, detect_changes=None):
+    """
+    get_weather_forecasts_batchの結果を予報区ごとのメッセージにしてDiscordに通知する。
+    
+    通知は埋め込みにまとめ、レート制限に合わせて各Webhookへ並行して送信する。
+    
+    Args:
+        results (list): get_weather_forecasts_batchの戻り値
+        target_date (datetime): 予報の対象日（省略時は明日）
+        detect_changes (bool): 前回の通知から変わっていない予報区を省略するか
+                               （省略時はFORECAST_CHANGE_DETECTION）
+        
+    Returns:
+        bool: すべての通知の送信に成功した場合True
+    """
+    import time
+    from discord_notifier import NOTIFY_WAIT_SECONDS, get_notifier, office_username
+    from forecast_state import FORECAST_CHANGE_DETECTION, format_change_message, state_key
+
+    load_environment()
+    if not DISCORD_WEBHOOK_URLS:
+        print("⚠️  Discord Webhook URLが設定されていません。")
+        return False
+    if target_date is None:
+        target_date = datetime.now(JST) + timedelta(days=1)
+    if detect_changes is None:
+        detect_changes = FORECAST_CHANGE_DETECTION
+    
+    # 前回の通知から予報が変わっていない予報区は通知しない
+    notifications = []
+    for result in results:
+        if "error" in result:
+            continue
+        fields = _forecast_state_fields(result["weather_code"], result["rain_values"],
+                                        result["max_temp"], result["min_temp"], False)
+        key = state_key(result["office_code"], result["area_name"], target_date)
+        changed, previous_fields, _ = _check_forecast_state(key, fields, detect_changes)
+        if not changed:
+            continue
+        message = format_discord_message(
+            result["area_name"], result["publishing_office"], result["report_datetime"],
+            False, None, None, result["weather"], result["rain_values"],
+            result["max_temp"], result["min_temp"], "-", "-", result["weather_code"],
+            target_date, office_code=result["office_code"])
+        if previous_fields is not None:
+            message = _append_change_message(message, format_change_message(previous_fields, fields))
+        notifications.append((key, fields, message, office_username(result.get("office_name"))))
+    
+    skipped = sum(1 for result in results if "error" not in result) - len(notifications)
+    if skipped:
+        print(f"♻️  前回の通知から予報に変化がない{skipped}件の通知を省略します。")
+    if not notifications:
+        return True
+    
+    print(f"📩 Discord通知送信中... ({len(notifications)}件)")
+    # ボットの表示名は予報区ごとに変える（例: "滋賀県の天気予報"）
+    deliveries = get_notifier(DISCORD_WEBHOOK_URLS).notify_many(
+        [message for _, _, message, _ in notifications],
+        usernames=[username for _, _, _, username in notifications])
+    succeeded = 0
+    deadline = time.monotonic() + NOTIFY_WAIT_SECONDS
+    for (key, fields, _, _), delivery in zip(notifications, deliveries):
+        if delivery.wait(max(0.0, deadline - time.monotonic())):
+            succeeded += 1
+            if detect_changes:
+                _record_forecast_state(key, fields)
+    if succeeded == len(deliveries):
+        print("✅ Discord通知送信成功")
+        return True
+    pending = sum(1 for delivery in deliveries if not delivery.done)
+    if pending:
+        print(f"⏳ {pending}件の通知が{NOTIFY_WAIT_SECONDS:.0f}秒以内に完了しませんでした"
+              f"（送信はバックグラウンドで続けますが、このまま終了すると未送信の通知は破棄されます）")
+    print(f"❌ Discord通知送信失敗: {len(deliveries) - succeeded}/{len(deliveries)}件", file=sys.stderr)
+    return False
+
+
+
+# 変化の検出に使う予報の項目
+def _forecast_state_fields(weather_code, rain_values, max_forecast, min_forecast, with_actual):
+    # with_actual: 当日の実績との比較を含むか（15時以降の通知は、予報が同じでも改めて送る）
+    return {
+        "weather_code": weather_code,
+        "rain_values": list(rain_values),
+        "max_forecast": max_forecast,
+        "min_forecast": min_forecast,
+        "with_actual": with_actual,
+    }
 
+def _check_forecast_state(key, fields, detect_changes):
+    # 変化の検出を行わない場合は常に「変わった」とする
+    if not detect_changes:
+        return True, None, None
+    from forecast_state import get_forecast_state_store
+    try:
+        return get_forecast_state_store().check(key, fields)
+    except OSError as e:
+        print(f"⚠️  予報の変化の判定に失敗しました: {e}")
+        return True, None, None
+
+def _append_change_message(message, change_message):
+    if not change_message:
+        return message
+    return f"{message}\n\n{change_message}"
+
+def format_stale_message(stale):
+    """
+    保存済みのデータを使ったことを知らせるDiscord用の文を作成する。
+    
+    Args:
+        stale (dict): 取得先（"予報", "実績"）→ 取得時刻・経過時間の表示
+        
+    Returns:
+        str: 通知に追記する文
+    """
+    details = "、".join(f"{source}: {description}" for source, description in stale.items())
+    return f"⚠️ 気象庁から最新のデータを取得できなかったため、保存済みのデータを使用しています（{details}）"
+
+def _record_forecast_state(key, fields):
+    from forecast_state import get_forecast_state_store
+    try:
+        get_forecast_state_store().record(key, fields)
+    except OSError as e:
+        print(f"⚠️  予報の状態の保存に失敗しました: {e}")
+
+def record_notified_forecast(result):
+    """
+    通知した予報を記録し、次回以降の変化の検出に使う。
+    
+    Args:
+        result (dict): get_weather_forecast_with_comparisonの戻り値
+    """
+    if result.get("state_key"):
+        _record_forecast_state(result["state_key"], result["state_fields"])
+
+# timeSeriesのインデックスを取得（未解析のdictの場合はその場で作成）
+def _as_time_series_index(time_series):
+    from forecast_index import TimeSeriesIndex
+    if isinstance(time_series, TimeSeriesIndex):
+        return time_series
+    return TimeSeriesIndex(time_series)
+
+# 地域コード（指定がなければ位置）から、areas内の位置を決める
+def _resolve_area_index(time_series_index, area_code, target_area_index):
+    if not area_code:
+        return target_area_index
+    position = time_series_index.area_position(area_code)
+    if position is None:
+        available = ", ".join(time_series_index.area_codes)
+        raise ValueError(f"地域コード {area_code} が見つかりません（{available}）")
+    return position
+
+def station_for_area(forecast_data, area_code):
+    """
+    地域コードに対応する気温の地点コードを求める。
+    
+    短期予報の天気の地域と気温の地点を、週間予報と同じ規則（forecast_weekly.pair_stations）で組にする。
+    
+    Args:
+        forecast_data (ParsedForecast): 解析済みの天気予報データ
+        area_code (str): 地域コード
+        
+    Returns:
+        str: 観測地点コード
+        
+    Raises:
+        ValueError: 地域が見つからない場合、または組にする地点がない場合
+    """
+    from forecast_weekly import pair_stations
+
+    weather_index = forecast_data.weather
+    temperature_index = forecast_data.temperature
+    area_index = _resolve_area_index(weather_index, area_code, None)
+    station_index = pair_stations(weather_index.area_codes, temperature_index.area_codes, {})[area_index]
+    if station_index is None:
+        available = ", ".join(temperature_index.area_codes)
+        raise ValueError(f"地域コード {area_code} に対応する気温の地点がわかりません。"
+                         f"TARGET_STATION_CODEを設定してください（{available}）")
+    return temperature_index.area_codes[station_index]
 
 # 天気予報データから指定日の天気情報を取得
-def get_weather_data(short_term_weather_series, target_date):
+@timed("extract", item="weather")
+def get_weather_data(short_term_weather_series, target_date, target_area_index=None, area_code=None):
     """
     天気予報データから指定日の天気情報を取得する。
     
     Args:
-        short_term_weather_series (dict): 短期予報の時系列データ
+        short_term_weather_series (dict | TimeSeriesIndex): 短期予報の時系列データ
         target_date (datetime): 取得対象の日付
+        target_area_index (int): 対象地域のインデックス（省略時はTARGET_AREA_INDEX）
+        area_code (str): 対象地域の地域コード（指定時はtarget_area_indexより優先）
         
     Returns:
         tuple: (地域名, 天気の文字列, 天気コード)
     """
 
-    print(f"🔍 天気データ取得開始...")
+    if show_progress():
+        print(f"🔍 天気データ取得開始...")
+
+    if target_area_index is None:
+        target_area_index = TARGET_AREA_INDEX
 
-    short_term_weather_time_defines = short_term_weather_series["timeDefines"]
+    weather_index = _as_time_series_index(short_term_weather_series)
+    target_area_index = _resolve_area_index(weather_index, area_code, target_area_index)
 
-    selected_weather_area = short_term_weather_series["areas"][TARGET_AREA_INDEX]
+    selected_weather_area = weather_index.areas[target_area_index]
     selected_area_name = selected_weather_area["area"]["name"]
 
-    target_date_index = None
-    for i, time_str in enumerate(short_term_weather_time_defines):
-        time_obj = datetime.fromisoformat(time_str)
-        if time_obj.date() == target_date.date():
-            target_date_index = i
-            break
-    
-    if target_date_index is None:
+    target_date_indices = weather_index.indices_for(target_date)
+    if not target_date_indices:
         raise ValueError(f"該当日 ({target_date.date()})のデータが見つかりません")
+    target_date_index = target_date_indices[0]
     
-    print(f"  該当日のインデックス: {target_date_index}")
+    if show_progress():
+        print(f"  該当日のインデックス: {target_date_index}")
     
     target_date_weather_code = selected_weather_area["weatherCodes"][target_date_index]
     target_date_weather = get_weather_description(target_date_weather_code)
@@ -114,53 +351,52 @@ def get_weather_data(short_term_weather_series, target_date):
     return selected_area_name, target_date_weather, target_date_weather_code
 
 # 降水確率データを取得
-def get_rain_data(rain_time_series, target_area_index, target_date):
+@timed("extract", item="rain")
+def get_rain_data(rain_time_series, target_area_index, target_date, area_code=None):
     """
     降水確率データを取得する。
     
     Args:
-        rain_time_series (dict): 降水確率時系列データ
+        rain_time_series (dict | TimeSeriesIndex): 降水確率時系列データ
         target_area_index (int): 対象地域のインデックス
         target_date (datetime): 取得対象の日付
+        area_code (str): 対象地域の地域コード（指定時はtarget_area_indexより優先）
         
     Returns:
         tuple: (地域名, 降水確率のリスト)
     """
-    print(f"🔍 降水確率データ取得開始...")
+    if show_progress():
+        print(f"🔍 降水確率データ取得開始...")
     
-    # 時系列データと地域データを分けて取得
-    rain_time_defines = rain_time_series["timeDefines"]
-    selected_rain_area = rain_time_series["areas"][target_area_index]
-    selected_area_name = selected_rain_area["area"]["name"]
-
-    target_date_index = []
-    for i, time_str in enumerate(rain_time_defines):
-        time_obj = datetime.fromisoformat(time_str)
-        if time_obj.date() == target_date.date():
-            target_date_index.append(i)
+    rain_index = _as_time_series_index(rain_time_series)
+    target_area_index = _resolve_area_index(rain_index, area_code, target_area_index)
+    selected_area_name = rain_index.areas[target_area_index]["area"]["name"]
 
+    target_date_index = rain_index.indices_for(target_date)
     if not target_date_index:
         raise ValueError(f"該当日 ({target_date.date()})のデータが見つかりません")
 
-    print(f"  該当日のインデックス: {target_date_index}")
+    if show_progress():
+        print(f"  該当日のインデックス: {target_date_index}")
 
-    target_date_rain_values = []
-    for index in target_date_index:
-        target_date_rain_values.append(selected_rain_area["pops"][index])
+    target_date_rain_values = rain_index.values(target_area_index, "pops", target_date)
 
-    print(f"  該当日の降水確率: {target_date_rain_values}")
+    if show_progress():
+        print(f"  該当日の降水確率: {target_date_rain_values}")
 
     return selected_area_name, target_date_rain_values
 
 # 気温データを取得し、最低気温と最高気温を計算
-def get_temperature_data(temperature_time_series, target_area_index, target_date):
+@timed("extract", item="temperature")
+def get_temperature_data(temperature_time_series, target_area_index, target_date, station_code=None):
     """
     気温データを取得し、最低気温と最高気温を計算する。
     
     Args:
-        temperature_time_series (dict): 気温時系列データ
+        temperature_time_series (dict | TimeSeriesIndex): 気温時系列データ
         target_area_index (int): 対象地域のインデックス
         target_date (datetime): 取得対象の日付
+        station_code (str): 観測地点コード（指定時はtarget_area_indexより優先）
         
     Returns:
         tuple: (最低気温, 最高気温, 地域名)
@@ -168,94 +404,672 @@ def get_temperature_data(temperature_time_series, target_area_index, target_date
     Raises:
         ValueError: 気温データの取得に失敗した場合
     """
-    print(f"🔍 気温データ取得開始...")
+    if show_progress():
+        print(f"🔍 気温データ取得開始...")
 
-    temp_time_defines = temperature_time_series["timeDefines"]
-    target_date_index = []
-    for i, time_str in enumerate(temp_time_defines):
-        time_obj = datetime.fromisoformat(time_str)
-        if time_obj.date() == target_date.date():
-            target_date_index.append(i)
+    temperature_index = _as_time_series_index(temperature_time_series)
+    target_area_index = _resolve_area_index(temperature_index, station_code, target_area_index)
 
+    target_date_index = temperature_index.indices_for(target_date)
     if not target_date_index:
         raise ValueError(f"該当日 ({target_date.date()})のデータが見つかりません")
     
-    print(f"  該当日のインデックス: {target_date_index}")
+    if show_progress():
+        print(f"  該当日のインデックス: {target_date_index}")
 
-    target_area_temps = temperature_time_series["areas"][target_area_index]["temps"]
-    temp_area_name = temperature_time_series["areas"][target_area_index]["area"]["name"]
+    temp_area_name = temperature_index.areas[target_area_index]["area"]["name"]
+    target_date_temp_values = temperature_index.values(target_area_index, "temps", target_date)
 
-    target_date_temp_values = []
-    for i in target_date_index:
-        target_date_temp_values.append(target_area_temps[i])
-
-    print(f"  該当日の気温データ: {target_date_temp_values}")
+    if show_progress():
+        print(f"  該当日の気温データ: {target_date_temp_values}")
     
     # 文字列を数値に変換してから最低・最高を計算
     numeric_temp_values = [float(temp) for temp in target_date_temp_values]
     min_temp = min(numeric_temp_values)  # 最低気温
     max_temp = max(numeric_temp_values)  # 最高気温
     
-    print(f"  計算結果: 最低{min_temp}℃, 最高{max_temp}℃")
-    print(f"✅ 気温データ取得成功")
+    if show_progress():
+        print(f"  計算結果: 最低{min_temp}℃, 最高{max_temp}℃")
+        print(f"✅ 気温データ取得成功")
     
     return min_temp, max_temp, temp_area_name
 
-# 気象庁観測データから彦根の今日の実際の気温を取得
-def get_today_actual_temperature():
+# 気象庁観測データから指定地点の今日の観測値をまとめて取得
+@timed("observations")
+def get_today_observations(station_names=None):
     """
-    気象庁の観測データWebページから彦根の今日の実際の気温を取得する。
+    気象庁の観測データWebページから、指定地点の今日の観測値をまとめて取得する。
     
-    HTMLページをスクレイピングして、彦根の最高気温と最低気温を抽出する。
-    データが取得できない場合は(None, None)を返す。
+    HTMLを受信しながら1回の走査で全地点の行を解析し、指定した地点が
+    すべて見つかった時点で読み込みを終了する。
     
+    Args:
+        station_names (iterable): 取得する地点名（省略時は全地点）
+        
     Returns:
-        tuple: 成功時は(最高気温, 最低気温)のfloat値、失敗時は(None, None)
+        dict: 地点名 → StationObservation(max_temp, max_time, min_temp, min_time)
+        
+    Raises:
+        requests.exceptions.RequestException: HTTPリクエストエラー
+    """
+    from http_session import get_session
+    from observation_parser import parse_observation_stream
+
+    response = get_session().get(OBSERVATION_HTML_URL, timeout=15, stream=True)
+    try:
+        response.raise_for_status()
+        return parse_observation_stream(
+            response.iter_content(chunk_size=OBSERVATION_CHUNK_SIZE),
+            stations=station_names,
+            encoding='utf-8',
+        )
+    finally:
+        # 途中で読み込みを終えた場合も接続を解放する
+        response.close()
+
+# 今日の全地点の観測値を1日1回だけ取得
+def collect_today_observations(force=False):
+    """
+    観測データWebページから今日の全地点の観測値を取得し、履歴アーカイブに保存する。
+    
+    取得済みの日は通信せずに保存済みの値を返すため、複数地点の実績・前日比を
+    1回のダウンロードでまかなえる（取得し直す間隔はOBSERVATION_MAX_AGE_SECONDS）。
     
+    Args:
+        force (bool): 取得済みでも取得し直すか
+        
+    Returns:
+        dict: 地点名 → StationObservation(max_temp, max_time, min_temp, min_time)
+        
     Raises:
         requests.exceptions.RequestException: HTTPリクエストエラー
-        Exception: その他の処理エラー
     """
+    from observation_collector import get_observation_collector
+
+    observations, fetched = get_observation_collector(get_today_observations).collect(force=force)
+    increment("observation_store", result="miss" if fetched else "hit")
+    if fetched:
+        print(f"🗄️  全地点の観測値を取得しました: {len(observations)}地点")
+    else:
+        print(f"📦 保存済みの観測値を使用: {len(observations)}地点")
+    return observations
+
+# 今日の全地点の観測値を時間の上限つきで取得（間に合わなければ保存済みの値）
+def fetch_today_observations_with_fallback():
+    """
+    今日の全地点の観測値を取得する。FALLBACK_BUDGET_SECONDS以内に取得できない場合や
+    取得に失敗した場合は、今日すでに取得した観測値を取得時刻とともに返す。
+    
+    Returns:
+        FallbackResult: 取得結果（value: 地点名 → StationObservation）
+        
+    Raises:
+        requests.exceptions.RequestException: 取得に失敗し、今日の保存済みの値もない場合
+    """
+    from observation_collector import get_observation_collector
+    from upstream_fallback import get_fallback_fetcher
+
+    collector = get_observation_collector(get_today_observations)
+    fetcher = get_fallback_fetcher("observations", collect_today_observations, collector.last_collected)
+    return fetcher.get()
+
+def _get_today_actual(station_name):
+    """
+    今日の実績気温と、保存済みの観測値を使った場合はその取得結果を返す。
+    
+    Returns:
+        tuple: (最高気温, 最低気温, FallbackResult)、取得できない場合は(None, None, None)
+    """
+    import requests
+    from upstream_fallback import describe_stale
+
     print("🔍 今日の実際の気温データ取得開始...")
     
     try:
-        response = requests.get(OBSERVATION_HTML_URL, timeout=15)
-        response.raise_for_status()
-        response.encoding = 'utf-8'  # 文字エンコーディングを明示的に設定
-        html_content = response.text
-        
-        # 彦根の行を検索
-        hikone_pattern = r'彦根.*?(\d+\.\d+)\].*?(\d+:\d+)\].*?(\d+\.\d+)\].*?(\d+:\d+)\].*?(\d+\.\d+)\]'
-        matches = re.search(hikone_pattern, html_content)
+        fetched = fetch_today_observations_with_fallback()
+        observation = fetched.value.get(station_name)
         
-        if matches:
-            max_temp = float(matches.group(3)) # 最高気温
-            min_temp = float(matches.group(5)) # 最低気温
+        if observation:
+            max_temp = observation.max_temp # 最高気温
+            min_temp = observation.min_temp # 最低気温
             
-            print(f"  彦根の今日の実績（HTML取得）: 最高{max_temp}℃、最低{min_temp}℃")
+            if fetched.stale:
+                print(f"⚠️  観測データを取得できないため、保存済みの観測値を使用します（{describe_stale(fetched)}）")
+            print(f"  {station_name}の今日の実績（HTML取得）: 最高{max_temp}℃、最低{min_temp}℃")
             print("✅ 今日の実績気温取得成功（HTML）")
             
-            return max_temp, min_temp
+            return max_temp, min_temp, fetched
         else:
             # 最終フォールバック
             print("⚠️  観測データの解析に失敗しました。")
-            return None, None
+            return None, None, None
             
     except requests.exceptions.RequestException as e:
         print(f"⚠️  観測データ取得エラー: {e}")
-        return None, None
+        return None, None, None
     except Exception as e:
         print(f"⚠️  観測データ処理エラー: {e}")
-        return None, None
+        return None, None, None
+
+# 気象庁観測データから彦根の今日の実際の気温を取得
+def get_today_actual_temperature(station_name=OBSERVATION_STATION_NAME):
+    """
+    気象庁の観測データWebページから彦根の今日の実際の気温を取得する。
+    
+    全地点の観測値（collect_today_observations）から彦根の最高気温と最低気温を抽出する。
+    観測データを時間内に取得できない場合は、今日すでに取得した観測値を使う。
+    データが取得できない場合は(None, None)を返す。
+    
+    Args:
+        station_name (str): 観測地点名（省略時はOBSERVATION_STATION_NAME）
+    
+    Returns:
+        tuple: 成功時は(最高気温, 最低気温)のfloat値、失敗時は(None, None)
+    """
+    max_temp, min_temp, _ = _get_today_actual(station_name)
+    return max_temp, min_temp
 
 
+# 天気予報APIからjsonデータを取得
+def fetch_forecast_data(office_code=OFFICE_CODE, use_cache=None):
+    """
+    気象庁の天気予報APIから指定した府県予報区のjsonデータを取得する。
+    
+    キャッシュが有効な場合は、次回の発表時刻まではディスクに保存した
+    データを返し、それ以降は条件付きGETで更新の有無を確認する。
+    
+    Args:
+        office_code (str): 府県予報区コード（例: "250000"）
+        use_cache (bool): キャッシュを使用するか（省略時はFORECAST_CACHE_ENABLED）
+        
+    Returns:
+        list: 天気予報データ（[0]=短期予報, [1]=週間予報）
+        
+    Raises:
+        requests.exceptions.RequestException: HTTPリクエストエラー
+        json.JSONDecodeError: 応答がjsonとして解析できない場合
+    """
+    from http_session import get_session
+    from forecast_json import loads_forecast
+    import forecast_cache
+
+    if use_cache is None:
+        use_cache = forecast_cache.FORECAST_CACHE_ENABLED
+
+    url = FORECAST_API_URL_TEMPLATE.format(office_code=office_code)
+    with timer("fetch", office=office_code):
+        if use_cache:
+            forecast_data, cache_status = forecast_cache.get_forecast_cache().fetch(url, office_code, timeout=10)
+            # fresh（有効期限内）・not_modified（304応答）はキャッシュの利用、updatedは取得
+            increment("forecast_cache", result=cache_status)
+            if cache_status == "fresh":
+                print(f"📦 キャッシュを使用: {office_code}（次回の発表時刻まで有効）")
+            elif cache_status == "not_modified":
+                print(f"📦 キャッシュを使用: {office_code}（更新なし）")
+            return forecast_data
+
+        response = get_session().get(url, timeout=10)
+        response.raise_for_status()
+        return loads_forecast(response.content)
+
+# 天気予報を時間の上限つきで取得（間に合わなければ前回取得した予報）
+def fetch_forecast_data_with_fallback(office_code=OFFICE_CODE):
+    """
+    天気予報jsonを取得する。FALLBACK_BUDGET_SECONDS以内に取得できない場合や
+    取得に失敗した場合は、キャッシュに保存済みの前回の予報を取得時刻とともに返す。
+    
+    常駐実行（デーモン・APIサーバー）では取得をバックグラウンドで続けるため、応答が遅いだけであれば
+    次回の実行では最新の予報になる（1回だけの実行では、終了とともに取得も打ち切られる）。
+    続けて失敗した場合は、一定時間（CIRCUIT_RESET_SECONDS）取得を試みずに前回の予報を返す
+    （失敗の回数はファイルに保存するため、cronなどで繰り返し起動する場合も数える）。
+    
+    Args:
+        office_code (str): 府県予報区コード
+        
+    Returns:
+        FallbackResult: 取得結果（value: 天気予報データ）
+        
+    Raises:
+        requests.exceptions.RequestException: 取得に失敗し、保存済みの予報もない場合
+    """
+    import forecast_cache
+    from upstream_fallback import get_fallback_fetcher
+
+    fetcher = get_fallback_fetcher(
+        f"forecast:{office_code}",
+        lambda: fetch_forecast_data(office_code),
+        lambda: forecast_cache.get_forecast_cache().load_stale(office_code),
+    )
+    return fetcher.get()
+
+# 府県予報区の表示名を取得
+def office_name(parsed_forecast, office_code=OFFICE_CODE):
+    """
+    府県予報区の表示名（例: "滋賀県"）を取得する。
+    
+    週間予報に府県予報区コードと同じ地域があればその名前を、なければ発表元を返す。
+    
+    Args:
+        parsed_forecast (ParsedForecast): 解析済みの天気予報データ
+        office_code (str): 府県予報区コード
+        
+    Returns:
+        str: 表示名
+    """
+    for time_series in parsed_forecast.weekly:
+        position = time_series.area_position(office_code)
+        if position is not None:
+            return time_series.areas[position]["area"]["name"]
+    return parsed_forecast.publishing_office
+
+# 天気予報データを履歴アーカイブに保存
+def archive_forecast(forecast_data, office_code=OFFICE_CODE):
+    """
+    天気予報データを履歴アーカイブに追記保存する。
+    
+    保存に失敗しても天気予報の処理は継続できるよう、エラーは表示のみとする。
+    
+    Args:
+        forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+        office_code (str): 府県予報区コード
+        
+    Returns:
+        bool: 新しく保存した場合True、保存済み・無効・失敗の場合False
+    """
+    import sqlite3
+    import forecast_archive
+
+    if not forecast_archive.FORECAST_ARCHIVE_ENABLED:
+        return False
+    try:
+        archived = forecast_archive.get_forecast_archive().append(forecast_data, office_code)
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  アーカイブ保存エラー: {e}")
+        return False
+    if archived:
+        print(f"🗄️  アーカイブに保存しました: {office_code}")
+    return archived
+
+# 天気予報を列指向のファイルにエクスポート
+def export_forecasts(forecasts):
+    """
+    天気予報の全地域・全timeSeriesを、府県予報区・発表日ごとのParquet（pyarrowがない場合はCSV）に書き出す。
+    
+    出力先（FORECAST_EXPORT_DIR）が設定されていない場合は何もしない。
+    書き出しに失敗しても天気予報の処理は継続できるよう、エラーは表示のみとする。
+    
+    Args:
+        forecasts (list): (府県予報区コード, 天気予報データ) の組のリスト
+        
+    Returns:
+        int: 書き出した行数の合計（無効・書き出し済み・失敗の場合は0）
+    """
+    import forecast_export
+
+    if not forecast_export.export_directory() or not forecasts:
+        return 0
+    try:
+        exporter = forecast_export.get_forecast_exporter()
+        with timer("export", format=exporter.format):
+            exported = exporter.export_many(forecasts)
+    except (ImportError, ValueError, OSError) as e:
+        print(f"⚠️  エクスポートエラー: {e}")
+        return 0
+    total_rows = 0
+    for path, rows in exported:
+        if rows:
+            print(f"📤 エクスポートしました: {path}（{rows}行）")
+        total_rows += rows
+    return total_rows
+
+# 今日の観測値を履歴アーカイブに保存
+def archive_observations(observations, observed_date=None):
+    """
+    観測値を履歴アーカイブに保存する（予報の検証に使用）。
+    
+    Args:
+        observations (dict): 地点名 → StationObservation
+        observed_date (date): 観測日（省略時は今日）
+        
+    Returns:
+        int: 保存した地点数（無効・失敗の場合は0）
+    """
+    import sqlite3
+    import forecast_archive
+
+    if not forecast_archive.FORECAST_ARCHIVE_ENABLED:
+        return 0
+    if observed_date is None:
+        observed_date = datetime.now(forecast_archive.JST).date()
+    try:
+        return forecast_archive.get_forecast_archive().append_observations(observed_date, observations)
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  アーカイブ保存エラー: {e}")
+        return 0
+
+# 天気予報データから指定日の天気・降水確率・気温をまとめて取得
+@timed("extract", item="summary")
+def extract_forecast_summary(forecast_data, target_date, target_area_index=None):
+    """
+    天気予報データから指定日の天気・降水確率・気温をまとめて取得する。
+    
+    Args:
+        forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+        target_date (datetime): 取得対象の日付
+        target_area_index (int): 対象地域のインデックス（省略時はTARGET_AREA_INDEX）
+        
+    Returns:
+        dict: 発表元・発表時刻・天気・降水確率・気温をまとめた辞書
+    """
+    from forecast_index import ParsedForecast
+
+    if target_area_index is None:
+        target_area_index = TARGET_AREA_INDEX
+
+    if not isinstance(forecast_data, ParsedForecast):
+        forecast_data = ParsedForecast(forecast_data)
+
+    area_name, weather, weather_code = get_weather_data(forecast_data.weather, target_date, target_area_index)
+    _, rain_values = get_rain_data(forecast_data.rain, target_area_index, target_date)
+    min_temp, max_temp, temp_area_name = get_temperature_data(forecast_data.temperature, target_area_index, target_date)
+
+    return {
+        "publishing_office": forecast_data.publishing_office,
+        "report_datetime": forecast_data.report_datetime,
+        "area_name": area_name,
+        "weather": weather,
+        "weather_code": weather_code,
+        "rain_values": rain_values,
+        "min_temp": min_temp,
+        "max_temp": max_temp,
+        "temp_area_name": temp_area_name,
+    }
+
+# 地域・観測地点の指定を解析
+def parse_area_selection(specs):
+    """
+    "地域コード" または "地域コード:観測地点コード" の指定を解析する。
+    
+    Args:
+        specs (iterable): 指定の文字列（カンマ区切りも可）
+        
+    Returns:
+        list: (地域コード, 観測地点コード（指定なしはNone）) のリスト
+    """
+    selections = []
+    for spec in specs:
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            area_code, _, station_code = item.partition(":")
+            selections.append((area_code, station_code or None))
+    return selections
+
+# 天気予報データから複数地域の指定日の予報をまとめて取得
+def extract_area_forecasts(forecast_data, target_date, selections=None):
+    """
+    天気予報データから、複数地域の指定日の天気・降水確率・気温をまとめて取得する。
+    
+    各timeSeriesの日付の位置は1回だけ求め、地域は地域コードのインデックスで引く。
+    観測地点を指定しない地域は、気温の時系列で同じ位置にある地点を使う。
+    
+    Args:
+        forecast_data (list | ParsedForecast): 天気予報APIのjsonデータ、または解析済みのデータ
+        target_date (datetime): 取得対象の日付
+        selections (list): parse_area_selectionの戻り値（省略時は全地域）
+        
+    Returns:
+        list: 地域ごとの辞書（area_code, area_name, weather, weather_code, rain_values,
+              station_code, station_name, min_temp, max_temp）のリスト
+        
+    Raises:
+        ValueError: 該当日のデータ、または指定した地域・観測地点が見つからない場合
+    """
+    from forecast_index import ParsedForecast
+
+    if not isinstance(forecast_data, ParsedForecast):
+        forecast_data = ParsedForecast(forecast_data)
+    weather_index = forecast_data.weather
+    rain_index = forecast_data.rain
+    temperature_index = forecast_data.temperature
+
+    weather_positions = weather_index.indices_for(target_date)
+    rain_positions = rain_index.indices_for(target_date)
+    temperature_positions = temperature_index.indices_for(target_date)
+    if not weather_positions:
+        raise ValueError(f"該当日 ({target_date.date()})のデータが見つかりません")
+    weather_position = weather_positions[0]
+
+    if selections is None:
+        selections = [(code, None) for code in weather_index.area_codes]
+
+    forecasts = []
+    for area_code, station_code in selections:
+        area_index = _resolve_area_index(weather_index, area_code, None)
+        weather_area = weather_index.areas[area_index]
+        weather_code = weather_area["weatherCodes"][weather_position]
+
+        rain_values = []
+        rain_area_index = rain_index.area_position(area_code)
+        if rain_area_index is not None:
+            rain_values = [rain_index.areas[rain_area_index]["pops"][i] for i in rain_positions]
+
+        if station_code:
+            station_index = _resolve_area_index(temperature_index, station_code, None)
+        else:
+            station_index = area_index if area_index < len(temperature_index.areas) else None
+
+        min_temp = max_temp = station_name = None
+        if station_index is not None:
+            station = temperature_index.areas[station_index]
+            station_code = station["area"]["code"]
+            station_name = station["area"]["name"]
+            temps = [float(station["temps"][i]) for i in temperature_positions if station["temps"][i] != ""]
+            if temps:
+                min_temp, max_temp = min(temps), max(temps)
+
+        forecasts.append({
+            "area_code": area_code,
+            "area_name": weather_area["area"]["name"],
+            "weather": get_weather_description(weather_code),
+            "weather_code": weather_code,
+            "rain_values": rain_values,
+            "station_code": station_code,
+            "station_name": station_name,
+            "min_temp": min_temp,
+            "max_temp": max_temp,
+        })
+    return forecasts
+
+# 1回の取得で複数地域の予報と実績を表示
+def show_area_forecasts(selections=None, office_code=OFFICE_CODE, now=None):
+    """
+    1回の取得で、複数地域の明日の予報（15時以降は今日の実績も）を一覧表示する。
+    
+    天気予報jsonと観測データHTMLはそれぞれ1回だけ取得する。
+    
+    Args:
+        selections (list): parse_area_selectionの戻り値（省略時は全地域）
+        office_code (str): 府県予報区コード
+        now (datetime): 現在時刻（省略時は実際の時刻）
+        
+    Returns:
+        list: extract_area_forecastsの戻り値に実績（actual_max/actual_min）を加えたもの
+    """
+    from forecast_index import ParsedForecast
+
+    current_time = now if now is not None else datetime.now(JST)
+    target_date = current_time + timedelta(days=1)
+
+    forecast_data = ParsedForecast(fetch_forecast_data(office_code))
+    archive_forecast(forecast_data, office_code)
+    forecasts = extract_area_forecasts(forecast_data, target_date, selections)
+    export_forecasts([(office_code, forecast_data)])
+
+    # 15時以降は、すべての地点の実績を1日1回取得する全地点の観測値から読む
+    observations = {}
+    if current_time.hour >= 15:
+        try:
+            observations = collect_today_observations()
+        except Exception as e:
+            print(f"⚠️  観測データ取得エラー: {e}")
+
+    print(f"\n" + "="*60)
+    print(f"🗾 {forecast_data.publishing_office} {target_date.month}月{target_date.day}日の天気予報 ({len(forecasts)}地域)")
+    print(f"="*60)
+    for forecast in forecasts:
+        observation = observations.get(forecast["station_name"])
+        forecast["actual_max"] = observation.max_temp if observation else None
+        forecast["actual_min"] = observation.min_temp if observation else None
+
+        rain_display = "/".join(forecast["rain_values"]) or "-"
+        line = (f"{forecast['area_code']} {forecast['area_name']}: {forecast['weather']} "
+                f"降水確率{rain_display}% ")
+        if forecast["station_name"]:
+            line += f"{forecast['station_name']} 最高{forecast['max_temp']}℃ 最低{forecast['min_temp']}℃"
+        if observation:
+            line += f"（今日の実績 最高{observation.max_temp}℃ 最低{observation.min_temp}℃）"
+        print(line)
+    print(f"="*60)
+    return forecasts
+
+# 週間予報を全地域まとめて表示
+def show_weekly_forecast(office_code=OFFICE_CODE, forecast_data=None):
+    """
+    週間予報（7日分の天気・降水確率・信頼度・予想気温と平年差）を全地域まとめて表示する。
+    
+    Args:
+        office_code (str): 府県予報区コード
+        forecast_data (list | ParsedForecast): 天気予報データ（省略時は取得する）
+        
+    Returns:
+        list: WeeklyForecast.to_recordsの戻り値
+    """
+    from forecast_weekly import get_weekly_forecast
+
+    if forecast_data is None:
+        forecast_data = fetch_forecast_data(office_code)
+    with timer("extract", item="weekly"):
+        weekly = get_weekly_forecast(forecast_data)
+        records = weekly.to_records()
+
+    format_anomaly = lambda value: "-" if value is None else f"{value:+.1f}"
+    format_value = lambda value: "-" if value is None else f"{value:g}"
+
+    def format_temperature(day, key):
+        # 予想気温（予測範囲）と平年差（例: 32℃[30〜35](+3.3)）
+        text = f"{format_value(day[f'temp_{key}'])}℃"
+        if day[f"temp_{key}_lower"] is not None and day[f"temp_{key}_upper"] is not None:
+            text += f"[{format_value(day[f'temp_{key}_lower'])}〜{format_value(day[f'temp_{key}_upper'])}]"
+        return text + f"({format_anomaly(day[f'temp_{key}_anomaly'])})"
+
+    print(f"\n" + "="*60)
+    print(f"📆 {weekly.publishing_office} 週間天気予報（発表: {weekly.report_datetime}）")
+    print(f"="*60)
+    for record in records:
+        print(f"{record['area_code']} {record['area_name']}（{record['station_name'] or '気温なし'}）")
+        normal = record["temp_average"]
+        precip_normal = record["precip_average"]
+        if normal or precip_normal:
+            line = "   平年値:"
+            if normal:
+                line += f" 最高{format_value(normal['max'])}℃ 最低{format_value(normal['min'])}℃"
+            if precip_normal:
+                line += f" 7日間降水量{format_value(precip_normal['min'])}〜{format_value(precip_normal['max'])}mm"
+            print(line)
+        for day in record["days"]:
+            weather = day["weather"] or "-"
+            pop = "-" if day["pop"] is None else f"{day['pop']}%"
+            reliability = day["reliability"] or "-"
+            print(f"   {day['date'][5:]} {get_weather_emoji(day['weather_code']) if day['weather_code'] else ' '} "
+                  f"{weather} 降水確率{pop} 信頼度{reliability} "
+                  f"最高{format_temperature(day, 'max')} 最低{format_temperature(day, 'min')}")
+    print(f"="*60)
+    return records
+
+# 複数の府県予報区の天気予報を並行して取得
+@timed("batch")
+def get_weather_forecasts_batch(office_codes, target_date=None, max_workers=None, target_area_index=None):
+    """
+    複数の府県予報区の天気予報をスレッドプールで並行して取得する。
+    
+    各予報区のjsonを同時に取得し、get_weather_data / get_rain_data /
+    get_temperature_data で指定日のデータを取り出す。1つの予報区で
+    エラーが発生しても他の予報区の処理は継続する。
+    
+    Args:
+        office_codes (list): 府県予報区コードのリスト
+        target_date (datetime): 取得対象の日付（省略時は明日）
+        max_workers (int): 同時接続数の上限（省略時はBATCH_MAX_WORKERS）
+        target_area_index (int): 対象地域のインデックス（省略時はTARGET_AREA_INDEX）
+        
+    Returns:
+        list: office_codesと同じ順序の結果辞書のリスト。
+              失敗した予報区は {"office_code": ..., "error": ...} となる
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from forecast_index import ParsedForecast
+
+    load_environment()
+    if target_date is None:
+        target_date = datetime.now(JST) + timedelta(days=1)
+    if max_workers is None:
+        max_workers = BATCH_MAX_WORKERS
+    office_codes = list(office_codes)
+    if not office_codes:
+        return []
+
+    # 取得できた予報区の天気予報（最後にまとめてエクスポートする）
+    fetched = []
+
+    def fetch_one(office_code):
+        try:
+            forecast_data = ParsedForecast(fetch_forecast_data(office_code))
+            archive_forecast(forecast_data, office_code)
+            summary = extract_forecast_summary(forecast_data, target_date, target_area_index)
+        except Exception as e:
+            return {"office_code": office_code, "error": f"{type(e).__name__}: {e}"}
+        fetched.append((office_code, forecast_data))
+        summary["office_code"] = office_code
+        summary["office_name"] = office_name(forecast_data, office_code)
+        return summary
+
+    # executor.mapは入力順に結果を返すため、予報区の順序が保たれる
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(office_codes)))) as executor:
+        results = list(executor.map(fetch_one, office_codes))
+    export_forecasts(fetched)
+    return results
+
+# 一括取得の結果を一覧表示
+def show_batch_results(results):
+    """
+    get_weather_forecasts_batchの結果を一覧表示する。
+    
+    Args:
+        results (list): get_weather_forecasts_batchの戻り値
+    """
+    print(f"\n" + "="*60)
+    print(f"🗾 一括取得結果 ({len(results)}予報区)")
+    print(f"="*60)
+    for result in results:
+        if "error" in result:
+            print(f"❌ {result['office_code']}: {result['error']}", file=sys.stderr)
+            continue
+        rain_display = "/".join(result["rain_values"])
+        print(f"{result['office_code']} {result['publishing_office']} ({result['area_name']}): "
+              f"{result['weather']} 降水確率{rain_display}% "
+              f"最高{result['max_temp']}℃ 最低{result['min_temp']}℃")
+    print(f"="*60)
 
 # Discord用メッセージフォーマット関数
+@timed("format")
 def format_discord_message(selected_area_name, publishing_office, formatted_report_time, 
                           is_after_17, today_max_actual, today_min_actual,
                           tomorrows_weather, target_date_rain_values, 
                           tomorrow_max_forecast, tomorrow_min_forecast,
-                          max_diff_str, min_diff_str, weather_code):
+                          max_diff_str, min_diff_str, weather_code, target_date=None,
+                          office_code=OFFICE_CODE):
     """
     天気予報データをDiscord用のメッセージにフォーマットする。
     
@@ -273,12 +1087,14 @@ def format_discord_message(selected_area_name, publishing_office, formatted_repo
         max_diff_str (str): 最高気温の前日比
         min_diff_str (str): 最低気温の前日比
         weather_code (str): 天気コード
+        target_date (datetime): 予報の対象日（省略時は実際の時刻の明日）
+        office_code (str): 気象庁の天気予報ページへのリンクに使う府県予報区コード
         
     Returns:
         str: Discord用フォーマット済みメッセージ
     """
     # 明日の日付を取得
-    tomorrow_date = datetime.now() + timedelta(days=1)
+    tomorrow_date = target_date if target_date is not None else datetime.now(JST) + timedelta(days=1)
     date_str = f"{tomorrow_date.month}月{tomorrow_date.day}日"
     
     # 天気に合う絵文字を取得
@@ -305,19 +1121,56 @@ def format_discord_message(selected_area_name, publishing_office, formatted_repo
 - 最高気温：{tomorrow_max_forecast}℃ (前日比{max_diff_str})
 - 最低気温：{tomorrow_min_forecast}℃ (前日比{min_diff_str})
 
-[気象庁の天気予報](<https://www.jma.go.jp/bosai/forecast/#area_type=offices&area_code=250000>)
-[おうみ発630の天気予報(平日のみ)](<https://www.nhk.jp/p/omi630/ts/8RG6LZ736N/list/>)"""
+[気象庁の天気予報](<https://www.jma.go.jp/bosai/forecast/#area_type=offices&area_code={office_code}>)"""
+    # 滋賀県の地域番組へのリンクは滋賀県の予報区のみ
+    if office_code == OFFICE_CODE:
+        message += "\n[おうみ発630の天気予報(平日のみ)](<https://www.nhk.jp/p/omi630/ts/8RG6LZ736N/list/>)"
     
     return message
 
 # 天気予報と今日の実績気温、前日比を取得して表示
-def get_weather_forecast_with_comparison(send_to_discord=False):
+@timed("pipeline")
+def get_weather_forecast_with_comparison(send_to_discord=False, now=None, forecast_data=None,
+                                         today_actual=None, format_message=None, detect_changes=None,
+                                         office_code=OFFICE_CODE):
+    """
+    明日の天気予報と今日の実績気温、前日比を取得して表示する。
+    
+    now・forecast_data・today_actualを指定すると、通信せずに記録済みのデータで
+    処理を再現できる（リプレイモード）。
+    
+    Args:
+        send_to_discord (bool): Discord通知を送信するか
+        now (datetime): 実行時刻（省略時は実際の日本時間、TEST_HOURより優先。リプレイでは仮想時刻）
+        forecast_data (list): 天気予報データ（省略時はAPIから取得）
+        today_actual (tuple): 今日の実績 (最高気温, 最低気温)（省略時は観測データHTMLから取得）
+        format_message (bool): Discord用メッセージを作成するか（省略時はsend_to_discordと同じ）
+        detect_changes (bool): 前回の通知から予報が変わっていなければメッセージの作成と通知を
+                               省略するか（省略時はDiscord通知を送信する場合のみFORECAST_CHANGE_DETECTION）
+        office_code (str): 府県予報区コード（取得・アーカイブ・エクスポート・変化の検出・リンクに使う）
+        
+    Returns:
+        dict: 予報・実績・前日比・Discord用メッセージをまとめた辞書（エラー時はNone）
+    """
+    import json
+    import requests
+    from forecast_index import ParsedForecast
+    from forecast_state import FORECAST_CHANGE_DETECTION, format_change_message, state_key
+    from upstream_fallback import describe_stale
+
+    if format_message is None:
+        format_message = send_to_discord
+    if detect_changes is None:
+        detect_changes = send_to_discord and FORECAST_CHANGE_DETECTION
 
-    # 実行時刻をチェック（テスト用時刻が設定されている場合はそれを使用）
-    current_time = datetime.now()
+    # 実行時刻をチェック（指定された時刻・テスト用時刻がある場合はそれを使用）
+    current_time = now if now is not None else datetime.now(JST)
     test_hour = TEST_HOUR
     
-    if test_hour is not None:
+    if now is not None:
+        print(f"🕐 実行時刻（指定）: {current_time.strftime('%Y-%m-%d %H:%M')}")
+        current_hour = current_time.hour
+    elif test_hour is not None:
         print(f"🧪 テストモード: 仮想時刻 {test_hour}:00")
         current_hour = test_hour
     else:
@@ -332,35 +1185,58 @@ def get_weather_forecast_with_comparison(send_to_discord=False):
     else:
         print("🌅 15時前の実行です。当日の気温との比較は表示しません。")
 
-    tomorrow_date = datetime.now() + timedelta(days=1)
+    tomorrow_date = current_time + timedelta(days=1)
     
+    # 保存済みのデータを使った取得先と、その取得時刻・経過時間
+    stale = {}
+
     # 明日の予報を取得
     try:
-        response = requests.get(FORECAST_API_URL, timeout=10)
-        response.raise_for_status()
-        forecast_data = response.json()
+        if forecast_data is None:
+            fetched = fetch_forecast_data_with_fallback(office_code)
+            forecast_data = fetched.value
+            if fetched.stale:
+                stale["予報"] = describe_stale(fetched)
+                print(f"⚠️  天気予報を取得できないため、前回取得した予報を使用します（{stale['予報']}）")
         
-        # 天気予報データから情報を取得
-        short_term_forecast = forecast_data[0]
+        # 天気予報データを解析（timeDefinesの解析は各timeSeriesにつき1回のみ）
+        parsed_forecast = ParsedForecast(forecast_data)
+        archive_forecast(parsed_forecast, office_code)
         
-        publishing_office = short_term_forecast["publishingOffice"]
-        report_datetime_str = short_term_forecast["reportDatetime"]
+        publishing_office = parsed_forecast.publishing_office
+        display_office_name = office_name(parsed_forecast, office_code)
+        report_datetime_str = parsed_forecast.report_datetime
         report_datetime = datetime.fromisoformat(report_datetime_str)
         formatted_report_time = f"{report_datetime.year}年{report_datetime.month}月{report_datetime.day}日 {report_datetime.hour}時発表"
         
         # 天気情報
-        short_term_weather_series = short_term_forecast["timeSeries"][0]
-        selected_area_name1, tomorrows_weather, weather_code = get_weather_data(short_term_weather_series, tomorrow_date)
-        print(f"✅ 天気データ取得成功: {selected_area_name1} - {tomorrows_weather}")
+        selected_area_name1, tomorrows_weather, weather_code = get_weather_data(
+            parsed_forecast.weather, tomorrow_date, area_code=TARGET_AREA_CODE)
+        if show_progress():
+            print(f"✅ 天気データ取得成功: {selected_area_name1} - {tomorrows_weather}")
 
         # 降水確率
-        rain_time_series = short_term_forecast["timeSeries"][1]
-        selected_area_name2, target_date_rain_values = get_rain_data(rain_time_series, TARGET_AREA_INDEX, tomorrow_date)
-        print(f"✅ 降水確率データ取得成功: {selected_area_name2} - {target_date_rain_values}")
+        selected_area_name2, target_date_rain_values = get_rain_data(
+            parsed_forecast.rain, TARGET_AREA_INDEX, tomorrow_date, area_code=TARGET_AREA_CODE)
+        if show_progress():
+            print(f"✅ 降水確率データ取得成功: {selected_area_name2} - {target_date_rain_values}")
 
-        # 明日の気温予報
-        temperature_time_series = short_term_forecast["timeSeries"][2]
-        tomorrow_min_forecast, tomorrow_max_forecast, temp_area_name = get_temperature_data(temperature_time_series, TARGET_AREA_INDEX, tomorrow_date)
+        # 明日の気温予報（地域コードだけを指定した場合は、その地域に対応する地点を使う）
+        station_code = TARGET_STATION_CODE
+        if not station_code and TARGET_AREA_CODE:
+            station_code = station_for_area(parsed_forecast, TARGET_AREA_CODE)
+        tomorrow_min_forecast, tomorrow_max_forecast, temp_area_name = get_temperature_data(
+            parsed_forecast.temperature, TARGET_AREA_INDEX, tomorrow_date, station_code=station_code)
+        
+        # 全地域・全timeSeriesを列指向のファイルに書き出す（FORECAST_EXPORT_DIRを設定した場合）
+        export_forecasts([(office_code, parsed_forecast)])
+        
+        # 実績を取得する観測地点（地域・観測地点コードを指定した場合・滋賀県以外の予報区では、
+        # 予報の地点の名前で観測データを探す）
+        if station_code or office_code != OFFICE_CODE:
+            station_name = temp_area_name
+        else:
+            station_name = OBSERVATION_STATION_NAME
         
         # 前日比計算（今日の実測データが取得できた場合のみ）
         max_diff_str = "データなし"
@@ -371,7 +1247,11 @@ def get_weather_forecast_with_comparison(send_to_discord=False):
         # 15時以降の場合、当日の気温を取得し、明日の予報と前日比を計算する
         if is_after_15:
             # 今日の実際の気温を取得
-            today_max_actual, today_min_actual = get_today_actual_temperature()
+            if today_actual is None:
+                *today_actual, fetched = _get_today_actual(station_name)
+                if fetched is not None and fetched.stale:
+                    stale["実績"] = describe_stale(fetched)
+            today_max_actual, today_min_actual = today_actual
             
             if today_max_actual is not None and today_min_actual is not None:
                 # 前日比を直接計算（明日の予報 - 今日の実績）
@@ -392,95 +1272,321 @@ def get_weather_forecast_with_comparison(send_to_discord=False):
         else:
             print("🌅 15時前の実行です。当日の気温との比較は表示しません。")
         
-        # 結果表示
-        print(f"\n" + "="*60)
-        print(f"🌡️  滋賀県の気温情報・天気予報 ({selected_area_name1})")
-        print(f"="*60)
-        print(f"📅 発表: {publishing_office}")
-        print(f"📅 発表時刻: {formatted_report_time}")
-        print("")
+        # 結果表示（--quietの場合は表示する文字列も作らない）
+        if show_progress():
+            print(f"\n" + "="*60)
+            print(f"🌡️  {display_office_name}の気温情報・天気予報 ({selected_area_name1})")
+            print(f"="*60)
+            print(f"📅 発表: {publishing_office}")
+            print(f"📅 発表時刻: {formatted_report_time}")
+            for source, description in stale.items():
+                print(f"⚠️  {source}は保存済みのデータです（{description}）")
+            print("")
         
-        print("📊 今日の実際の気温（彦根）")
-        if is_after_15:
-            if today_max_actual is not None and today_min_actual is not None:
-                print(f"   最高気温: {today_max_actual}℃")
-                print(f"   最低気温: {today_min_actual}℃")
+            print(f"📊 今日の実際の気温（{station_name}）")
+            if is_after_15:
+                if today_max_actual is not None and today_min_actual is not None:
+                    print(f"   最高気温: {today_max_actual}℃")
+                    print(f"   最低気温: {today_min_actual}℃")
+                else:
+                    print("   ⚠️  今日の実測データが取得できませんでした")
             else:
-                print("   ⚠️  今日の実測データが取得できませんでした")
-        else:
-            print("   ⚠️  15時前の実行のため、データなし")
-        print("")
+                print("   ⚠️  15時前の実行のため、データなし")
+            print("")
         
-        print("🔮 明日の天気予報")
-        print(f"   天気: {tomorrows_weather}")
-        rain_display = ", ".join([f"{value}%" for value in target_date_rain_values])
-        print(f"   降水確率: {rain_display}")
-        print(f"   予報最高気温: {tomorrow_max_forecast}℃ (前日比: {max_diff_str})")
-        print(f"   予報最低気温: {tomorrow_min_forecast}℃ (前日比: {min_diff_str})")
-        print("")
+            print("🔮 明日の天気予報")
+            print(f"   天気: {tomorrows_weather}")
+            rain_display = ", ".join([f"{value}%" for value in target_date_rain_values])
+            print(f"   降水確率: {rain_display}")
+            print(f"   予報最高気温: {tomorrow_max_forecast}℃ (前日比: {max_diff_str})")
+            print(f"   予報最低気温: {tomorrow_min_forecast}℃ (前日比: {min_diff_str})")
+            print("")
         
-        print(f"="*60)
+            print(f"="*60)
         
-        # Discord通知（オプション）
-        if send_to_discord:
-            print("\n📱 Discord通知を送信しています...")
-            discord_message = format_discord_message(
+        # 前回の通知から予報が変わったかどうかを判定
+        state_fields = _forecast_state_fields(
+            weather_code, target_date_rain_values, tomorrow_max_forecast, tomorrow_min_forecast,
+            today_max_actual is not None and today_min_actual is not None)
+        key = state_key(office_code, selected_area_name1, tomorrow_date) if detect_changes else None
+        changed, previous_fields, _ = _check_forecast_state(key, state_fields, detect_changes)
+        if not changed:
+            print("♻️  前回の通知から予報に変化がないため、メッセージの作成と通知を省略します。")
+        
+        result = {
+            "office_code": office_code,
+            "office_name": display_office_name,
+            "report_datetime": report_datetime_str,
+            "area_name": selected_area_name1,
+            "weather": tomorrows_weather,
+            "weather_code": weather_code,
+            "rain_values": target_date_rain_values,
+            "max_forecast": tomorrow_max_forecast,
+            "min_forecast": tomorrow_min_forecast,
+            "today_max_actual": today_max_actual,
+            "today_min_actual": today_min_actual,
+            "max_diff": max_diff_str,
+            "min_diff": min_diff_str,
+            "discord_message": None,
+            "changed": changed,
+            "change_message": "",
+            "state_key": key,
+            "state_fields": state_fields,
+            "stale": stale,
+        }
+        
+        # Discord通知（オプション、予報が変わっていなければ省略）
+        if format_message and changed:
+            result["discord_message"] = format_discord_message(
                 selected_area_name1, publishing_office, formatted_report_time,
                 is_after_15, today_max_actual, today_min_actual,
                 tomorrows_weather, target_date_rain_values,
                 tomorrow_max_forecast, tomorrow_min_forecast,
-                max_diff_str, min_diff_str, weather_code
+                max_diff_str, min_diff_str, weather_code, tomorrow_date,
+                office_code=office_code
             )
-            
-            success = send_discord_notification(discord_message)
+            if previous_fields is not None:
+                result["change_message"] = format_change_message(previous_fields, state_fields)
+                result["discord_message"] = _append_change_message(
+                    result["discord_message"], result["change_message"])
+            if stale:
+                result["discord_message"] = _append_change_message(
+                    result["discord_message"], format_stale_message(stale))
+        if send_to_discord and changed:
+            print("\n📱 Discord通知を送信しています...")
+            success = send_discord_notification(result["discord_message"], display_office_name)
             if success:
+                record_notified_forecast(result)
                 print("✅ Discord通知が正常に送信されました")
             else:
-                print("❌ Discord通知の送信に失敗しました")
+                print("❌ Discord通知の送信に失敗しました", file=sys.stderr)
+        
+        return result
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ 通信エラー: インターネット接続またはAPIの状態を確認してください。")
-        print(f"詳細: {e}")
+        print(f"❌ 通信エラー: インターネット接続またはAPIの状態を確認してください。", file=sys.stderr)
+        print(f"詳細: {e}", file=sys.stderr)
     except json.JSONDecodeError as e:
-        print(f"❌ データ形式エラー: APIからの応答が不正です。")
-        print(f"詳細: {e}")
+        print(f"❌ データ形式エラー: APIからの応答が不正です。", file=sys.stderr)
+        print(f"詳細: {e}", file=sys.stderr)
     except (KeyError, IndexError) as e:
-        print(f"❌ データ構造エラー: APIの仕様が変更された可能性があります。")
-        print(f"詳細: {e}")
+        print(f"❌ データ構造エラー: APIの仕様が変更された可能性があります。", file=sys.stderr)
+        print(f"詳細: {e}", file=sys.stderr)
     except ValueError as e:
-        print(f"❌ データ処理エラー: {e}")
+        print(f"❌ データ処理エラー: {e}", file=sys.stderr)
     except Exception as e:
-        print(f"❌ 予期せぬエラー: {type(e).__name__}: {e}")
-        print(f"問題が続く場合は、プログラムの更新が必要かもしれません。")
+        print(f"❌ 予期せぬエラー: {type(e).__name__}: {e}", file=sys.stderr)
+        print(f"問題が続く場合は、プログラムの更新が必要かもしれません。", file=sys.stderr)
+
+# 以前の形式（--discord, --batch など）のオプションとサブコマンドの対応
+_LEGACY_COMMANDS = {
+    "--discord": "discord",
+    "--batch": "batch",
+    "--verify": "verify",
+    "--replay": "replay",
+    "--daemon": "daemon",
+}
+
+def build_parser():
+    """
+    コマンドライン引数の解析器を作成する。
+    
+    Returns:
+        argparse.ArgumentParser: サブコマンド（fetch, discord, batch, areas, weekly, observations, verify, replay, ingest, daemon, serve, bench, stress）を持つ解析器
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="weather_forecast.py",
+        description="滋賀県の気温情報・天気予報を表示し、Discordに通知します。",
+        epilog="Discord通知を使用する場合は、.envファイルにDISCORD_WEBHOOK_URL=あなたのWebhookURLを設定してください。",
+    )
+    # 計測・表示のオプション（コマンドの前後どちらにも指定できる）
+    common = argparse.ArgumentParser(add_help=False)
+    for options, defaults in ((parser, {}), (common, {"default": argparse.SUPPRESS})):
+        options.add_argument("--quiet", action="store_true", help="途中経過などを表示しない", **defaults)
+        options.add_argument("--metrics", metavar="PATH",
+                             help="処理時間・件数の計測結果の出力先（.promならPrometheus形式、それ以外はJSON Lines）",
+                             **defaults)
+        options.add_argument("--metrics-format", choices=("auto", "jsonl", "prometheus"),
+                             help="計測結果の出力形式", **defaults)
+
+    subparsers = parser.add_subparsers(dest="command", metavar="コマンド")
+
+    def add_parser(name, **kwargs):
+        return subparsers.add_parser(name, parents=[common], **kwargs)
+
+    add_parser("fetch", help="コンソールにのみ表示（省略時の動作）")
+    add_parser("discord", help="Discord通知も送信")
+
+    batch_parser = add_parser("batch", help="複数予報区を一括取得")
+    batch_parser.add_argument("office_codes", nargs="*", help="府県予報区コード（省略時は全国）")
+    batch_parser.add_argument("--discord", action="store_true", help="予報区ごとの天気予報をDiscordに通知")
+
+    areas_parser = add_parser("areas", help="1回の取得で複数地域の予報を表示")
+    areas_parser.add_argument("areas", nargs="*", metavar="地域コード[:観測地点コード]",
+                              help="対象の地域（省略時は全地域、例: 250020:60131）")
+    areas_parser.add_argument("--office", default=OFFICE_CODE, help="府県予報区コード")
+
+    weekly_parser = add_parser("weekly", help="週間予報（7日分・平年差）を全地域まとめて表示")
+    weekly_parser.add_argument("--office", default=OFFICE_CODE, help="府県予報区コード")
+
+    observations_parser = add_parser("observations", help="今日の全地点の観測値を取得して保存（1日1回）")
+    observations_parser.add_argument("stations", nargs="*", metavar="地点名", help="表示する地点（省略時は件数のみ）")
+    observations_parser.add_argument("--force", action="store_true", help="取得済みでも取得し直す")
+
+    verify_parser = add_parser("verify", help="予報気温の検証結果を表示")
+    verify_parser.add_argument("station_code", nargs="?", help="観測地点コード")
+
+    replay_parser = add_parser("replay", help="記録済みデータでリプレイ（通信なし）")
+    replay_parser.add_argument("directory", help="天気予報json・観測データHTMLのディレクトリ")
+    replay_parser.add_argument("--time", help="発表日のこの時刻(HH:MM)を仮想時刻とする")
+    replay_parser.add_argument("--now", type=datetime.fromisoformat, help="すべてに共通の仮想時刻(ISO形式)")
+    replay_parser.add_argument("--workers", type=int, help="プロセス数（省略時はCPUコア数）")
+    replay_parser.add_argument("--archive", action="store_true", help="アーカイブに保存する")
+
+    ingest_parser = add_parser("ingest", help="保存済みの天気予報jsonを列指向の配列に一括取り込み")
+    ingest_parser.add_argument("directory", help="天気予報jsonのディレクトリ")
+    ingest_parser.add_argument("--output", help="列を書き出すディレクトリ（省略時は集計のみ表示）")
+    ingest_parser.add_argument("--workers", type=int, help="プロセス数（省略時はCPUコア数）")
+    ingest_parser.add_argument("--batch-size", type=int, help="1回にプロセスへ渡すファイル数")
+    ingest_parser.add_argument("--office", default=OFFICE_CODE,
+                               help="パスに府県予報区コードを含まない場合のコード")
+
+    daemon_parser = add_parser("daemon", help="発表時刻に合わせて常駐実行")
+    daemon_parser.add_argument("--discord", action="store_true", help="Discordに通知する")
+    daemon_parser.add_argument("--jsonl", help="結果を追記するJSON Linesファイル")
+    daemon_parser.add_argument("--office", help="府県予報区コード")
+
+    serve_parser = add_parser("serve", help="天気予報のjsonを返すHTTP APIサーバーを起動")
+    serve_parser.add_argument("office_codes", nargs="*", help="起動時に取得しておく府県予報区コード")
+    serve_parser.add_argument("--host", help="待ち受けるアドレス（省略時は127.0.0.1）")
+    serve_parser.add_argument("--port", type=int, help="待ち受けるポート（省略時は8080）")
+
+    # bench・stressの引数はbenchmark.py・stress.pyでそのまま解析する（mainを参照）
+    subparsers.add_parser("bench", help="ベンチマークを実行（引数はbenchmark.pyと同じ）", add_help=False)
+    subparsers.add_parser("stress", help="抽出処理の性質テストと負荷試験を実行（引数はstress.pyと同じ）",
+                          add_help=False)
+
+    return parser
 
 def show_usage():
     """
     使用方法を表示する関数
     """
-    print("🔧 使用方法:")
-    print("1. コンソールにのみ表示: python3 weather_forecast.py")
-    print("2. Discord通知も送信: python3 weather_forecast.py --discord")
-    print("3. Discord通知テスト: python3 test_discord.py")
-    print("")
-    print("📋 Discord通知を使用する場合の設定:")
-    print("1. DiscordでWebhook URLを取得")
-    print("2. .envファイルにDISCORD_WEBHOOK_URL=あなたのWebhookURLを設定")
-    print("3. --discordオプションを付けて実行")
+    build_parser().print_help()
 
-if __name__ == "__main__":
-    import sys
+def main(argv=None):
+    """
+    コマンドラインから実行する。
     
-    # コマンドライン引数をチェック
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--discord":
+    Args:
+        argv (list): コマンドライン引数（省略時はsys.argv[1:]）
+        
+    Returns:
+        int: 終了コード（処理に失敗した場合は1）
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    argv = list(argv)
+    if argv and argv[0] in _LEGACY_COMMANDS:
+        argv[0] = _LEGACY_COMMANDS[argv[0]]
+    if argv and argv[0] == "bench":
+        # 処理速度・メモリ使用量・起動時間のベンチマーク
+        import benchmark
+        return benchmark.main(argv[1:])
+    if argv and argv[0] == "stress":
+        # 合成データによる抽出処理の性質テストと負荷試験
+        import stress
+        return stress.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+    command = args.command or "fetch"
+
+    # 使用方法の表示以外では、.envファイルの設定を読み込んでから処理を始める
+    load_environment()
+
+    # 計測結果の出力先（--metrics, METRICS_OUTPUT）と、表示の抑制（--quiet）
+    import instrumentation
+    instrumentation.configure(args.metrics, args.metrics_format)
+    if args.quiet:
+        instrumentation.set_quiet()
+
+    # 処理に失敗した場合（エラーは標準エラー出力に表示され、--quietでも表示される）は1を返す
+    exit_code = 0
+    try:
+        if command == "fetch":
+            # Discord通知なし（デフォルト）
+            if get_weather_forecast_with_comparison(send_to_discord=False) is None:
+                exit_code = 1
+        elif command == "discord":
             # Discord通知あり
-            get_weather_forecast_with_comparison(send_to_discord=True)
-        elif sys.argv[1] == "--help" or sys.argv[1] == "-h":
-            # 使用方法を表示
-            show_usage()
-        else:
-            print("❌ 無効な引数です。")
-            show_usage()
-    else:
-        # Discord通知なし（デフォルト）
-        get_weather_forecast_with_comparison(send_to_discord=False) 
\ No newline at end of file
+            if get_weather_forecast_with_comparison(send_to_discord=True) is None:
+                exit_code = 1
+        elif command == "batch":
+            # 複数予報区を一括取得（指定なしの場合は全国）
+            batch_results = get_weather_forecasts_batch(args.office_codes or ALL_OFFICE_CODES)
+            show_batch_results(batch_results)
+            if any("error" in result for result in batch_results):
+                exit_code = 1
+            if args.discord and not send_batch_discord_notifications(batch_results):
+                exit_code = 1
+        elif command == "areas":
+            # 1回の取得で複数地域の予報を表示（指定なしの場合は全地域）
+            show_area_forecasts(parse_area_selection(args.areas) or None, office_code=args.office)
+        elif command == "weekly":
+            # 週間予報の7日分を全地域まとめて表示（平年値との差を含む）
+            show_weekly_forecast(args.office)
+        elif command == "observations":
+            # 今日の全地点の観測値を取得してアーカイブに保存（取得済みの日は保存済みの値を表示）
+            observations = collect_today_observations(force=args.force)
+            for station_name in args.stations:
+                observation = observations.get(station_name)
+                if observation is None:
+                    print(f"⚠️  観測値がありません: {station_name}")
+                    continue
+                print(f"  {station_name}: 最高{observation.max_temp}℃（{observation.max_time}）"
+                      f" 最低{observation.min_temp}℃（{observation.min_time}）")
+        elif command == "verify":
+            # アーカイブの予報と実測から検証の統計量を更新して表示
+            from forecast_verification import run_verification
+            run_verification(args.station_code)
+        elif command == "replay":
+            # 記録済みの天気予報json・観測データHTMLで処理を再現（通信なし）
+            import time
+            from replay import parse_time_of_day, run_replay, show_replay_results
+
+            started = time.perf_counter()
+            replay_results = run_replay(args.directory, fixed_now=args.now,
+                                        time_of_day=parse_time_of_day(args.time) if args.time else None,
+                                        workers=args.workers, archive=args.archive)
+            show_replay_results(replay_results, time.perf_counter() - started)
+            if any(replayed["result"] is None for replayed in replay_results):
+                exit_code = 1
+        elif command == "ingest":
+            # 保存済みの天気予報jsonをメモリマップして並列に解析し、列指向の配列に取り込む
+            import time
+            from forecast_ingest import ingest_directory, show_ingest_summary
+
+            started = time.perf_counter()
+            ingested = ingest_directory(args.directory, output_dir=args.output, workers=args.workers,
+                                        batch_size=args.batch_size, office_code=args.office)
+            show_ingest_summary(ingested, time.perf_counter() - started)
+            if ingested.errors:
+                exit_code = 1
+        elif command == "daemon":
+            # 5時・11時・17時の発表直後と15時の実績比較を常駐して実行
+            from scheduler import run_daemon
+            run_daemon(send_to_discord=args.discord, jsonl_path=args.jsonl, office_code=args.office)
+        elif command == "serve":
+            # 抽出済みの予報をメモリに保持してjsonで返す（取得は発表時刻ごとに1回）
+            from forecast_server import run_server
+            run_server(args.host, args.port, args.office_codes)
+    finally:
+        instrumentation.flush_metrics()
+        if args.quiet:
+            instrumentation.set_quiet(False)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())